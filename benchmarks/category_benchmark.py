@@ -0,0 +1,158 @@
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from benchmarks.data import write_records
+from src.features.features import (
+    add_bmi,
+    build_feature_metadata,
+    categorical_features,
+    get_model_features,
+    numeric_features,
+    raw_feature_dtypes,
+    target,
+)
+from src.train.train import build_preprocessor
+
+
+def parse_args(argv=None):
+    ap = ArgumentParser("category_benchmark")
+
+    ap.add_argument("--rows", type=int, default=5_000_000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output_file")
+
+    args, _ = ap.parse_known_args(argv)
+
+    return args
+
+
+def build_object_model(feature_metadata):
+    # Model pipeline as previously implemented, with object columns
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("numeric", StandardScaler(), numeric_features),
+            ("categorical", OneHotEncoder(), categorical_features),
+        ],
+        remainder="drop",
+    )
+    classifier = LogisticRegression(random_state=0, solver="liblinear")
+
+    return Pipeline(steps=[("preprocessor", preprocessor), ("classifier", classifier)])
+
+
+def build_category_model(feature_metadata):
+    # Model pipeline with category columns encoded from their codes
+    preprocessor = build_preprocessor(feature_metadata)
+    classifier = LogisticRegression(random_state=0, solver="liblinear")
+
+    return Pipeline(steps=[("preprocessor", preprocessor), ("classifier", classifier)])
+
+
+def read_features(input_file_path, categorical_dtype, feature_metadata):
+    # Read and featurize the input file with the given categorical data type
+    dtype = {
+        **raw_feature_dtypes,
+        **{feature: categorical_dtype for feature in categorical_features},
+    }
+    df = add_bmi(pd.read_csv(input_file_path, dtype=dtype))
+
+    if categorical_dtype == "category":
+        return df, get_model_features(
+            df, feature_metadata["feature_columns"], feature_metadata["categories"]
+        )
+
+    return df, df[feature_metadata["feature_columns"]]
+
+
+def measure(func):
+    # Time the function without tracing overhead
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    # Trace allocations in a separate run to get the peak allocated memory
+    tracemalloc.start()
+    func()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, {"seconds": round(seconds, 3), "peak_bytes": peak_bytes}
+
+
+def benchmark(input_file_path, categorical_dtype, build_model, feature_metadata):
+    # Read the training data and measure the memory used by the model features
+    df, X = read_features(input_file_path, categorical_dtype, feature_metadata)
+    feature_bytes = int(X.memory_usage(deep=True).sum())
+
+    # Measure training and scoring of the model
+    model, train = measure(lambda: build_model(feature_metadata).fit(X, df[target]))
+    probability, score = measure(
+        lambda: model.predict_proba(
+            read_features(input_file_path, categorical_dtype, feature_metadata)[1]
+        )
+    )
+    score["rows_per_second"] = round(len(X) / score["seconds"])
+
+    return probability, {"feature_bytes": feature_bytes, "train": train, "score": score}
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Write synthetic input file
+        input_file_path = os.path.join(temp_dir, "input.csv")
+        write_records(input_file_path, args.rows, args.seed)
+        feature_metadata = build_feature_metadata(
+            pd.read_csv(input_file_path, usecols=categorical_features)
+        )
+
+        # Run both implementations against the same file
+        object_probability, object_results = benchmark(
+            input_file_path, object, build_object_model, feature_metadata
+        )
+        category_probability, category_results = benchmark(
+            input_file_path, "category", build_category_model, feature_metadata
+        )
+
+    # Both implementations should produce the same predictions
+    assert np.allclose(object_probability, category_probability, rtol=0, atol=1e-9)
+
+    results = {
+        "rows": args.rows,
+        "object": object_results,
+        "category": category_results,
+        "feature_bytes_reduction": round(
+            1 - category_results["feature_bytes"] / object_results["feature_bytes"], 3
+        ),
+        "train_speedup": round(
+            object_results["train"]["seconds"] / category_results["train"]["seconds"],
+            2,
+        ),
+        "score_speedup": round(
+            object_results["score"]["seconds"] / category_results["score"]["seconds"],
+            2,
+        ),
+    }
+
+    print(json.dumps(results, indent=2))
+
+    # Write results to file
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
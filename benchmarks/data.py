@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+
+def generate_records(rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # Generate records with the same schema as the cardiovascular disease dataset
+    df = pd.DataFrame(
+        {
+            "age": rng.uniform(30, 65, rows),
+            "gender": rng.choice(["female", "male"], rows),
+            "height": rng.normal(165, 8, rows).round().astype(np.int64),
+            "weight": rng.normal(74, 14, rows).round(1),
+            "systolic": rng.normal(127, 17, rows).round(-1).astype(np.int64),
+            "diastolic": rng.normal(81, 10, rows).round(-1).astype(np.int64),
+            "cholesterol": rng.choice(
+                ["normal", "above-normal", "well-above-normal"],
+                rows,
+                p=[0.75, 0.14, 0.11],
+            ),
+            "glucose": rng.choice(
+                ["normal", "above-normal", "well-above-normal"],
+                rows,
+                p=[0.85, 0.07, 0.08],
+            ),
+            "smoker": rng.choice(["not-smoker", "smoker"], rows, p=[0.91, 0.09]),
+            "alcoholic": rng.choice(
+                ["not-alcoholic", "alcoholic"], rows, p=[0.95, 0.05]
+            ),
+            "active": rng.choice(["active", "not-active"], rows, p=[0.8, 0.2]),
+        }
+    )
+
+    # Derive the target from the main risk factors so models have signal to learn
+    logit = np.sum(
+        [
+            0.05 * (df.age - 50),
+            0.04 * (df.systolic - 127),
+            0.8 * (df.cholesterol == "well-above-normal"),
+            rng.normal(0, 1, rows),
+        ],
+        axis=0,
+    )
+    df["cardiovascular_disease"] = (logit > 0).astype(np.int64)
+
+    return df
+
+
+def write_records(file_path, rows, seed=0, chunk_rows=1_000_000):
+    # Write synthetic records to a csv file in chunks to bound memory usage
+    for idx, start in enumerate(range(0, rows, chunk_rows)):
+        generate_records(min(chunk_rows, rows - start), seed + idx).to_csv(
+            file_path, index=False, header=idx == 0, mode="w" if idx == 0 else "a"
+        )
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.data import write_records
+from src.score.score import featurize, read_data
+
+
+def parse_args(argv=None):
+    ap = ArgumentParser("featurize_benchmark")
+
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output_file")
+
+    args, _ = ap.parse_known_args(argv)
+
+    return args
+
+
+def legacy_featurize(input_file_path):
+    # Feature preparation as previously implemented in score_data
+    df = pd.read_csv(input_file_path)
+    df = df.astype(
+        {
+            "age": np.float64,
+            "height": np.float64,
+            "weight": np.float64,
+            "systolic": np.float64,
+            "diastolic": np.float64,
+        }
+    )
+
+    categorical_features = [
+        "gender",
+        "cholesterol",
+        "glucose",
+        "smoker",
+        "alcoholic",
+        "active",
+    ]
+    numeric_features = ["age", "systolic", "diastolic", "bmi"]
+    raw_numeric_features = ["age", "systolic", "diastolic", "height", "weight"]
+
+    df = df[categorical_features + raw_numeric_features]
+    df["bmi"] = df.weight / (df.height / 100) ** 2
+    df = df.drop(labels=["height", "weight"], axis=1)
+    df[categorical_features] = df[categorical_features].astype(object)
+    df[numeric_features] = df[numeric_features].astype(np.float64)
+
+    return df
+
+
+def single_pass_featurize(input_file_path):
+    # Feature preparation with the single pass featurizer
+    return featurize(read_data(input_file_path))
+
+
+def assert_same_features(legacy_df, single_pass_df):
+    # The single pass featurizer carries categorical features as pandas categories,
+    # the model sees the same values as the object columns of the legacy featurizer
+    categorical_features = single_pass_df.select_dtypes("category").columns
+    pd.testing.assert_frame_equal(
+        legacy_df,
+        single_pass_df.astype({feature: object for feature in categorical_features}),
+    )
+
+
+def measure(func, input_file_path):
+    # Time the function without tracing overhead
+    start = time.perf_counter()
+    func(input_file_path)
+    seconds = time.perf_counter() - start
+
+    # Trace allocations in a separate run to get the peak allocated memory
+    tracemalloc.start()
+    func(input_file_path)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"seconds": round(seconds, 3), "peak_bytes": peak_bytes}
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Both implementations should produce the same model input
+        input_file_path = os.path.join(temp_dir, "sample.csv")
+        write_records(input_file_path, 10_000, args.seed)
+        assert_same_features(
+            legacy_featurize(input_file_path), single_pass_featurize(input_file_path)
+        )
+
+        # Write synthetic input file
+        input_file_path = os.path.join(temp_dir, "input.csv")
+        write_records(input_file_path, args.rows, args.seed)
+
+        # Run both implementations against the same file
+        legacy = measure(legacy_featurize, input_file_path)
+        single_pass = measure(single_pass_featurize, input_file_path)
+
+    results = {
+        "rows": args.rows,
+        "legacy": legacy,
+        "single_pass": single_pass,
+        "speedup": round(legacy["seconds"] / single_pass["seconds"], 2),
+        "peak_bytes_reduction": round(
+            1 - single_pass["peak_bytes"] / legacy["peak_bytes"], 3
+        ),
+    }
+
+    print(json.dumps(results, indent=2))
+
+    # Write results to file
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+from unittest.mock import MagicMock
+
+from benchmarks.data import generate_records
+from src.features.features import build_feature_metadata, get_model_features, target
+from src.train import train
+
+
+def parse_args(argv=None):
+    ap = ArgumentParser("incremental_benchmark")
+
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--rows_per_day", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output_file")
+
+    args, _ = ap.parse_known_args(argv)
+
+    return args
+
+
+def full_retrain(file_paths):
+    # Train on the full history from scratch, without cross validation
+    df = train.preprocess_data(
+        train.load_data_chunks(train.block_rows, file_paths), deduplicated=True
+    )
+
+    return train.train_model(df, build_feature_metadata(df), skip_cv=True)
+
+
+def incremental_retrain(file_paths, model, feature_metadata):
+    # Update the previous model with the new partition only
+    df = train.preprocess_data(
+        train.load_data_chunks(train.block_rows, file_paths), deduplicated=True
+    )
+
+    return train.train_model_incremental(df, feature_metadata, model)
+
+
+def measure(func, *args):
+    # Time the function and return its result
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, round(time.perf_counter() - start, 3)
+
+
+def get_accuracy(model, df):
+    # Get the accuracy on held out records
+    return round(model.score(get_model_features(df), df[target]), 4)
+
+
+def main():
+    args = parse_args()
+
+    # Training functions log metrics to the run context
+    train.run = MagicMock()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Write one synthetic dataset partition per day
+        file_paths = []
+
+        for day in range(args.days):
+            file_path = os.path.join(temp_dir, f"day_{day}.parquet")
+            generate_records(args.rows_per_day, args.seed + day).to_parquet(file_path)
+            file_paths.append(file_path)
+
+        # Train the incremental model on every day except the last one
+        history = train.preprocess_data(
+            train.load_data_chunks(train.block_rows, file_paths[:-1]), deduplicated=True
+        )
+        feature_metadata = build_feature_metadata(history)
+        model = train.train_model_incremental(history, feature_metadata)
+        del history
+
+        # Compare a full retrain with an incremental update for the last day
+        full_model, full_seconds = measure(full_retrain, file_paths)
+        incremental_model, incremental_seconds = measure(
+            incremental_retrain, file_paths[-1:], model, feature_metadata
+        )
+
+    # Evaluate both models on held out records
+    holdout = train.preprocess_data(
+        generate_records(args.rows_per_day, args.seed + args.days)
+    )
+
+    results = {
+        "days": args.days,
+        "rows_per_day": args.rows_per_day,
+        "full": {
+            "seconds": full_seconds,
+            "accuracy": get_accuracy(full_model, holdout),
+        },
+        "incremental": {
+            "seconds": incremental_seconds,
+            "accuracy": get_accuracy(incremental_model, holdout),
+        },
+        "speedup": round(full_seconds / incremental_seconds, 2),
+    }
+
+    print(json.dumps(results, indent=2))
+
+    # Write results to file
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from unittest.mock import MagicMock, patch
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+
+from benchmarks.data import generate_records, write_records
+from src.features.features import build_feature_metadata, write_feature_metadata
+from src.score import score
+from src.train import train
+from src.utils.compiled_model import compile_model, save_compiled_model
+from src.utils.formats import file_extensions
+from src.utils import telemetry
+from src.utils.model_cache import LocalModelRegistry, ModelCache
+
+build_id = "benchmark"
+
+
+def parse_args(argv=None):
+    ap = ArgumentParser("score_benchmark")
+
+    ap.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000]
+    )
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--train_rows", type=int, default=100_000)
+    ap.add_argument("--output_format", choices=list(file_extensions), default="csv")
+    ap.add_argument("--predictor", choices=["sklearn", "compiled"], default="sklearn")
+    ap.add_argument("--files", type=int, default=1)
+    ap.add_argument("--prefetch", type=int, default=0)
+    ap.add_argument("--staged", action="store_true")
+    ap.add_argument("--storage_concurrency", type=int, default=16)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output_file")
+
+    args, _ = ap.parse_known_args(argv)
+
+    return args
+
+
+def register_model(registry, train_rows, seed):
+    # Train a model on synthetic records and register the model folder as written by
+    # the training step
+    df = train.preprocess_data(generate_records(train_rows, seed))
+    feature_metadata = build_feature_metadata(df)
+    model = train.train_model(df, feature_metadata, skip_cv=True)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_path = os.path.join(temp_dir, train.model_folder_name)
+        os.makedirs(model_path)
+        joblib.dump(model, os.path.join(model_path, train.model_file_name))
+        write_feature_metadata(
+            feature_metadata,
+            os.path.join(model_path, train.feature_metadata_file_name),
+        )
+        save_compiled_model(
+            compile_model(model),
+            os.path.join(model_path, train.compiled_model_folder_name),
+        )
+
+        registry.register_model("benchmark_model", model_path, {"build_id": build_id})
+
+
+def measure(func, repeats, rows):
+    # Run the function several times and keep the fastest and median time, the
+    # fastest run is the least affected by other load on the machine
+    seconds = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+
+    return result, {
+        "seconds": round(min(seconds), 4),
+        "median_seconds": round(statistics.median(seconds), 4),
+        "rows_per_second": round(rows / min(seconds)),
+    }
+
+
+def predict(X):
+    # Get model prediction in the fixed size blocks used by score_frame
+    return np.concatenate(
+        [
+            score.model.predict_proba(X.iloc[idx:idx + score.predict_rows])
+            for idx in range(0, len(X), score.predict_rows)
+        ]
+    )
+
+
+def benchmark_stages(input_file_path, output_file_path, rows, args):
+    # Time each stage of scoring a file separately
+    df, read = measure(lambda: score.read_data(input_file_path), args.repeats, rows)
+    X, featurize = measure(lambda: score.featurize(df), args.repeats, rows)
+    _, predict_stage = measure(lambda: predict(X), args.repeats, rows)
+    scored_df, score_data = measure(
+        lambda: score.score_data(input_file_path), args.repeats, rows
+    )
+    _, write = measure(
+        lambda: score.write_data(scored_df, output_file_path, args.output_format),
+        args.repeats,
+        rows,
+    )
+
+    return {
+        "read": read,
+        "featurize": featurize,
+        "predict": predict_stage,
+        "write": write,
+        "score_data": score_data,
+    }
+
+
+def run_main(input_datapath, output_datapath, model_cache, args):
+    # Run the scoring step against local directories, with the service context and
+    # the model registry stubbed, rescoring the files scored by earlier repeats
+    storage_argv = []
+
+    # Stage the input files from a local directory standing in for blob storage
+    if args.staged:
+        storage_argv = [
+            "--input_storage_url",
+            input_datapath,
+            "--storage_concurrency",
+            str(args.storage_concurrency),
+        ]
+        input_datapath = f"{input_datapath}_staged"
+
+    argv = [
+        "score.py",
+        "--build_id",
+        build_id,
+        "--input_datapath",
+        input_datapath,
+        "--output_datapath",
+        output_datapath,
+        "--output_format",
+        args.output_format,
+        "--predictor",
+        args.predictor,
+        "--model_cache_dir",
+        model_cache.cache_dir,
+        "--prefetch",
+        str(args.prefetch),
+        "--metrics_file",
+        os.path.join(output_datapath, "score_metrics.json"),
+        "--rescore",
+        *storage_argv,
+    ]
+
+    # Load the model in every run as a new scoring step would
+    score.loaded_models.clear()
+    run = MagicMock(**{"get_context.return_value.id": "benchmark_run"})
+
+    with patch.object(sys, "argv", argv), patch.object(score, "Run", run), patch.object(
+        telemetry, "AzureLogHandler", logging.NullHandler
+    ), patch.object(
+        score, "AzureModelRegistry", lambda workspace: model_cache.registry
+    ):
+        score.main()
+
+
+def benchmark(rows, model_cache, temp_dir, args):
+    # Write the synthetic input files in their own input directory, the rows are
+    # split between the files scored by the scoring step
+    input_datapath = os.path.join(temp_dir, f"input_{rows}")
+    output_datapath = os.path.join(temp_dir, f"output_{rows}")
+    os.makedirs(input_datapath)
+    input_file_paths = [
+        os.path.join(input_datapath, f"input_{i}.csv") for i in range(args.files)
+    ]
+
+    for i, input_file_path in enumerate(input_file_paths):
+        write_records(input_file_path, rows // args.files, args.seed + i)
+
+    # Time the stages with the registered model, then the scoring step end to end
+    score.set_model(build_id, model_cache, args.predictor)
+    extension = file_extensions[args.output_format][0]
+    stages = benchmark_stages(
+        input_file_paths[0],
+        os.path.join(temp_dir, f"stages{extension}"),
+        rows // args.files,
+        args,
+    )
+    _, main = measure(
+        lambda: run_main(input_datapath, output_datapath, model_cache, args),
+        args.repeats,
+        rows,
+    )
+
+    for input_file_path in input_file_paths:
+        os.remove(input_file_path)
+
+    return {"rows": rows, "stages": stages, "main": main}
+
+
+def main():
+    args = parse_args()
+
+    # Training and scoring functions log to the run context and logger
+    train.run = MagicMock()
+    score.set_worker_logger()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        registry = LocalModelRegistry(os.path.join(temp_dir, "registry"))
+        register_model(registry, args.train_rows, args.seed)
+        model_cache = ModelCache(
+            os.path.join(temp_dir, "model_cache"), 1024 * 1024 * 1024, registry
+        )
+
+        results = {
+            "environment": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "sklearn": sklearn.__version__,
+            },
+            "output_format": args.output_format,
+            "predictor": args.predictor,
+            "files": args.files,
+            "prefetch": args.prefetch,
+            "staged": args.staged,
+            "repeats": args.repeats,
+            "results": [
+                benchmark(rows, model_cache, temp_dir, args) for rows in args.rows
+            ],
+        }
+
+    print(json.dumps(results, indent=2))
+
+    # Write results to file
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import json
+import os
+import platform
+import time
+from argparse import ArgumentParser
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from benchmarks.data import generate_records
+from src.features.features import build_feature_metadata
+from src.train import train
+from src.utils.instrumentation import get_peak_rss, reset_peak_rss
+
+
+def parse_args(argv=None):
+    ap = ArgumentParser("train_benchmark")
+
+    ap.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    ap.add_argument("--cores", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--cores_rows", type=int, default=1_000_000)
+    ap.add_argument("--cv_folds", type=int, default=10)
+    ap.add_argument("--cv_backend", choices=list(train.cv_backends), default="process")
+    ap.add_argument("--solver", choices=["liblinear", "lbfgs"], default="liblinear")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output_file")
+
+    args, _ = ap.parse_known_args(argv)
+
+    return args
+
+
+def get_run(df, metrics):
+    # Stub the run context, serving the dataset and recording the logged metrics
+    run = MagicMock()
+    run.parent = run
+    run.input_datasets = {"InputDataset": MagicMock()}
+    run.input_datasets["InputDataset"].to_pandas_dataframe.return_value = df
+    run.log.side_effect = lambda name, value, *args, **kwargs: metrics.update(
+        {name: value}
+    )
+
+    return run
+
+
+def measure(func):
+    # Time the function and get the peak memory of the process while it ran
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = func()
+
+    return result, {
+        "seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_bytes": get_peak_rss(),
+    }
+
+
+def benchmark(rows, cores, args):
+    # Serve a synthetic dataset from the stubbed run context
+    metrics = {}
+    train.run = get_run(generate_records(rows, args.seed), metrics)
+
+    # Run the training stages one after another, as in the training step
+    df, load = measure(train.load_data)
+    df, preprocess = measure(lambda: train.preprocess_data(df))
+    _, train_stage = measure(
+        lambda: train.train_model(
+            df,
+            build_feature_metadata(df),
+            args.cv_folds,
+            cores,
+            args.cv_backend,
+            solver=args.solver,
+        )
+    )
+
+    # Split training into cross validation and the final fit with the logged timings
+    train_stage["cv_seconds"] = metrics["cv_time"]
+    train_stage["final_fit_seconds"] = metrics["final_fit_time"]
+
+    return {
+        "rows": rows,
+        "cores": cores,
+        "load_data": load,
+        "preprocess_data": preprocess,
+        "train_model": train_stage,
+        "total_seconds": round(
+            load["seconds"] + preprocess["seconds"] + train_stage["seconds"], 3
+        ),
+    }
+
+
+def fit_scaling(x, seconds):
+    # Fit seconds = a * x ^ b on a log scale, an exponent of 1 scales linearly
+    if len(x) < 2:
+        return None
+
+    exponent, intercept = np.polyfit(np.log(x), np.log(seconds), 1)
+
+    return {"exponent": round(exponent, 3), "coefficient": float(np.exp(intercept))}
+
+
+def main():
+    args = parse_args()
+
+    # Only measure core counts available on this machine
+    cores = [count for count in args.cores if count <= os.cpu_count()] or [1]
+
+    # Scale the number of rows on one core, then the number of cores on fixed rows
+    rows_results = [benchmark(rows, 1, args) for rows in args.rows]
+    cores_results = [benchmark(args.cores_rows, count, args) for count in cores]
+    single_core_seconds = cores_results[0]["train_model"]["seconds"]
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+            "cpu_count": os.cpu_count(),
+        },
+        "cv_folds": args.cv_folds,
+        "cv_backend": args.cv_backend,
+        "solver": args.solver,
+        "rows_scaling": {
+            "results": rows_results,
+            "fit": fit_scaling(
+                [result["rows"] for result in rows_results],
+                [result["total_seconds"] for result in rows_results],
+            ),
+        },
+        "cores_scaling": {
+            "results": cores_results,
+            "speedup": [
+                {
+                    "cores": result["cores"],
+                    "speedup": round(
+                        single_core_seconds / result["train_model"]["seconds"], 2
+                    ),
+                }
+                for result in cores_results
+            ],
+        },
+    }
+
+    print(json.dumps(results, indent=2))
+
+    # Write results to file
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
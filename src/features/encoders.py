@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+def get_category_codes(values, categories):
+    # Map values to positions in the category vocabulary, using the codes of
+    # categorical columns directly when they share the vocabulary
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        if values.cat.categories.equals(categories):
+            codes = values.cat.codes.to_numpy()
+        else:
+            codes = categories.get_indexer(values.cat.categories)
+            codes = np.append(codes, -1)[values.cat.codes.to_numpy()]
+    else:
+        codes = categories.get_indexer(values.to_numpy())
+
+    if (codes < 0).any():
+        unknown = pd.unique(values.to_numpy()[codes < 0]).tolist()
+        raise ValueError(f"Found unknown categories {unknown} in {values.name}")
+
+    return codes
+
+
+class CategoryCodeEncoder(BaseEstimator, TransformerMixin):
+    # One hot encoder for categorical columns which works on the category codes
+    # instead of hashing each value
+    def __init__(self, categories="auto"):
+        self.categories = categories
+
+    def fit(self, X, y=None):
+        X = pd.DataFrame(X)
+
+        # Use the given category vocabularies or the sorted values of each column
+        if isinstance(self.categories, str) and self.categories == "auto":
+            categories = [
+                sorted(X[column].dropna().unique().tolist()) for column in X.columns
+            ]
+        else:
+            categories = self.categories
+
+        self.categories_ = [np.asarray(values, dtype=object) for values in categories]
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+
+        return self
+
+    def transform(self, X):
+        X = pd.DataFrame(X)
+
+        # Set one column per category, after the categories of earlier columns
+        offsets = np.cumsum([0] + [len(values) for values in self.categories_])
+        encoded = np.zeros((len(X), offsets[-1]))
+        rows = np.arange(len(X))
+
+        for column, categories, offset in zip(X.columns, self.categories_, offsets):
+            codes = get_category_codes(X[column], pd.Index(categories))
+            encoded[rows, offset + codes] = 1
+
+        return encoded
+
+    def get_feature_names_out(self, input_features=None):
+        # Name each output column after its feature and category
+        input_features = (
+            self.feature_names_in_ if input_features is None else input_features
+        )
+
+        return np.asarray(
+            [
+                f"{feature}_{category}"
+                for feature, categories in zip(input_features, self.categories_)
+                for category in categories
+            ],
+            dtype=object,
+        )
@@ -0,0 +1,107 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+# Define categorical features
+categorical_features = [
+    "gender",
+    "cholesterol",
+    "glucose",
+    "smoker",
+    "alcoholic",
+    "active",
+]
+
+# Define numeric features
+numeric_features = ["age", "systolic", "diastolic", "bmi"]
+raw_numeric_features = ["age", "systolic", "diastolic", "height", "weight"]
+
+# Define target
+target = "cardiovascular_disease"
+
+# Define data types of the raw input columns and the model features, categorical
+# features are kept as pandas categories instead of python strings
+raw_feature_dtypes = {
+    **{feature: "category" for feature in categorical_features},
+    **{feature: np.float64 for feature in raw_numeric_features},
+}
+feature_dtypes = {
+    **{feature: "category" for feature in categorical_features},
+    **{feature: np.float64 for feature in numeric_features},
+}
+
+
+def add_bmi(df):
+    # Create feature for Body Mass Index (indicator of heart health) in one buffer
+    bmi = np.divide(df["height"].to_numpy(), 100)
+    np.square(bmi, out=bmi)
+    np.divide(df["weight"].to_numpy(), bmi, out=bmi)
+    df["bmi"] = bmi
+
+    return df
+
+
+def get_feature_dtypes(categories=None):
+    # Get model feature data types, with the category vocabularies if given
+    dtypes = dict(feature_dtypes)
+
+    for feature, values in (categories or {}).items():
+        dtypes[feature] = pd.CategoricalDtype(values)
+
+    return dtypes
+
+
+def get_model_features(df, feature_columns=None, categories=None):
+    # Select model features in a fixed order, dropping all other columns
+    feature_columns = feature_columns or categorical_features + numeric_features
+    missing_features = [column for column in feature_columns if column not in df]
+
+    if missing_features:
+        raise KeyError(f"Missing model features: {missing_features}")
+
+    df = df.reindex(columns=feature_columns)
+
+    # Convert data types of features that were not read with their model data type,
+    # categorical features are recoded to the vocabularies learned in training
+    dtypes = {
+        feature: dtype
+        for feature, dtype in get_feature_dtypes(categories).items()
+        if df[feature].dtype != dtype
+    }
+
+    return df.astype(dtypes) if dtypes else df
+
+
+def build_feature_metadata(df):
+    # Record feature lists, column order and category vocabularies from training data
+    return {
+        "categorical_features": categorical_features,
+        "numeric_features": numeric_features,
+        "raw_numeric_features": raw_numeric_features,
+        "feature_columns": categorical_features + numeric_features,
+        "categories": {
+            feature: sorted(df[feature].dropna().unique().tolist())
+            for feature in categorical_features
+        },
+    }
+
+
+def get_categories(feature_metadata):
+    # Get category vocabularies in the order of the categorical features
+    return [
+        feature_metadata["categories"][feature]
+        for feature in feature_metadata["categorical_features"]
+    ]
+
+
+def write_feature_metadata(feature_metadata, file_path):
+    # Write feature metadata to file
+    with open(file_path, "w") as f:
+        json.dump(feature_metadata, f, indent=2)
+
+
+def read_feature_metadata(file_path):
+    # Read feature metadata from file
+    with open(file_path) as f:
+        return json.load(f)
@@ -0,0 +1,178 @@
+import os
+
+import numpy as np
+import pandas as pd
+from src.features.features import categorical_features, raw_numeric_features
+from src.utils.formats import get_file_format, get_temp_path, get_writer, replace_file
+
+# Define the allowed value range of each raw numeric feature
+numeric_ranges = {
+    "age": (0, 120),
+    "height": (50, 250),
+    "weight": (10, 300),
+    "systolic": (50, 300),
+    "diastolic": (20, 200),
+}
+validation_error_column = "validation_error"
+
+
+class SchemaValidator:
+    def __init__(self, numeric_ranges, categories):
+        # Precompute the checks of each column once, so validating a chunk only runs
+        # vectorized comparisons
+        self.numeric_ranges = dict(numeric_ranges)
+        self.categories = {
+            feature: pd.Index(values) if values is not None else None
+            for feature, values in categories.items()
+        }
+
+    def get_numeric_values(self, df, feature):
+        # Coerce values which were not parsed as numbers, unparsable values are NaN
+        values = df[feature]
+
+        if not pd.api.types.is_numeric_dtype(values.dtype):
+            values = pd.to_numeric(values, errors="coerce")
+
+        return values.to_numpy(dtype=np.float64)
+
+    def check_numeric(self, df, feature):
+        values = self.get_numeric_values(df, feature)
+        minimum, maximum = self.numeric_ranges[feature]
+
+        # Replace columns which were not parsed as numbers with the coerced values,
+        # missing and unparsable values fail both comparisons
+        if not pd.api.types.is_numeric_dtype(df[feature].dtype):
+            df[feature] = values
+
+        return (values >= minimum) & (values <= maximum)
+
+    def check_categorical(self, df, feature):
+        values = df[feature]
+        categories = self.categories[feature]
+
+        # Without a vocabulary from training any category is allowed
+        if categories is None:
+            return values.notna().to_numpy()
+
+        # Check the categories of categorical columns instead of every value, missing
+        # values have the code -1
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            allowed = values.cat.categories.isin(categories)
+            return np.append(allowed, False)[values.cat.codes.to_numpy()]
+
+        return values.isin(categories).to_numpy()
+
+    def get_errors(self, df):
+        # Collect a mask of failing rows for each check in a fixed order
+        checks = []
+
+        for feature in self.numeric_ranges:
+            if feature not in df:
+                checks.append(
+                    (np.ones(len(df), dtype=bool), f"missing_column:{feature}")
+                )
+                continue
+
+            values = self.get_numeric_values(df, feature)
+            missing = df[feature].isna().to_numpy()
+            minimum, maximum = self.numeric_ranges[feature]
+            out_of_range = (values < minimum) | (values > maximum)
+
+            checks.append((missing, f"missing_value:{feature}"))
+            checks.append((np.isnan(values) & ~missing, f"invalid_type:{feature}"))
+            checks.append((out_of_range, f"out_of_range:{feature}"))
+
+        for feature in self.categories:
+            if feature not in df:
+                checks.append(
+                    (np.ones(len(df), dtype=bool), f"missing_column:{feature}")
+                )
+                continue
+
+            missing = df[feature].isna().to_numpy()
+            unknown = ~self.check_categorical(df, feature) & ~missing
+
+            checks.append((missing, f"missing_value:{feature}"))
+            checks.append((unknown, f"unknown_category:{feature}"))
+
+        # Label each row with its first failing check
+        return np.select([mask for mask, _ in checks], [error for _, error in checks])
+
+    def validate(self, df):
+        # Combine the checks of every column into one mask of valid rows, on a copy of
+        # the dataframe so invalid rows are quarantined with their raw values
+        raw_df, df = df, df.copy(deep=False)
+        valid = np.ones(len(df), dtype=bool)
+
+        for feature in list(self.numeric_ranges) + list(self.categories):
+            # Add missing columns as missing values, so every row fails validation
+            # and the remaining rows still have the full schema
+            if feature not in df:
+                df[feature] = np.nan
+                valid[:] = False
+            elif feature in self.numeric_ranges:
+                valid &= self.check_numeric(df, feature)
+            else:
+                valid &= self.check_categorical(df, feature)
+
+        if valid.all():
+            return df, df.iloc[:0]
+
+        # Only label the errors of invalid rows, which are expected to be few
+        invalid_df = raw_df.take(np.flatnonzero(~valid))
+        invalid_df[validation_error_column] = self.get_errors(invalid_df)
+
+        return df.take(np.flatnonzero(valid)), invalid_df
+
+
+def compile_validator(feature_metadata=None):
+    # Build the validator from the feature spec and the categories seen in training
+    categories = (feature_metadata or {}).get("categories", {})
+
+    return SchemaValidator(
+        {feature: numeric_ranges[feature] for feature in raw_numeric_features},
+        {feature: categories.get(feature) for feature in categorical_features},
+    )
+
+
+class QuarantineWriter:
+    def __init__(self, file_path, file_format=None, compression=None):
+        # Write to a temporary file which is renamed to the file once closed
+        self.file_path = file_path
+        self.temp_path = get_temp_path(file_path)
+        self.file_format = get_file_format(file_path, file_format)
+        self.compression = compression
+        self.writer = None
+        self.rows = 0
+
+    def write(self, df):
+        # Only create the quarantine file once there are rows to write
+        if not len(df):
+            return
+
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            self.writer = get_writer(
+                self.temp_path,
+                self.file_format,
+                self.compression,
+                os.path.basename(self.file_path),
+            )
+
+        # Write raw values as strings, as the data types and categories of the
+        # quarantined rows differ between chunks while the file schema is fixed
+        self.writer.write(
+            pd.DataFrame(
+                {
+                    column: values.astype(str).where(values.notna()).astype("string")
+                    for column, values in df.items()
+                }
+            )
+        )
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+            replace_file(self.temp_path, self.file_path)
@@ -1,22 +1,68 @@
-import glob
 import logging
 import os
+import queue
+import re
 import sys
+import tempfile
 import traceback
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
 import joblib
 import numpy as np
-import pandas as pd
 from azureml.core import Run
-from azureml.core.model import Model
-from opencensus.ext.azure.log_exporter import AzureLogHandler
-
+from src.features.features import (
+    add_bmi,
+    get_model_features,
+    raw_feature_dtypes,
+    read_feature_metadata,
+)
+from src.features.validation import QuarantineWriter, compile_validator
+from src.utils.compiled_model import compile_model, load_compiled_model
+from src.utils.discovery import parse_partition, select_file, walk_files
+from src.utils.formats import (
+    concat_chunks,
+    file_extensions,
+    get_file_extension,
+    get_file_patterns,
+    read_file,
+    remove_file,
+    write_file,
+    write_file_chunks,
+)
+from src.utils.instrumentation import (
+    StageMetrics,
+    get_peak_rss,
+    reset_peak_rss,
+    write_summary,
+)
+from src.utils.manifest import ScoreManifest
+from src.utils.model_cache import AzureModelRegistry, ModelCache
+from src.utils.prefetch import BackgroundConsumer, prefetch
+from src.utils.storage import (
+    delete_files,
+    download_files,
+    get_storage,
+    list_files,
+    upload_files,
+)
+from src.utils.telemetry import get_logger
+
+args = None
 run = None
 model = None
+feature_metadata = None
+validator = None
 logger = None
-file_type = "*.csv"
+model_file_name = "model.pkl"
+feature_metadata_file_name = "features.json"
+compiled_model_folder_name = "compiled"
+quarantine_folder_name = "quarantine"
+manifest_file_name = "score_manifest.json"
+storage_credential_variable = "AZURE_STORAGE_CREDENTIAL"
+predict_rows = 65536
+loaded_models = {}
 
 
 def parse_args(argv):
@@ -25,6 +71,29 @@ def parse_args(argv):
     ap.add_argument("--build_id", required=True)
     ap.add_argument("--input_datapath", required=True)
     ap.add_argument("--output_datapath", required=True)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--prefetch", type=int, default=0)
+    ap.add_argument("--chunk_rows", type=int, default=None)
+    ap.add_argument("--input_format", choices=list(file_extensions), default=None)
+    ap.add_argument("--output_format", choices=list(file_extensions), default="csv")
+    ap.add_argument("--output_compression", default=None)
+    ap.add_argument("--predictor", choices=["sklearn", "compiled"], default="sklearn")
+    ap.add_argument(
+        "--model_cache_dir", default=os.path.join(tempfile.gettempdir(), "model_cache")
+    )
+    ap.add_argument("--model_cache_size", type=int, default=1024)
+    ap.add_argument("--validate", action="store_true")
+    ap.add_argument(
+        "--metrics_file", default=os.path.join("outputs", "score_metrics.json")
+    )
+    ap.add_argument("--rescore", action="store_true")
+    ap.add_argument("--include", nargs="+", default=None)
+    ap.add_argument("--exclude", nargs="+", default=None)
+    ap.add_argument("--start_date", default=None)
+    ap.add_argument("--end_date", default=None)
+    ap.add_argument("--input_storage_url", default=None)
+    ap.add_argument("--output_storage_url", default=None)
+    ap.add_argument("--storage_concurrency", type=int, default=16)
 
     args, _ = ap.parse_known_args(argv)
 
@@ -34,11 +103,9 @@ def parse_args(argv):
 def set_logger():
     global logger
 
-    # Add the app insights logger to the python logger
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(logging.StreamHandler())
-    logger.addHandler(AzureLogHandler())
+    # Add the app insights logger to the python logger, records are exported in
+    # batches from a background thread
+    logger = get_logger(__name__)
 
     # Get pipeline information
     custom_dimensions = {
@@ -53,90 +120,718 @@ def set_logger():
     logger.info(custom_dimensions)
 
 
-def set_model(build_id):
-    global model
+def set_worker_logger():
+    global logger
+
+    # Worker processes only log to stdout, results are reported by the main process
+    logger = logging.getLogger(f"{__name__}.worker")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
 
-    # Retreive workspace
-    workspace = run.experiment.workspace
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
 
-    # Find models with build id
-    model_list = Model.list(workspace, tags=[["build_id", build_id]], latest=True)
 
-    # Throw error if no model is found
-    if not model_list:
-        raise Exception(f"Model not found: build_id={build_id}")
+def load_model(model_path, predictor="sklearn"):
+    global model
+    global feature_metadata
+    global validator
+
+    # Models registered as a folder include the feature metadata from training
+    if os.path.isdir(model_path):
+        feature_metadata = read_feature_metadata(
+            os.path.join(model_path, feature_metadata_file_name)
+        )
+        model_path = os.path.join(model_path, model_file_name)
+
+    # Compile the input schema validator once for the model
+    validator = compile_validator(feature_metadata)
+
+    # Memory map the compiled model if it was written in training, so workers share
+    # its pages instead of each deserializing their own copy
+    compiled_model_path = os.path.join(
+        os.path.dirname(model_path), compiled_model_folder_name
+    )
 
-    # Retreive path to model folder
-    model_path = Model.get_model_path(model_list[0].name, version=model_list[0].version)
+    if predictor == "compiled" and os.path.isdir(compiled_model_path):
+        model = load_compiled_model(compiled_model_path)
+        return
 
     # Deserialize the model file back into a sklearn model
     model = joblib.load(model_path)
 
-    print("Retreived model:", {"model_id": model_list[0].id})
+    # Fold the model pipeline into a numpy predictor
+    if predictor == "compiled":
+        model = compile_model(model)
 
 
-def score_data(input_file_path):
-    # Read file
-    df = pd.read_csv(input_file_path)
-
-    # Convert strings to float
-    df = df.astype(
-        {
-            "age": np.float64,
-            "height": np.float64,
-            "weight": np.float64,
-            "systolic": np.float64,
-            "diastolic": np.float64,
-        }
+def set_model(build_id, model_cache, predictor="sklearn"):
+    global model
+    global feature_metadata
+    global validator
+
+    # Retreive the model folder from the local model cache, downloading it from the
+    # model registry if it is missing or fails the integrity check
+    model_path, model_info = model_cache.get_model(build_id)
+
+    # Reuse the deserialized model if the same artifact was already loaded
+    model_key = (model_info["sha256"], predictor)
+
+    if model_key not in loaded_models:
+        load_model(model_path, predictor)
+        loaded_models[model_key] = (model, feature_metadata, validator)
+
+    model, feature_metadata, validator = loaded_models[model_key]
+
+    print("Retreived model:", {"model_id": model_info["id"]})
+
+    return model_path
+
+
+def read_data(input_file_path, chunk_rows=None, file_format=None, validate=False):
+    # Read only the model columns, parsed directly into their final data types
+    if not validate:
+        return read_file(
+            input_file_path,
+            file_format,
+            columns=list(raw_feature_dtypes),
+            dtype=raw_feature_dtypes,
+            chunk_rows=chunk_rows,
+        )
+
+    # Read every column without numeric data types when validating, so missing
+    # columns and unparsable values are reported by the validator per row
+    return read_file(
+        input_file_path,
+        file_format,
+        dtype={
+            feature: dtype
+            for feature, dtype in raw_feature_dtypes.items()
+            if dtype == "category"
+        },
+        chunk_rows=chunk_rows,
     )
 
-    # Define categorical features
-    categorical_features = [
-        "gender",
-        "cholesterol",
-        "glucose",
-        "smoker",
-        "alcoholic",
-        "active",
-    ]
 
-    # Define numeric features
-    numeric_features = ["age", "systolic", "diastolic", "bmi"]
-    raw_numeric_features = ["age", "systolic", "diastolic", "height", "weight"]
+def validate_data(df, quarantine):
+    # Write rows failing schema validation to the quarantine file
+    df, invalid_df = validator.validate(df)
+    quarantine.write(invalid_df)
+
+    return df
 
-    # Filter dataframe for columns of interest
-    df = df[categorical_features + raw_numeric_features]
 
+def featurize(df):
     # Create feature for Body Mass Index (indicator of heart health)
-    df["bmi"] = df.weight / (df.height / 100) ** 2
+    df = add_bmi(df)
+
+    # Select model features in the column order and category vocabularies used in
+    # training
+    if feature_metadata:
+        return get_model_features(
+            df, feature_metadata["feature_columns"], feature_metadata["categories"]
+        )
+
+    return get_model_features(df)
+
+
+def score_data(input_file_path, file_format=None, quarantine=None, metrics=None):
+    metrics = metrics or StageMetrics(input_file_path)
+
+    # Read file, validating it if a quarantine file is given
+    with metrics.stage("read") as record:
+        df = read_data(
+            input_file_path, file_format=file_format, validate=bool(quarantine)
+        )
+        record["rows"] += len(df)
+
+    if quarantine:
+        with metrics.stage("validate") as record:
+            df = validate_data(df, quarantine)
+            record["rows"] += len(df)
+
+    return score_frame(df, datetime.now(), metrics)
+
+
+def score_data_chunks(
+    input_file_path, chunk_rows, file_format=None, quarantine=None, metrics=None
+):
+    metrics = metrics or StageMetrics(input_file_path)
+
+    # Use one timestamp for every chunk so the output matches the non-chunked path
+    score_datetime = datetime.now()
+
+    # Read, score and yield the file in fixed size chunks to bound memory usage
+    chunks = metrics.time_chunks(
+        read_data(input_file_path, chunk_rows, file_format, bool(quarantine)), "read"
+    )
+
+    if quarantine:
+        chunks = validate_chunks(chunks, quarantine, metrics)
+
+    for df in align_chunks(chunks):
+        yield score_frame(df, score_datetime, metrics)
+
+
+def get_rows(df, start, end):
+    # Copy a range of rows, so scoring adds columns to a frame and not to a view and
+    # carried over rows do not hold on to the whole chunk
+    if start == 0 and end == len(df):
+        return df
 
-    # Get model features / target
-    df = df.drop(labels=["height", "weight"], axis=1)
+    return df.iloc[start:end].copy()
 
-    # Convert data types of model features
-    df[categorical_features] = df[categorical_features].astype(np.object)
-    df[numeric_features] = df[numeric_features].astype(np.float64)
 
-    # Preprocess payload and get model prediction
-    probability = model.predict_proba(df)
+def validate_chunks(chunks, quarantine, metrics):
+    for df in chunks:
+        with metrics.stage("validate") as record:
+            df = validate_data(df, quarantine)
+            record["rows"] += len(df)
+
+        yield df
+
+
+def align_chunks(chunks):
+    # Carry the rows after the last full prediction block of a chunk over to the
+    # next chunk, so prediction blocks start at the same rows as in the unchunked
+    # path and probabilities are computed identically, holding at most chunk_rows
+    # plus predict_rows rows
+    pending = None
+    aligned = 0
+
+    for df in chunks:
+        start = 0
+
+        # Complete the carried over block with the first rows of the chunk
+        if pending is not None and len(pending):
+            start = min(predict_rows - len(pending), len(df))
+            pending = concat_chunks([pending, df.iloc[:start]])
+
+            if len(pending) < predict_rows:
+                continue
+
+            yield pending
+            aligned += 1
+
+        end = start + (len(df) - start) // predict_rows * predict_rows
+
+        if end > start:
+            yield get_rows(df, start, end)
+            aligned += 1
+
+        pending = get_rows(df, end, len(df))
+
+    # Yield the remaining rows, or an empty chunk so empty files are still written
+    if pending is not None and (len(pending) or not aligned):
+        yield pending
+
+
+def score_frame(df, score_datetime, metrics=None):
+    metrics = metrics or StageMetrics(None)
+
+    # Get model features
+    with metrics.stage("featurize") as record:
+        df = featurize(df)
+        record["rows"] += len(df)
+
+    # Preprocess payload and get model prediction in fixed size blocks, as the
+    # floating point result of a batched prediction depends on the batch size
+    with metrics.stage("predict") as record:
+        blocks = [
+            model.predict_proba(df.iloc[idx:idx + predict_rows])
+            for idx in range(0, len(df), predict_rows)
+        ]
+        probability = np.concatenate([np.empty((0, 2))] + blocks)
+        record["rows"] += len(df)
 
     # Add prediction, confidence level and datetime to input data as columns
     df["probability"] = probability[:, 1]
     df["score"] = np.where(probability[:, 1] >= 0.5, 1, 0)
-    df["score_datetime"] = datetime.now()
+    df["score_datetime"] = score_datetime
 
     return df
 
 
-def write_data(df, output_file_path):
+def write_data(df, output_file_path, file_format=None, compression=None):
     # Write scored results
-    df.to_csv(output_file_path, index=False)
+    write_file(df, output_file_path, file_format, compression)
     print("Completed File:", output_file_path)
     logger.info({"output_file_path": output_file_path})
 
 
+def write_data_chunks(chunks, output_file_path, file_format=None, compression=None):
+    # Write scored results chunk by chunk
+    write_file_chunks(chunks, output_file_path, file_format, compression)
+    print("Completed File:", output_file_path)
+    logger.info({"output_file_path": output_file_path})
+
+
+def init_worker(model_path, worker_args):
+    global args
+
+    # Load the model once per worker process instead of once per file
+    args = worker_args
+    set_worker_logger()
+    load_model(model_path, args.predictor)
+
+
+def get_output_file_name(input_file_name, build_id, run_id, extension):
+    # Name the output after the input file, model build and run, so retried and
+    # parallel runs never write to the same file. The input folders are mirrored in
+    # the output folder and the input extension is kept, so different input files
+    # never share an output
+    directory, file_name = os.path.split(input_file_name)
+    ids = [re.sub(r"[^\w.-]", "_", part) for part in [build_id, run_id]]
+
+    return os.path.join(directory, "_".join([file_name] + ids) + extension)
+
+
+def get_quarantine(output_file_path):
+    # Write rows failing validation to a file with the output name in a quarantine
+    # folder of the output folder
+    if not args.validate:
+        return None
+
+    return QuarantineWriter(
+        os.path.join(
+            args.output_datapath,
+            quarantine_folder_name,
+            os.path.relpath(output_file_path, args.output_datapath),
+        ),
+        args.output_format,
+        args.output_compression,
+    )
+
+
+def log_quarantine(quarantine):
+    if quarantine and quarantine.rows:
+        print("Quarantined rows:", quarantine.rows, quarantine.file_path)
+        logger.warning(
+            {
+                "quarantine_file_path": quarantine.file_path,
+                "quarantine_rows": quarantine.rows,
+            }
+        )
+
+
+def get_file_metrics(metrics, input_file_path, output_file_path):
+    # Count the bytes read and written for the throughput of the file stages
+    metrics.stages["read"]["bytes"] += os.path.getsize(input_file_path)
+    metrics.stages["write"]["bytes"] += os.path.getsize(output_file_path)
+
+    return {**metrics.summary(), "output_file_path": output_file_path}
+
+
+def score_file(input_file_path, output_file_path):
+    # Time each stage of scoring the file
+    metrics = StageMetrics(input_file_path)
+    quarantine = get_quarantine(output_file_path)
+
+    # Score file and write results to output directory, stages run while the chunks
+    # are written are excluded from the write stage
+    try:
+        if args.chunk_rows:
+            chunks = score_data_chunks(
+                input_file_path,
+                args.chunk_rows,
+                args.input_format,
+                quarantine,
+                metrics,
+            )
+
+            with metrics.stage("write") as record:
+                write_data_chunks(
+                    chunks,
+                    output_file_path,
+                    args.output_format,
+                    args.output_compression,
+                )
+                record["rows"] += metrics.stages["predict"]["rows"]
+        else:
+            df = score_data(input_file_path, args.input_format, quarantine, metrics)
+
+            with metrics.stage("write") as record:
+                write_data(
+                    df, output_file_path, args.output_format, args.output_compression
+                )
+                record["rows"] += len(df)
+    finally:
+        if quarantine:
+            quarantine.close()
+
+    log_quarantine(quarantine)
+
+    return get_file_metrics(metrics, input_file_path, output_file_path)
+
+
+def read_files(file_paths):
+    # Read each file in the reader thread, followed by None once it has been read
+    for input_file_path, output_file_path in file_paths:
+        # Files overlap in the pipeline, so the peak memory is not tracked per file
+        metrics = StageMetrics(input_file_path, track_peak_rss=False)
+        quarantine = get_quarantine(output_file_path)
+        scored_file = (
+            input_file_path,
+            output_file_path,
+            metrics,
+            quarantine,
+            datetime.now(),
+        )
+
+        try:
+            if args.chunk_rows:
+                chunks = metrics.time_chunks(
+                    read_data(
+                        input_file_path,
+                        args.chunk_rows,
+                        args.input_format,
+                        bool(quarantine),
+                    ),
+                    "read",
+                )
+            else:
+                with metrics.stage("read") as record:
+                    df = read_data(
+                        input_file_path,
+                        file_format=args.input_format,
+                        validate=bool(quarantine),
+                    )
+                    record["rows"] += len(df)
+
+                chunks = [df]
+
+            for df in chunks:
+                yield scored_file, df
+        except BaseException:
+            if quarantine:
+                quarantine.close()
+            raise
+
+        yield scored_file, None
+
+
+def get_file_chunks(df, items, metrics):
+    # Yield the read chunks of a file until it ends
+    while df is not None:
+        yield df
+
+        item = next(items, None)
+
+        if item is None:
+            raise Exception(f"Reading stopped before the file ended: {metrics.name}")
+
+        _, df = item
+
+
+def get_scored_chunks(df, items, metrics):
+    # Yield the scored chunks of a file until it ends, the time spent waiting for
+    # the next chunk is excluded from the write stage
+    while df is not None:
+        yield df
+
+        with metrics.stage("write_wait"):
+            item = next(items, None)
+
+        # Fail the partially scored file if scoring stopped, so it is not published
+        if item is None:
+            raise Exception(f"Scoring stopped before the file ended: {metrics.name}")
+
+        _, df = item
+
+
+def write_files(items, completed):
+    # Write each scored file in the writer thread, then pass its metrics back
+    for scored_file, df in items:
+        input_file_path, output_file_path, metrics, _, _ = scored_file
+
+        with metrics.stage("write") as record:
+            write_data_chunks(
+                get_scored_chunks(df, items, metrics),
+                output_file_path,
+                args.output_format,
+                args.output_compression,
+            )
+            record["rows"] += metrics.stages["predict"]["rows"]
+
+        completed.put(get_file_metrics(metrics, input_file_path, output_file_path))
+
+
+def score_files_prefetch(file_paths, manifest=None):
+    # Read the next files in a reader thread and write results in a writer thread
+    # while the main thread scores, each queue holds up to args.prefetch chunks so
+    # readers and scoring wait when a later stage falls behind to cap memory usage
+    completed = queue.Queue()
+    writer = BackgroundConsumer(
+        lambda items: write_files(items, completed), args.prefetch
+    )
+    file_metrics = []
+
+    def report_completed():
+        # Report files once they are written, from the main thread only
+        while not completed.empty():
+            file_metrics.append(completed.get())
+            log_file_metrics(file_metrics[-1])
+
+            if manifest:
+                manifest.record(
+                    file_metrics[-1]["name"],
+                    file_metrics[-1]["output_file_path"],
+                    args.build_id,
+                )
+
+    # Stop the pipeline if a file fails to be read or scored, the writer finishes
+    # the files it was given and drops the partially scored file, so the files
+    # written before the failure are still recorded in the manifest
+    items = prefetch(read_files(file_paths), args.prefetch)
+    quarantine = None
+
+    try:
+        for scored_file, df in items:
+            _, _, metrics, quarantine, score_datetime = scored_file
+            chunks = get_file_chunks(df, items, metrics)
+
+            if quarantine:
+                chunks = validate_chunks(chunks, quarantine, metrics)
+
+            for df in align_chunks(chunks):
+                writer.put((scored_file, score_frame(df, score_datetime, metrics)))
+                report_completed()
+
+            if quarantine:
+                quarantine.close()
+                log_quarantine(quarantine)
+
+            writer.put((scored_file, None))
+            report_completed()
+    except BaseException:
+        items.close()
+
+        if quarantine:
+            quarantine.close()
+
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+        report_completed()
+        raise
+
+    writer.close()
+    report_completed()
+
+    return file_metrics
+
+
+def log_file_metrics(file_metrics):
+    # Log the stage metrics of a scored file to app insights and the run
+    logger.info({"file_metrics": file_metrics})
+    columns = {
+        "file": os.path.basename(file_metrics["name"]),
+        "seconds": file_metrics["seconds"],
+        "slowest_stage": file_metrics["slowest_stage"],
+        **{
+            f"{stage_name}_seconds": stage["seconds"]
+            for stage_name, stage in file_metrics["stages"].items()
+        },
+    }
+
+    # Files scored in the prefetch pipeline have no peak memory of their own
+    if file_metrics["peak_rss_bytes"] is not None:
+        columns["peak_rss_bytes"] = file_metrics["peak_rss_bytes"]
+
+    run.log_row("File Metrics", **columns)
+
+
+def log_process_peak_rss():
+    # Log the peak memory of the whole process, for runs which score files at once
+    peak_rss_bytes = get_peak_rss()
+    print("Process peak RSS bytes:", peak_rss_bytes)
+    logger.info({"process_peak_rss_bytes": peak_rss_bytes})
+    run.log("process_peak_rss_bytes", peak_rss_bytes)
+
+
+def get_file_filters():
+    # Select input files by pattern and date partition, by default every file of
+    # the input format
+    return (
+        args.include or get_file_patterns(args.input_format),
+        args.exclude,
+        parse_partition(args.start_date),
+        parse_partition(args.end_date),
+    )
+
+
+def get_storage_credential():
+    # Read the storage account key or sas token from the environment, so it is not
+    # visible in the step arguments
+    return os.environ.get(storage_credential_variable)
+
+
+def stage_input_files(manifest):
+    # Download the selected input files concurrently to the input directory, so
+    # they are read from local disk instead of through the datastore mount
+    input_storage = get_storage(args.input_storage_url, get_storage_credential())
+    manifest.input_files = list_files(input_storage)
+
+    file_names = [
+        file_name
+        for file_name in manifest.input_files
+        if select_file(file_name, *get_file_filters())
+    ]
+
+    # Skip files already scored by the same model before downloading them
+    if not args.rescore:
+        file_names = [
+            file_name
+            for file_name in file_names
+            if not manifest.is_scored_in_storage(file_name, args.build_id)
+        ]
+
+    download_files(
+        input_storage, args.input_datapath, file_names, args.storage_concurrency
+    )
+
+    print("Staged input files:", len(file_names))
+    logger.info({"staged_input_files": len(file_names)})
+
+
+def get_output_files():
+    # Download the manifest of earlier runs from the output storage and list the
+    # outputs already uploaded
+    output_storage = get_storage(args.output_storage_url, get_storage_credential())
+    output_files = set(list_files(output_storage))
+
+    if manifest_file_name in output_files:
+        download_files(output_storage, args.output_datapath, [manifest_file_name])
+
+    return output_files
+
+
+def upload_output_files(manifest):
+    # Upload the outputs and quarantine files written in this run concurrently,
+    # then the manifest, so the manifest never records outputs missing in storage
+    file_names = []
+
+    for entry in manifest.files.values():
+        output_file_name = entry["output_file"].replace(os.sep, "/")
+
+        if output_file_name in manifest.output_files:
+            continue
+
+        file_names.extend(
+            file_name
+            for file_name in [
+                output_file_name,
+                f"{quarantine_folder_name}/{output_file_name}",
+            ]
+            if os.path.exists(os.path.join(args.output_datapath, file_name))
+        )
+
+    output_storage = get_storage(args.output_storage_url, get_storage_credential())
+    upload_files(
+        output_storage, args.output_datapath, file_names, args.storage_concurrency
+    )
+
+    if os.path.exists(manifest.file_path):
+        upload_files(output_storage, args.output_datapath, [manifest_file_name])
+
+    print("Uploaded output files:", len(file_names))
+    logger.info({"uploaded_output_files": len(file_names)})
+
+
+def remove_replaced_files(manifest):
+    # Remove the outputs and quarantine files of earlier versions of rescored inputs,
+    # after the manifest recording their new outputs is written or uploaded, so
+    # consumers never read two scored copies of an input
+    output_files = [file_name.replace(os.sep, "/") for file_name in manifest.replaced_files]
+    file_names = output_files + [
+        f"{quarantine_folder_name}/{file_name}" for file_name in output_files
+    ]
+
+    for file_name in file_names:
+        remove_file(os.path.join(args.output_datapath, *file_name.split("/")))
+
+    if args.output_storage_url and file_names:
+        output_storage = get_storage(args.output_storage_url, get_storage_credential())
+        delete_files(output_storage, file_names, args.storage_concurrency)
+
+    manifest.replaced_files = []
+
+    if file_names:
+        print("Removed replaced output files:", len(file_names))
+
+
+def get_file_paths(manifest=None):
+    # Find input files recursively
+    file_names = walk_files(
+        args.input_datapath, *get_file_filters(), skip_dirs=[args.output_datapath]
+    )
+    output_extension = get_file_extension(args.output_format, args.output_compression)
+
+    # Yield each file as it is found with the path to write its results, named
+    # after the input file, build and run so they are deterministic
+    for file_name in file_names:
+        input_file_path = os.path.join(args.input_datapath, file_name)
+
+        # Skip files already scored by the same model in an earlier or preempted run
+        if manifest and manifest.is_scored(input_file_path, args.build_id):
+            print("Skipped scored file:", file_name)
+            continue
+
+        yield input_file_path, os.path.join(
+            args.output_datapath,
+            get_output_file_name(file_name, args.build_id, run.id, output_extension),
+        )
+
+
+def score_files_parallel(file_paths, model_path, manifest=None):
+    failed_files = []
+    file_metrics = []
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=init_worker, initargs=(model_path, args)
+    ) as executor:
+        # Submit one task per file to the process pool
+        futures = {
+            executor.submit(score_file, input_file_path, output_file_path): (
+                input_file_path
+            )
+            for input_file_path, output_file_path in file_paths
+        }
+
+        # Report results per file without stopping the remaining files
+        for future in as_completed(futures):
+            input_file_path = futures[future]
+
+            try:
+                file_metrics.append(future.result())
+                log_file_metrics(file_metrics[-1])
+
+                # Record scored files as they complete, so a rerun resumes after them
+                if manifest:
+                    manifest.record(
+                        input_file_path,
+                        file_metrics[-1]["output_file_path"],
+                        args.build_id,
+                    )
+
+            except Exception:
+                failed_files.append(input_file_path)
+                logger.error(
+                    f"Failed File: {input_file_path}\n{traceback.format_exc()}"
+                )
+
+    # Fail the step once all files have been attempted
+    if failed_files:
+        raise Exception(f"Failed to score files: {sorted(failed_files)}")
+
+    return file_metrics
+
+
 def main():
     try:
+        global args
         global run
 
         # Retrieve current service context
@@ -149,35 +844,78 @@ def main():
         print("Argument [build_id]:", args.build_id)
         print("Argument [input_datapath]:", args.input_datapath)
         print("Argument [output_datapath]:", args.output_datapath)
-
-        # Initialise model and logger
-        set_model(args.build_id)
+        print("Argument [workers]:", args.workers)
+        print("Argument [prefetch]:", args.prefetch)
+        print("Argument [chunk_rows]:", args.chunk_rows)
+        print("Argument [input_format]:", args.input_format)
+        print("Argument [output_format]:", args.output_format)
+        print("Argument [output_compression]:", args.output_compression)
+        print("Argument [predictor]:", args.predictor)
+        print("Argument [model_cache_dir]:", args.model_cache_dir)
+        print("Argument [model_cache_size]:", args.model_cache_size)
+        print("Argument [validate]:", args.validate)
+        print("Argument [metrics_file]:", args.metrics_file)
+        print("Argument [rescore]:", args.rescore)
+        print("Argument [include]:", args.include)
+        print("Argument [exclude]:", args.exclude)
+        print("Argument [start_date]:", args.start_date)
+        print("Argument [end_date]:", args.end_date)
+        print("Argument [input_storage_url]:", args.input_storage_url)
+        print("Argument [output_storage_url]:", args.output_storage_url)
+        print("Argument [storage_concurrency]:", args.storage_concurrency)
+
+        # Initialise model and logger, the model cache size is given in megabytes
+        model_cache = ModelCache(
+            args.model_cache_dir,
+            args.model_cache_size * 1024 * 1024,
+            AzureModelRegistry(run.experiment.workspace),
+        )
+        model_path = set_model(args.build_id, model_cache, args.predictor)
         set_logger()
 
-        # Change current working directory to input_datapath
-        os.chdir(args.input_datapath)
-
         # Create output directory
         os.makedirs(args.output_datapath, exist_ok=True)
 
-        # Define files to score
-        files_to_score = glob.glob(file_type)
-        print("Scoring files:", files_to_score)
-        logger.info({"files_to_score": files_to_score})
-
-        # Score files
-        for idx, file_name in enumerate(files_to_score):
-            # Define file path for data
-            input_file_path = os.path.join(args.input_datapath, file_name)
-
-            # Define file path to write results
-            current_date = datetime.today().strftime("%Y_%m_%d_%H_%M")
-            output_file_name = f"{current_date}_{idx}.csv"
-            output_file_path = os.path.join(args.output_datapath, output_file_name)
-
-            # Score file and write results to output directory
-            df = score_data(input_file_path)
-            write_data(df, output_file_path)
+        # Stream files to score as the input directory is walked, skipping files
+        # recorded in the manifest stored next to the outputs
+        manifest = ScoreManifest(
+            os.path.join(args.output_datapath, manifest_file_name),
+            args.input_datapath,
+            get_output_files() if args.output_storage_url else None,
+        )
+
+        # Score files staged from storage instead of the mounted input directory
+        if args.input_storage_url:
+            stage_input_files(manifest)
+
+        file_paths = get_file_paths(None if args.rescore else manifest)
+
+        # Score files in a process pool, in a prefetching pipeline or one after
+        # another, uploading the scored files to storage even if a file failed
+        try:
+            if args.workers > 1:
+                file_metrics = score_files_parallel(file_paths, model_path, manifest)
+            elif args.prefetch > 0:
+                reset_peak_rss()
+                file_metrics = score_files_prefetch(file_paths, manifest)
+                log_process_peak_rss()
+            else:
+                file_metrics = []
+
+                for input_file_path, output_file_path in file_paths:
+                    file_metrics.append(score_file(input_file_path, output_file_path))
+                    log_file_metrics(file_metrics[-1])
+                    manifest.record(input_file_path, output_file_path, args.build_id)
+        finally:
+            if args.output_storage_url:
+                upload_output_files(manifest)
+
+            remove_replaced_files(manifest)
+
+        # Write the stage metrics of every file as a local summary
+        write_summary(file_metrics, args.metrics_file)
+        print("Scored files:", len(file_metrics))
+        logger.info({"scored_files": len(file_metrics)})
 
         print("Completed Job")
 
@@ -61,9 +61,11 @@ def create_pipeline(workspace):
         name=args.environment_name, file_path=args.environment_specification
     )
 
-    # Add environment variables
+    # Add environment variables, the repository root is added to the python path so
+    # scripts can import the shared modules in src
     environment.environment_variables = {
-        "APPLICATIONINSIGHTS_CONNECTION_STRING": args.ai_connection_string
+        "APPLICATIONINSIGHTS_CONNECTION_STRING": args.ai_connection_string,
+        "PYTHONPATH": ".",
     }
 
     # Enable docker run
@@ -98,8 +100,8 @@ def create_pipeline(workspace):
     score_step = PythonScriptStep(
         name="score_data",
         compute_target=compute_target,
-        source_directory="src/score",
-        script_name="score.py",
+        source_directory=".",
+        script_name="src/score/score.py",
         inputs=[input_datapath_param, output_datapath_param],
         runconfig=run_config,
         allow_reuse=False,
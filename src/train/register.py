@@ -1,4 +1,3 @@
-import logging
 import sys
 import traceback
 from argparse import ArgumentParser
@@ -6,7 +5,7 @@ from argparse import ArgumentParser
 import sklearn
 from azureml.core import Dataset, Run, Workspace
 from azureml.core.model import Model
-from opencensus.ext.azure.log_exporter import AzureLogHandler
+from src.utils.telemetry import get_logger
 
 run = None
 logger = None
@@ -18,11 +17,9 @@ def set_logger():
     global run
     global logger
 
-    # Add the app insights logger to the python logger
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(logging.StreamHandler())
-    logger.addHandler(AzureLogHandler())
+    # Add the app insights logger to the python logger, records are exported in
+    # batches from a background thread
+    logger = get_logger(__name__)
 
     # Get pipeline information
     custom_dimensions = {
@@ -42,6 +39,7 @@ def parse_args(argv):
     ap.add_argument("--model_name", required=True)
     ap.add_argument("--dataset_name", required=True)
     ap.add_argument("--build_id", required=True)
+    ap.add_argument("--register_unevaluated", action="store_true")
 
     args, _ = ap.parse_known_args(argv)
     return args
@@ -60,8 +58,8 @@ def register_model(model_name, dataset_name, build_id):
     # Get evaluation metric for model
     run_metrics = run.parent.get_metrics()
 
-    # Define model file name
-    model_file_name = "model.pkl"
+    # Define model folder name
+    model_folder_name = "model"
 
     # Define model tags
     model_tags = {
@@ -74,7 +72,7 @@ def register_model(model_name, dataset_name, build_id):
     # Register the model
     model = run.parent.register_model(
         model_name=model_name,
-        model_path=model_file_name,
+        model_path=model_folder_name,
         model_framework=Model.Framework.SCIKITLEARN,
         model_framework_version=sklearn.__version__,
         datasets=train_dataset,
@@ -102,10 +100,25 @@ def main():
         print("Argument [model_name]:", args.model_name)
         print("Argument [dataset_name]:", args.dataset_name)
         print("Argument [build_id]:", args.build_id)
+        print("Argument [register_unevaluated]:", args.register_unevaluated)
 
         # Get evaluation metric for model
         run_metrics = run.parent.get_metrics()
 
+        # Models without an evaluation metric are only registered if explicitly
+        # allowed, otherwise the run is cancelled as for a model below the threshold
+        if run_metrics.get(evaluation_metric) is None:
+            print("Variable [model_metric]: not evaluated")
+
+            if args.register_unevaluated:
+                register_model(
+                    args.model_name, args.dataset_name, args.build_id,
+                )
+            else:
+                run.parent.cancel()
+
+            return
+
         model_metric = float(run_metrics.get(evaluation_metric))
         print("Variable [model_metric]:", model_metric)
 
@@ -1,30 +1,85 @@
-import logging
+import operator
 import os
+import sys
+import time
 import traceback
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
 
 import joblib
 import numpy as np
 from azureml.core import Run
-from opencensus.ext.azure.log_exporter import AzureLogHandler
-from scipy import stats
+from azureml.core.model import Model
+from joblib import parallel_backend
+from sklearn.base import clone
 from sklearn.compose import ColumnTransformer
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import cross_validate
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.model_selection import cross_validate, train_test_split
 from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-
+from sklearn.preprocessing import StandardScaler
+from src.features.encoders import CategoryCodeEncoder
+from src.features.features import (
+    add_bmi,
+    build_feature_metadata,
+    get_categories,
+    get_model_features,
+    raw_feature_dtypes,
+    read_feature_metadata,
+    target,
+    write_feature_metadata,
+)
+from src.utils.compiled_model import compile_model, save_compiled_model
+from src.utils.deduplication import (
+    Deduplicator,
+    deduplicate_chunks,
+    get_duplicate_mask,
+)
+from src.utils.formats import concat_chunks, read_file
+from src.utils.telemetry import get_logger
+
+args = None
 run = None
 logger = None
+model_folder_name = "model"
+model_file_name = "model.pkl"
+feature_metadata_file_name = "features.json"
+compiled_model_folder_name = "compiled"
+dataset_folder_name = "dataset"
+previous_model_folder_name = "previous_model"
+cv_backends = {"process": "loky", "thread": "threading"}
+outlier_zscore = 6
+block_rows = 1_000_000
+
+# Define data types of the training data
+training_dtypes = {**raw_feature_dtypes, target: np.float64}
+
+
+def parse_args(argv):
+    ap = ArgumentParser("train")
+
+    ap.add_argument("--cv_folds", type=int, default=10)
+    ap.add_argument("--cv_jobs", type=int, default=1)
+    ap.add_argument("--cv_backend", choices=list(cv_backends), default="process")
+    ap.add_argument("--skip_cv", action="store_true")
+    ap.add_argument("--parallel_final_fit", action="store_true")
+    ap.add_argument("--solver", choices=["liblinear", "lbfgs"], default="liblinear")
+    ap.add_argument("--warm_start", action="store_true")
+    ap.add_argument("--chunk_rows", type=int, default=None)
+    ap.add_argument("--train_mode", choices=["full", "incremental"], default="full")
+    ap.add_argument("--model_name", default=None)
+
+    args, _ = ap.parse_known_args(argv)
+
+    return args
 
 
 def set_logger():
     global logger
 
-    # Add the app insights logger to the python logger
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(logging.StreamHandler())
-    logger.addHandler(AzureLogHandler())
+    # Add the app insights logger to the python logger, records are exported in
+    # batches from a background thread
+    logger = get_logger(__name__)
 
     # Get pipeline information
     custom_dimensions = {
@@ -46,84 +101,158 @@ def load_data():
     # Convert dataset to pandas dataframe
     df = dataset.to_pandas_dataframe()
 
-    # Convert strings to float
-    df = df.astype(
-        {
-            "age": np.float64,
-            "height": np.float64,
-            "weight": np.float64,
-            "systolic": np.float64,
-            "diastolic": np.float64,
-            "cardiovascular_disease": np.float64,
-        }
-    )
+    # Convert strings to float and categorical features to categories
+    df = df.astype(training_dtypes)
 
     return df
 
 
-def preprocess_data(df):
-    # Remove missing values
-    df.dropna(inplace=True)
+def get_dataset_files():
+    # Retreive dataset
+    dataset = run.input_datasets["InputDataset"]
 
-    # Drop duplicates
-    df.drop_duplicates(inplace=True)
+    # Download dataset as parquet files instead of converting it to one dataframe
+    return dataset.to_parquet_files().download(
+        target_path=dataset_folder_name, overwrite=True
+    )
 
-    # Remove records where height or weight is more than 6 std from mean
-    df = df[(np.abs(stats.zscore(df.height)) < 6)]
-    df = df[(np.abs(stats.zscore(df.weight)) < 6)]
 
-    # Create feature for Body Mass Index (indicator of heart health)
-    df["bmi"] = df.weight / (df.height / 100) ** 2
+def get_dataset_partitions(trained_partitions=()):
+    # Retreive dataset
+    dataset = run.input_datasets["InputDataset"]
+
+    # A dataset without partition keys is a single partition identified by the id
+    # of its registered version
+    if not dataset.partition_keys:
+        if dataset.id in trained_partitions:
+            return {}
+
+        return {dataset.id: get_dataset_files()}
+
+    # Identify partitions by the partition key values of their source files, and
+    # only download the partitions which have not been trained on
+    partitions = {}
+
+    for values in dataset.get_partition_key_values():
+        partition = "/".join(f"{key}={values[key]}" for key in dataset.partition_keys)
+
+        if partition in trained_partitions:
+            continue
+
+        partition_dataset = dataset.filter(
+            reduce(
+                operator.and_,
+                [dataset[key] == values[key] for key in dataset.partition_keys],
+            )
+        )
+        partitions[partition] = partition_dataset.to_parquet_files().download(
+            target_path=os.path.join(dataset_folder_name, partition), overwrite=True
+        )
+
+    return partitions
+
+
+def read_data_chunks(file_paths, chunk_rows, file_format="parquet"):
+    # Read files as chunks with data types and categories applied at read time
+    for file_path in file_paths:
+        yield from read_file(
+            file_path,
+            file_format,
+            columns=list(training_dtypes),
+            dtype=training_dtypes,
+            chunk_rows=chunk_rows,
+        )
+
+
+def load_data_chunks(chunk_rows, file_paths=None, file_format="parquet"):
+    # Read chunks from the dataset files, or from local files if given
+    file_paths = file_paths or get_dataset_files()
+    chunks = read_data_chunks(file_paths, chunk_rows, file_format)
+
+    # Drop duplicates while the chunks are read and assemble the remaining rows
+    # column by column into a single dataframe
+    deduplicator = Deduplicator()
+    df = concat_chunks(deduplicate_chunks(chunks, deduplicator))
+
+    print("Variable [dropped_rows_duplicate_chunks]:", deduplicator.duplicate_rows)
+    run.log("dropped_rows_duplicate_chunks", deduplicator.duplicate_rows)
 
     return df
 
 
-def train_model(df):
-    # Define categorical features
-    categorical_features = [
-        "gender",
-        "cholesterol",
-        "glucose",
-        "smoker",
-        "alcoholic",
-        "active",
-    ]
+def get_outlier_mask(values, kept):
+    # Use the mean and std of the rows kept so far, as scipy's zscore would
+    mean = values[kept].mean()
+    std = values[kept].std()
 
-    # Define numeric features
-    numeric_features = ["age", "systolic", "diastolic", "bmi"]
+    # Flag values more than outlier_zscore std from the mean, block by block so
+    # temporary arrays stay small on large datasets
+    outliers = np.empty(len(values), dtype=bool)
 
-    # Get model features / target
-    X = df.drop(
-        labels=["height", "weight", "cardiovascular_disease", "datetime"],
-        axis=1,
-        errors="ignore",
-    )
-    y = df.cardiovascular_disease
+    for start in range(0, len(values), block_rows):
+        end = start + block_rows
+        zscore = np.abs((values[start:end] - mean) / std)
+        outliers[start:end] = ~(zscore < outlier_zscore)
 
-    # Convert data types of model features
-    X[categorical_features] = X[categorical_features].astype(np.object)
-    X[numeric_features] = X[numeric_features].astype(np.float64)
+    return outliers
 
-    # Define model pipeline
+
+def preprocess_data(df, deduplicated=False):
+    # Flag records with missing values and duplicates of earlier records, unless
+    # duplicates were already dropped while the records were loaded in chunks
+    missing = df.isna().any(axis=1).to_numpy()
+    kept = ~missing
+    dropped_rows = {"missing": missing}
+
+    if not deduplicated:
+        duplicate = get_duplicate_mask(df, block_rows) & ~missing
+        kept &= ~duplicate
+        dropped_rows["duplicate"] = duplicate
+
+    # Flag records where height or weight is more than 6 std from mean, the weight
+    # statistics are computed after removing height outliers
+    height = df["height"].to_numpy(dtype=np.float64)
+    height_outlier = get_outlier_mask(height, kept) & kept
+    kept &= ~height_outlier
+
+    weight = df["weight"].to_numpy(dtype=np.float64)
+    weight_outlier = get_outlier_mask(weight, kept) & kept
+    kept &= ~weight_outlier
+
+    # Log the number of records removed by each rule
+    dropped_rows["height_outlier"] = height_outlier
+    dropped_rows["weight_outlier"] = weight_outlier
+
+    for rule, mask in dropped_rows.items():
+        print(f"Variable [dropped_rows_{rule}]:", int(mask.sum()))
+        run.log(f"dropped_rows_{rule}", int(mask.sum()))
+
+    # Remove flagged records with a single copy of the dataframe
+    df = df.take(np.flatnonzero(kept))
+
+    # Create feature for Body Mass Index (indicator of heart health)
+    df = add_bmi(df)
+
+    return df
+
+
+def build_preprocessor(feature_metadata, n_jobs=1):
+    # Scale numeric features and encode categorical features with the category
+    # vocabularies of the feature metadata
     scaler = StandardScaler()
-    onehotencoder = OneHotEncoder(categories="auto")
-    classifier = LogisticRegression(random_state=0, solver="liblinear")
+    encoder = CategoryCodeEncoder(categories=get_categories(feature_metadata))
 
-    preprocessor = ColumnTransformer(
+    return ColumnTransformer(
         transformers=[
-            ("numeric", scaler, numeric_features),
-            ("categorical", onehotencoder, categorical_features),
+            ("numeric", scaler, feature_metadata["numeric_features"]),
+            ("categorical", encoder, feature_metadata["categorical_features"]),
         ],
         remainder="drop",
+        n_jobs=n_jobs,
     )
 
-    pipeline = Pipeline(
-        steps=[("preprocessor", preprocessor), ("classifier", classifier)]
-    )
-
-    # Train / evaluate performance of logistic regression classifier
-    cv_results = cross_validate(pipeline, X, y, cv=10, return_train_score=True)
 
+def log_cv_results(cv_results, cv_time, n_jobs):
     # Log average train / test accuracy
     for run_context in [run, run.parent]:
         run_context.log("train_acccuracy", round(cv_results["train_score"].mean(), 4))
@@ -131,6 +260,9 @@ def train_model(df):
 
         # Log performance metrics for data
         for metric in cv_results.keys():
+            if metric == "estimator":
+                continue
+
             run_context.log_row(
                 "K-Fold CV Metrics",
                 metric=metric.replace("_", " "),
@@ -138,37 +270,319 @@ def train_model(df):
                 std="{:.2%}".format(cv_results[metric].std()),
             )
 
+        # Log fold timings to compare how cross validation scales with n_jobs
+        run_context.log("cv_time", round(cv_time, 4))
+        run_context.log("cv_jobs", n_jobs)
+        run_context.log_list("cv_fit_time", cv_results["fit_time"].round(4).tolist())
+        run_context.log_list(
+            "cv_score_time", cv_results["score_time"].round(4).tolist()
+        )
+
+
+def evaluate_model(pipeline, X, y, cv_folds, n_jobs, backend, return_estimator):
+    # Train / evaluate performance of logistic regression classifier, fitting the
+    # folds in parallel in worker processes or threads
+    cv_start = time.perf_counter()
+
+    with parallel_backend(cv_backends[backend], n_jobs=n_jobs):
+        cv_results = cross_validate(
+            pipeline,
+            X,
+            y,
+            cv=cv_folds,
+            n_jobs=n_jobs,
+            return_train_score=True,
+            return_estimator=return_estimator,
+        )
+
+    log_cv_results(cv_results, time.perf_counter() - cv_start, n_jobs)
+
+    return cv_results
+
+
+def set_warm_start(pipeline, cv_results):
+    # Seed the solver with the mean coefficients of the fold models
+    fold_classifiers = [
+        estimator.named_steps["classifier"] for estimator in cv_results["estimator"]
+    ]
+    classifier = pipeline.named_steps["classifier"]
+    classifier.set_params(warm_start=True)
+    classifier.coef_ = np.mean([fold.coef_ for fold in fold_classifiers], axis=0)
+    classifier.intercept_ = np.mean(
+        [fold.intercept_ for fold in fold_classifiers], axis=0
+    )
+
+
+def fit_model(pipeline, X, y):
     # Fit model
+    fit_start = time.perf_counter()
     pipeline.fit(X, y)
 
+    for run_context in [run, run.parent]:
+        run_context.log("final_fit_time", round(time.perf_counter() - fit_start, 4))
+
     return pipeline
 
 
+def train_model(
+    df,
+    feature_metadata=None,
+    cv_folds=10,
+    n_jobs=1,
+    backend="process",
+    skip_cv=False,
+    parallel_final_fit=False,
+    solver="liblinear",
+    warm_start=False,
+):
+    # Record feature metadata from the training data if not provided
+    if feature_metadata is None:
+        feature_metadata = build_feature_metadata(df)
+
+    # Get model features / target
+    X = get_model_features(
+        df, feature_metadata["feature_columns"], feature_metadata["categories"]
+    )
+    y = df[target]
+
+    # Define model pipeline, using the category vocabularies recorded above
+    preprocessor = build_preprocessor(feature_metadata, n_jobs)
+    classifier = LogisticRegression(random_state=0, solver=solver)
+
+    pipeline = Pipeline(
+        steps=[("preprocessor", preprocessor), ("classifier", classifier)]
+    )
+
+    # Fast retrain mode only fits the final model, holding out one fold to score it
+    # so the registration step can still check the evaluation metric
+    if skip_cv:
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=1 / cv_folds, random_state=0
+        )
+        pipeline = fit_model(pipeline, X_train, y_train)
+
+        for run_context in [run, run.parent]:
+            run_context.log("skip_cv", 1)
+            run_context.log("test_acccuracy", round(pipeline.score(X_test, y_test), 4))
+
+        return pipeline
+
+    # Fit the final model in a background thread while the folds are evaluated,
+    # in which case it cannot be warm started from the fold models
+    if parallel_final_fit:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            final_fit = executor.submit(fit_model, clone(pipeline), X, y)
+            evaluate_model(pipeline, X, y, cv_folds, n_jobs, backend, False)
+
+            return final_fit.result()
+
+    # Warm starting is only supported by the lbfgs solver, liblinear ignores it
+    warm_start = warm_start and solver != "liblinear"
+    cv_results = evaluate_model(pipeline, X, y, cv_folds, n_jobs, backend, warm_start)
+
+    if warm_start:
+        set_warm_start(pipeline, cv_results)
+
+    return fit_model(pipeline, X, y)
+
+
+def load_previous_model(model_name):
+    # Find the latest registered version of the model
+    model_list = Model.list(run.experiment.workspace, name=model_name, latest=True)
+
+    if not model_list:
+        return None, None
+
+    # Download the model folder and deserialize the model and its feature metadata
+    model_path = model_list[0].download(
+        target_dir=previous_model_folder_name, exist_ok=True
+    )
+    model = joblib.load(os.path.join(model_path, model_file_name))
+    feature_metadata = read_feature_metadata(
+        os.path.join(model_path, feature_metadata_file_name)
+    )
+
+    print("Variable [previous_model]:", {"model_id": model_list[0].id})
+
+    return model, feature_metadata
+
+
+def build_incremental_model(feature_metadata):
+    # Define a model pipeline with a classifier that can be updated with partial_fit
+    preprocessor = build_preprocessor(feature_metadata)
+    classifier = SGDClassifier(loss="log", random_state=0)
+
+    return Pipeline(steps=[("preprocessor", preprocessor), ("classifier", classifier)])
+
+
+def partial_fit_model(model, X, y):
+    # Update the classifier on the chunk with the frozen preprocessor
+    model.named_steps["classifier"].partial_fit(
+        model.named_steps["preprocessor"].transform(X),
+        y,
+        classes=np.array([0.0, 1.0]),
+    )
+
+    return model
+
+
+def train_model_incremental(df, feature_metadata, model=None, chunk_rows=block_rows):
+    # Resume from the previous model or start a new incremental model
+    model = model or build_incremental_model(feature_metadata)
+
+    # Get model features / target
+    X = get_model_features(
+        df, feature_metadata["feature_columns"], feature_metadata["categories"]
+    )
+    y = df[target]
+
+    fit_start = time.perf_counter()
+    correct_rows, evaluated_rows = 0, 0
+
+    # Fit the preprocessor on all rows of a new model and freeze it afterwards, as
+    # updating the scaling would shift the features under the learned coefficients
+    preprocessor = model.named_steps["preprocessor"]
+
+    if not hasattr(preprocessor, "transformers_"):
+        preprocessor.fit(X)
+
+    for start in range(0, len(X), chunk_rows):
+        end = start + chunk_rows
+        X_chunk, y_chunk = X.iloc[start:end], y.iloc[start:end]
+
+        # Evaluate each chunk before learning from it (progressive validation)
+        if hasattr(model.named_steps["classifier"], "coef_"):
+            correct_rows += int((model.predict(X_chunk) == y_chunk).sum())
+            evaluated_rows += len(X_chunk)
+
+        partial_fit_model(model, X_chunk, y_chunk)
+
+    # Log progressive validation accuracy, a new model trained on a single chunk
+    # has no evaluation metric and is only registered if explicitly allowed
+    for run_context in [run, run.parent]:
+        run_context.log("incremental_rows", len(X))
+        run_context.log("final_fit_time", round(time.perf_counter() - fit_start, 4))
+
+        if evaluated_rows:
+            run_context.log("test_acccuracy", round(correct_rows / evaluated_rows, 4))
+        else:
+            run_context.log("skip_cv", 1)
+
+    return model
+
+
+def train_incremental(model_name, chunk_rows=None, partitions=None):
+    # Resume from the previous model if it can be updated with partial_fit
+    model, feature_metadata = load_previous_model(model_name)
+
+    if model is not None and not hasattr(
+        model.named_steps["classifier"], "partial_fit"
+    ):
+        print("Variable [previous_model]: not incremental, training a new model")
+        model, feature_metadata = None, None
+
+    # Only train on dataset partitions which the previous model has not seen, the
+    # partitions map partition keys to their downloaded files
+    trained_partitions = (feature_metadata or {}).get("trained_partitions", [])
+    partitions = {
+        partition: partition_file_paths
+        for partition, partition_file_paths in (
+            partitions or get_dataset_partitions(trained_partitions)
+        ).items()
+        if partition not in trained_partitions
+    }
+
+    if not partitions:
+        raise Exception("No new dataset partitions to train on")
+
+    print("Variable [new_partitions]:", list(partitions))
+    file_paths = [
+        file_path
+        for partition_file_paths in partitions.values()
+        for file_path in partition_file_paths
+    ]
+
+    # Load and pre-process the new partitions
+    df = preprocess_data(
+        load_data_chunks(chunk_rows or block_rows, file_paths), deduplicated=True
+    )
+    feature_metadata = feature_metadata or build_feature_metadata(df)
+
+    # Update the model and record the partitions it was trained on
+    model = train_model_incremental(
+        df, feature_metadata, model, chunk_rows or block_rows
+    )
+    feature_metadata["trained_partitions"] = trained_partitions + list(partitions)
+
+    return model, feature_metadata
+
+
 def main():
     try:
+        global args
         global run
 
         # Retrieve current service context
         run = Run.get_context()
 
+        # Parse command line arguments
+        args = parse_args(sys.argv[1:])
+
+        # Print argument values
+        print("Argument [cv_folds]:", args.cv_folds)
+        print("Argument [cv_jobs]:", args.cv_jobs)
+        print("Argument [cv_backend]:", args.cv_backend)
+        print("Argument [skip_cv]:", args.skip_cv)
+        print("Argument [parallel_final_fit]:", args.parallel_final_fit)
+        print("Argument [solver]:", args.solver)
+        print("Argument [warm_start]:", args.warm_start)
+        print("Argument [chunk_rows]:", args.chunk_rows)
+        print("Argument [train_mode]:", args.train_mode)
+        print("Argument [model_name]:", args.model_name)
+
         # Set logger
         set_logger()
 
         # Load data, pre-process data, train and evaluate model
-        df = load_data()
-        df = preprocess_data(df)
-        model = train_model(df)
-
-        # Define model file name
-        model_file_name = "model.pkl"
-
-        # Upload model file to run outputs for history
-        os.makedirs("outputs", exist_ok=True)
-        output_path = os.path.join("outputs", model_file_name)
-        joblib.dump(value=model, filename=output_path)
+        if args.train_mode == "incremental":
+            model, feature_metadata = train_incremental(
+                args.model_name, args.chunk_rows
+            )
+        else:
+            if args.chunk_rows:
+                df = preprocess_data(
+                    load_data_chunks(args.chunk_rows), deduplicated=True
+                )
+            else:
+                df = preprocess_data(load_data())
+            feature_metadata = build_feature_metadata(df)
+            model = train_model(
+                df,
+                feature_metadata,
+                args.cv_folds,
+                args.cv_jobs,
+                args.cv_backend,
+                args.skip_cv,
+                args.parallel_final_fit,
+                args.solver,
+                args.warm_start,
+            )
 
-        # Upload model to parent run
-        run.parent.upload_file(name=model_file_name, path_or_stream=output_path)
+        # Write model and feature metadata to run outputs for history
+        output_path = os.path.join("outputs", model_folder_name)
+        os.makedirs(output_path, exist_ok=True)
+        joblib.dump(value=model, filename=os.path.join(output_path, model_file_name))
+        write_feature_metadata(
+            feature_metadata, os.path.join(output_path, feature_metadata_file_name)
+        )
+
+        # Write the compiled model as memory mappable arrays for scoring workers
+        save_compiled_model(
+            compile_model(model), os.path.join(output_path, compiled_model_folder_name)
+        )
+
+        # Upload model folder to parent run
+        run.parent.upload_folder(name=model_folder_name, path=output_path)
 
         run.complete()
 
@@ -59,9 +59,11 @@ def create_pipeline(workspace):
         name=args.environment_name, file_path=args.environment_specification
     )
 
-    # Add environment variables
+    # Add environment variables, the repository root is added to the python path so
+    # scripts can import the shared modules in src
     environment.environment_variables = {
-        "APPLICATIONINSIGHTS_CONNECTION_STRING": args.ai_connection_string
+        "APPLICATIONINSIGHTS_CONNECTION_STRING": args.ai_connection_string,
+        "PYTHONPATH": ".",
     }
 
     # Enable docker run
@@ -87,23 +89,33 @@ def create_pipeline(workspace):
     # Define build id paramater
     build_id_param = PipelineParameter(name="build_id", default_value=args.build_id)
 
+    # Define train mode paramater, incremental training resumes from the latest
+    # registered version of the model
+    train_mode_param = PipelineParameter(name="train_mode", default_value="full")
+
     # Define train model step for pipeline
     train_step = PythonScriptStep(
         name="train_model",
         compute_target=compute_target,
-        source_directory="src/train",
-        script_name="train.py",
+        source_directory=".",
+        script_name="src/train/train.py",
         inputs=[input_dataset.as_named_input("InputDataset")],
         runconfig=run_config,
         allow_reuse=False,
+        arguments=[
+            "--model_name",
+            model_name_param,
+            "--train_mode",
+            train_mode_param,
+        ],
     )
 
     # Define register model step for pipeline
     register_step = PythonScriptStep(
         name="register_model",
         compute_target=compute_target,
-        source_directory="src/train",
-        script_name="register.py",
+        source_directory=".",
+        script_name="src/train/register.py",
         runconfig=run_config,
         allow_reuse=False,
         arguments=[
@@ -0,0 +1,181 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from src.features.encoders import get_category_codes
+
+manifest_file_name = "manifest.json"
+numeric_weights_file_name = "numeric_weights.npy"
+category_weights_file_name = "category_weights.npy"
+artifact_version = 1
+
+
+class CompiledModel:
+    def __init__(
+        self,
+        intercept,
+        numeric_features,
+        numeric_weights,
+        categorical_features,
+        categories,
+        category_weights,
+    ):
+        self.intercept = float(intercept)
+        self.numeric_features = list(numeric_features)
+        self.numeric_weights = np.asarray(numeric_weights, dtype=np.float64)
+        self.categorical_features = list(categorical_features)
+        self.categories = [pd.Index(feature) for feature in categories]
+        self.category_weights = [
+            np.asarray(weights, dtype=np.float64) for weights in category_weights
+        ]
+
+    def decision_function(self, df):
+        # Accumulate weighted numeric features column by column, so the result of
+        # a row does not depend on the other rows being scored
+        decision = np.full(len(df), self.intercept)
+
+        for feature, weight in zip(self.numeric_features, self.numeric_weights):
+            values = df[feature].to_numpy(dtype=np.float64)
+
+            # Reject missing values as the sklearn model does, instead of scoring them
+            if not np.isfinite(values).all():
+                raise ValueError(f"Input contains NaN or infinity: {feature}")
+
+            decision += values * weight
+
+        # Add the weight of each category from its lookup table
+        for feature, categories, weights in zip(
+            self.categorical_features, self.categories, self.category_weights
+        ):
+            decision += weights[get_category_codes(df[feature], categories)]
+
+        return decision
+
+    def predict_proba(self, df):
+        # Apply the sigmoid function in place to get the positive class probability
+        probability = np.negative(self.decision_function(df))
+
+        with np.errstate(over="ignore"):
+            np.exp(probability, out=probability)
+
+        probability += 1
+        np.reciprocal(probability, out=probability)
+
+        return np.column_stack([1 - probability, probability])
+
+
+def compile_model(pipeline):
+    # Get the fitted preprocessor and classifier from the model pipeline
+    preprocessor = pipeline.named_steps["preprocessor"]
+    classifier = pipeline.named_steps["classifier"]
+
+    if classifier.coef_.shape[0] != 1:
+        raise ValueError("Only binary linear classifiers can be compiled")
+
+    coefficients = classifier.coef_[0]
+    intercept = np.ravel(classifier.intercept_)[0]
+
+    numeric_features, numeric_weights = [], []
+    categorical_features, categories, category_weights = [], [], []
+    offset = 0
+
+    # Fold each transformer into weights on the raw features, in output order
+    for name, transformer, columns in preprocessor.transformers_:
+        if transformer == "drop" or name == "remainder":
+            continue
+
+        if hasattr(transformer, "scale_"):
+            # Standard scaling is folded into the weights and the intercept
+            weights = coefficients[offset:offset + len(columns)]
+            scale = transformer.scale_ if transformer.scale_ is not None else 1.0
+            mean = transformer.mean_ if transformer.with_mean else 0.0
+
+            numeric_features.extend(columns)
+            numeric_weights.extend(weights / scale)
+            intercept -= np.sum(weights * mean / scale)
+            offset += len(columns)
+
+        elif hasattr(transformer, "categories_"):
+            # One hot encoding: each category selects a single weight
+            if getattr(transformer, "drop_idx_", None) is not None:
+                raise ValueError("Encoders with dropped categories are not supported")
+
+            for column, column_categories in zip(columns, transformer.categories_):
+                categorical_features.append(column)
+                categories.append(column_categories)
+                category_weights.append(
+                    coefficients[offset:offset + len(column_categories)]
+                )
+                offset += len(column_categories)
+
+        else:
+            raise ValueError(f"Unsupported transformer: {name}")
+
+    if offset != len(coefficients):
+        raise ValueError("Model features do not match classifier coefficients")
+
+    return CompiledModel(
+        intercept,
+        numeric_features,
+        numeric_weights,
+        categorical_features,
+        categories,
+        category_weights,
+    )
+
+
+def save_compiled_model(compiled_model, path):
+    # Write the weights as uncompressed numpy arrays so they can be memory mapped,
+    # with the lookup tables of all categorical features stored as one array
+    os.makedirs(path, exist_ok=True)
+    np.save(
+        os.path.join(path, numeric_weights_file_name), compiled_model.numeric_weights
+    )
+    np.save(
+        os.path.join(path, category_weights_file_name),
+        np.concatenate([np.empty(0)] + compiled_model.category_weights),
+    )
+
+    # Write the feature names, categories and intercept to a small manifest
+    manifest = {
+        "version": artifact_version,
+        "intercept": compiled_model.intercept,
+        "numeric_features": compiled_model.numeric_features,
+        "categorical_features": compiled_model.categorical_features,
+        "categories": [categories.tolist() for categories in compiled_model.categories],
+    }
+
+    with open(os.path.join(path, manifest_file_name), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_compiled_model(path, mmap_mode="r"):
+    # Read the manifest and memory map the weights, so the pages are shared by
+    # every process that loads the same artifact
+    with open(os.path.join(path, manifest_file_name)) as f:
+        manifest = json.load(f)
+
+    if manifest["version"] != artifact_version:
+        raise ValueError(f"Unsupported compiled model version: {manifest['version']}")
+
+    numeric_weights = np.load(
+        os.path.join(path, numeric_weights_file_name), mmap_mode=mmap_mode
+    )
+    category_weights = np.load(
+        os.path.join(path, category_weights_file_name), mmap_mode=mmap_mode
+    )
+
+    # Split the lookup tables into views of the memory mapped array
+    offsets = np.cumsum(
+        [0] + [len(categories) for categories in manifest["categories"]]
+    )
+
+    return CompiledModel(
+        manifest["intercept"],
+        manifest["numeric_features"],
+        numeric_weights,
+        manifest["categorical_features"],
+        manifest["categories"],
+        [category_weights[start:end] for start, end in zip(offsets, offsets[1:])],
+    )
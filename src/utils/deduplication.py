@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+
+def hash_rows(df):
+    # Hash the values of each row into a single 64-bit integer
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class Deduplicator:
+    def __init__(self):
+        # Sorted hashes of every row kept so far
+        self.seen = np.empty(0, dtype=np.uint64)
+        self.duplicate_rows = 0
+
+    def get_duplicate_mask(self, df):
+        # Flag rows whose hash was already seen in this or an earlier chunk, rows
+        # are assumed equal if their 64-bit hashes are equal
+        hashes = hash_rows(df)
+
+        _, first = np.unique(hashes, return_index=True)
+        duplicate = np.ones(len(hashes), dtype=bool)
+        duplicate[first] = False
+
+        if len(self.seen):
+            positions = np.minimum(
+                np.searchsorted(self.seen, hashes), len(self.seen) - 1
+            )
+            duplicate |= self.seen[positions] == hashes
+
+        self.duplicate_rows += int(duplicate.sum())
+
+        # Merge the new hashes into the sorted array, the stable sort merges the
+        # two sorted runs in linear time
+        self.seen = np.sort(
+            np.concatenate([self.seen, np.sort(hashes[~duplicate])]), kind="stable"
+        )
+
+        return duplicate
+
+
+def get_duplicate_mask(df, block_rows=1_000_000):
+    # Flag duplicates of earlier rows, hashing the dataframe block by block
+    deduplicator = Deduplicator()
+    masks = [np.empty(0, dtype=bool)]
+
+    for start in range(0, len(df), block_rows):
+        end = start + block_rows
+        masks.append(deduplicator.get_duplicate_mask(df.iloc[start:end]))
+
+    return np.concatenate(masks)
+
+
+def deduplicate_chunks(chunks, deduplicator=None):
+    # Drop duplicates of earlier rows from an iterator of dataframes
+    deduplicator = deduplicator or Deduplicator()
+
+    for df in chunks:
+        yield df[~deduplicator.get_duplicate_mask(df)]
@@ -0,0 +1,105 @@
+import fnmatch
+import os
+import re
+
+
+def parse_partition(value):
+    # Parse a date such as 2024-01-31 or 2024/01/31/05 into a partition tuple, keeping
+    # its precision so the bounds of a date range include the whole day or hour
+    if not value:
+        return None
+
+    return tuple(int(part) for part in re.split(r"[-/T :]", value) if part)[:4]
+
+
+def get_partition(parts):
+    # Get the partition of a relative directory in the yyyy/mm/dd/hh layout, or None
+    # if it is not a partition directory
+    if not parts or len(parts) > 4 or not all(part.isdigit() for part in parts):
+        return None
+
+    return tuple(int(part) for part in parts)
+
+
+def in_range(partition, start=None, end=None):
+    # Compare the partition with the bounds at their common precision
+    for bound, outside in [(start, lambda a, b: a < b), (end, lambda a, b: a > b)]:
+        if bound is not None:
+            precision = min(len(partition), len(bound))
+
+            if outside(partition[:precision], bound[:precision]):
+                return False
+
+    return True
+
+
+def matches(path, patterns):
+    return any(fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+
+def walk_files(
+    root_dir, include=None, exclude=None, start=None, end=None, skip_dirs=()
+):
+    # Yield the relative paths of matching files as directories are listed, pruning
+    # excluded directories and date partitions outside of the range before listing
+    # them, without changing the working directory
+    directories = [()]
+
+    # Skip directories such as the output folder when it is below the root folder,
+    # so outputs are never discovered as inputs
+    skip_dirs = {os.path.realpath(directory) for directory in skip_dirs}
+
+    while directories:
+        parts = directories.pop()
+
+        with os.scandir(os.path.join(root_dir, *parts)) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+
+        # Hidden entries such as temporary files are skipped, as by glob
+        subdirectories = []
+
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+
+            entry_parts = parts + (entry.name,)
+            path = "/".join(entry_parts)
+
+            if exclude and matches(path, exclude):
+                continue
+
+            if entry.is_dir():
+                if os.path.realpath(entry.path) in skip_dirs:
+                    continue
+
+                partition = get_partition(entry_parts)
+
+                if partition is None or in_range(partition, start, end):
+                    subdirectories.append(entry_parts)
+            elif not include or matches(path, include):
+                yield os.path.join(*entry_parts)
+
+        # Walk subdirectories depth first in name order
+        directories.extend(reversed(subdirectories))
+
+
+def select_file(path, include=None, exclude=None, start=None, end=None):
+    # Check a "/" separated relative path with the rules of walk_files, for file
+    # listings without directories such as blob storage
+    parts = tuple(path.split("/"))
+
+    for i in range(1, len(parts)):
+        if parts[i - 1].startswith(".") or (
+            exclude and matches("/".join(parts[:i]), exclude)
+        ):
+            return False
+
+        partition = get_partition(parts[:i])
+
+        if partition is not None and not in_range(partition, start, end):
+            return False
+
+    if parts[-1].startswith(".") or (exclude and matches(path, exclude)):
+        return False
+
+    return not include or matches(path, include)
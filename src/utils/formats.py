@@ -0,0 +1,396 @@
+import gzip
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Define file extensions and default compression for each supported file format
+file_extensions = {
+    "csv": [".csv"],
+    "parquet": [".parquet"],
+    "feather": [".feather", ".arrow"],
+}
+default_compression = {"csv": None, "parquet": "zstd", "feather": "zstd"}
+
+# Define file extensions of compressed CSV files
+compression_extensions = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz", "zip": ".zip"}
+
+
+def get_file_format(file_path, file_format=None):
+    # Use the given file format or infer it from the file extension
+    if file_format:
+        return file_format
+
+    root, extension = os.path.splitext(os.fspath(file_path).lower())
+
+    # Compressed CSV files have the compression after the CSV extension
+    if extension in compression_extensions.values():
+        extension = os.path.splitext(root)[1]
+
+        if extension not in file_extensions["csv"]:
+            raise ValueError(f"Unsupported file extension: {file_path}")
+
+    for file_format, extensions in file_extensions.items():
+        if extension in extensions:
+            return file_format
+
+    raise ValueError(f"Unsupported file extension: {file_path}")
+
+
+def get_file_extension(file_format, compression=None):
+    # CSV files are compressed as a whole, so the compression is added to their
+    # extension, parquet and feather files compress columns inside the file
+    extension = file_extensions[file_format][0]
+
+    if file_format != "csv" or not compression:
+        return extension
+
+    if compression not in compression_extensions:
+        raise ValueError(f"Unsupported CSV compression: {compression}")
+
+    return f"{extension}{compression_extensions[compression]}"
+
+
+def get_file_patterns(file_format=None):
+    # Get glob patterns for one file format or for all supported file formats
+    file_formats = [file_format] if file_format else list(file_extensions)
+
+    return [
+        f"*{extension}"
+        for file_format in file_formats
+        for extension in file_extensions[file_format]
+    ]
+
+
+def convert_dtypes(df, dtype=None):
+    # Convert columns which were not read with the requested data type
+    dtypes = {
+        column: column_dtype
+        for column, column_dtype in (dtype or {}).items()
+        if column in df.columns and df[column].dtype != column_dtype
+    }
+
+    return df.astype(dtypes) if dtypes else df
+
+
+def get_categorical_columns(schema, dtype=None):
+    # Get the columns of the schema requested as categories
+    return [
+        column
+        for column, column_dtype in (dtype or {}).items()
+        if column in schema.names and column_dtype == "category"
+    ]
+
+
+def to_pandas(table, dtype=None):
+    # Convert categorical columns straight from arrow into pandas categories, without
+    # creating an object array of strings first
+    categories = get_categorical_columns(table.schema, dtype)
+
+    return convert_dtypes(table.to_pandas(categories=categories), dtype)
+
+
+def select_schema(schema, columns=None):
+    # Get the schema of the requested columns
+    return (
+        pa.schema([schema.field(column) for column in columns]) if columns else schema
+    )
+
+
+def rebatch(batches, chunk_rows, schema):
+    # Regroup record batches into tables with exactly chunk_rows rows (except the last)
+    pending, pending_rows, chunks = [], 0, 0
+
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+
+        while pending_rows >= chunk_rows:
+            table = pa.Table.from_batches(pending, schema=schema)
+            yield table.slice(0, chunk_rows)
+
+            pending = table.slice(chunk_rows).to_batches()
+            pending_rows -= chunk_rows
+            chunks += 1
+
+    # Yield the remaining rows, or an empty table so empty files are still written
+    if pending_rows or not chunks:
+        yield pa.Table.from_batches(pending, schema=schema)
+
+
+def read_table_chunks(batches, chunk_rows, schema, dtype=None):
+    # Convert regrouped record batches to dataframes
+    for table in rebatch(batches, chunk_rows, schema):
+        yield to_pandas(table, dtype)
+
+
+def read_csv(file_path, columns=None, dtype=None, chunk_rows=None):
+    # Parse columns directly into the requested data types
+    return pd.read_csv(file_path, usecols=columns, dtype=dtype, chunksize=chunk_rows)
+
+
+def read_parquet(file_path, columns=None, dtype=None, chunk_rows=None):
+    # Only the requested columns are read from the file, string columns requested as
+    # categories are read as dictionary arrays instead of decoding every value
+    read_dictionary = get_categorical_columns(pq.read_schema(file_path), dtype)
+    parquet_file = pq.ParquetFile(file_path, read_dictionary=read_dictionary)
+    schema = select_schema(parquet_file.schema_arrow, columns)
+
+    if chunk_rows:
+        batches = parquet_file.iter_batches(batch_size=chunk_rows, columns=columns)
+        return read_table_chunks(batches, chunk_rows, schema, dtype)
+
+    return to_pandas(parquet_file.read(columns=columns), dtype)
+
+
+def read_feather(file_path, columns=None, dtype=None, chunk_rows=None):
+    # Memory map the file and only convert the requested columns
+    reader = pa.ipc.open_file(pa.memory_map(os.fspath(file_path)))
+    schema = select_schema(reader.schema, columns)
+
+    batches = (
+        reader.get_batch(idx).select(schema.names)
+        for idx in range(reader.num_record_batches)
+    )
+
+    if chunk_rows:
+        return read_table_chunks(batches, chunk_rows, schema, dtype)
+
+    table = pa.Table.from_batches(list(batches), schema=schema)
+    return to_pandas(table, dtype)
+
+
+def read_file(file_path, file_format=None, columns=None, dtype=None, chunk_rows=None):
+    # Read a file as a dataframe, or as an iterator of dataframes if chunk_rows is set
+    readers = {"csv": read_csv, "parquet": read_parquet, "feather": read_feather}
+    reader = readers[get_file_format(file_path, file_format)]
+
+    return reader(file_path, columns=columns, dtype=dtype, chunk_rows=chunk_rows)
+
+
+def append_values(buffer, values, rows):
+    # Append values to a buffer, doubling its capacity when it is full
+    end = rows + len(values)
+
+    if buffer is None or len(buffer) < end:
+        capacity = max(end, 2 * len(buffer) if buffer is not None else 0)
+        resized = np.empty(capacity, dtype=values.dtype)
+
+        if buffer is not None:
+            resized[:rows] = buffer[:rows]
+
+        buffer = resized
+
+    buffer[rows:end] = values
+
+    return buffer
+
+
+def concat_chunks(chunks):
+    # Copy chunks column by column into growing arrays, so only one chunk and one
+    # resized column are held in addition to the result
+    buffers, categories, rows = {}, {}, 0
+
+    for df in chunks:
+        for column in df.columns:
+            values = df[column]
+
+            # Categorical columns are stored as codes into a shared category list
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                lookup = categories.setdefault(column, {})
+                codes = [
+                    lookup.setdefault(category, len(lookup))
+                    for category in values.cat.categories
+                ]
+                codes = np.array(codes + [-1], dtype=np.int32)[values.cat.codes]
+                buffers[column] = append_values(buffers.get(column), codes, rows)
+            else:
+                buffers[column] = append_values(
+                    buffers.get(column), values.to_numpy(), rows
+                )
+
+        rows += len(df)
+
+    # Trim each column to the number of rows, one column at a time
+    columns = {}
+
+    for column in list(buffers):
+        values = buffers.pop(column)[:rows].copy()
+
+        if column in categories:
+            values = pd.Categorical.from_codes(
+                values, categories=list(categories[column])
+            )
+
+        columns[column] = values
+
+    # Columns are not consolidated into blocks, which would copy them again
+    return pd.DataFrame(columns, copy=False)
+
+
+class CsvWriter:
+    def __init__(self, file_path, compression=None, file_name=None):
+        self.file_path = file_path
+        self.compression = compression
+        # Name of the completed file, stored in compressed files instead of the name
+        # of the temporary file which is written
+        self.file_name = file_name or os.path.basename(file_path)
+        self.header = True
+        self.file = None
+        self.handle = None
+
+    def get_member_name(self):
+        # Name the CSV file inside a compressed file without the compression extension
+        extension = compression_extensions[self.compression]
+
+        if self.file_name.endswith(extension):
+            return self.file_name[:-len(extension)]
+
+        return self.file_name
+
+    def open(self):
+        # Write every chunk to a single gzip stream, which records the file name
+        self.file = open(self.file_path, "wb")
+        self.handle = io.TextIOWrapper(
+            gzip.GzipFile(self.get_member_name(), "wb", fileobj=self.file),
+            encoding="utf-8",
+            newline="",
+        )
+
+    def write(self, df):
+        if self.compression == "gzip":
+            if self.handle is None:
+                self.open()
+
+            df.to_csv(self.handle, index=False, header=self.header)
+            self.header = False
+            return
+
+        # Only the first chunk writes the header, later chunks are appended, which
+        # would add a second file to a zip archive instead of extending the first
+        if not self.header and self.compression == "zip":
+            raise ValueError("Zip compression does not support writing CSV chunks")
+
+        compression = self.compression
+
+        if compression == "zip":
+            compression = {"method": "zip", "archive_name": self.get_member_name()}
+
+        df.to_csv(
+            self.file_path,
+            index=False,
+            header=self.header,
+            mode="w" if self.header else "a",
+            compression=compression,
+        )
+        self.header = False
+
+    def close(self):
+        if self.handle:
+            self.handle.close()
+            self.file.close()
+            self.handle = None
+
+
+class ArrowWriter:
+    def __init__(self, file_path, compression="zstd"):
+        self.file_path = file_path
+        self.compression = compression
+        self.schema = None
+        self.writer = None
+
+    def write(self, df):
+        # Each chunk is converted using the schema of the first chunk
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = self.open(table.schema)
+
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+class ParquetWriter(ArrowWriter):
+    def open(self, schema):
+        # Each chunk is written as a compressed row group
+        return pq.ParquetWriter(self.file_path, schema, compression=self.compression)
+
+
+class FeatherWriter(ArrowWriter):
+    def open(self, schema):
+        # Each chunk is written as compressed record batches
+        return pa.ipc.new_file(
+            self.file_path,
+            schema,
+            options=pa.ipc.IpcWriteOptions(compression=self.compression),
+        )
+
+
+def get_writer(file_path, file_format=None, compression=None, file_name=None):
+    # Create a writer for the file format, using its default compression if not set,
+    # file_name is the name of the completed file when writing to a temporary file
+    writers = {"parquet": ParquetWriter, "feather": FeatherWriter}
+    file_format = get_file_format(file_path, file_format)
+    compression = compression or default_compression[file_format]
+
+    if file_format == "csv":
+        return CsvWriter(file_path, compression, file_name)
+
+    return writers[file_format](file_path, compression=compression)
+
+
+def write_file(df, file_path, file_format=None, compression=None):
+    # Write a dataframe to a file
+    write_file_chunks([df], file_path, file_format, compression)
+
+
+def get_temp_path(file_path):
+    # Get a temporary file path next to the file, hidden from glob patterns
+    directory, file_name = os.path.split(file_path)
+
+    return os.path.join(directory, f".{file_name}.{os.getpid()}.tmp")
+
+
+def replace_file(temp_path, file_path):
+    # Move a completed temporary file into place, if anything was written
+    if os.path.exists(temp_path):
+        os.replace(temp_path, file_path)
+
+
+def remove_file(file_path):
+    # Remove a file if it exists
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def write_file_chunks(chunks, file_path, file_format=None, compression=None):
+    # Write an iterator of dataframes to a temporary file which is renamed to the
+    # file once complete, so readers never see a partially written file
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    temp_path = get_temp_path(file_path)
+    writer = get_writer(
+        temp_path,
+        get_file_format(file_path, file_format),
+        compression,
+        os.path.basename(file_path),
+    )
+
+    try:
+        for df in chunks:
+            writer.write(df)
+    except BaseException:
+        writer.close()
+        remove_file(temp_path)
+        raise
+
+    writer.close()
+    replace_file(temp_path, file_path)
@@ -0,0 +1,138 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def reset_peak_rss():
+    # Reset the peak resident set size of the process, only supported on linux
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def get_peak_rss():
+    # Get the peak resident set size of the process since the last reset, falling
+    # back to the peak of the whole process
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # Max resident set size is reported in bytes on macOS and kilobytes elsewhere
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def get_rate(value, seconds):
+    # Get a rate per second, or None if the stage took no measurable time
+    return round(value / seconds) if seconds > 0 else None
+
+
+class StageMetrics:
+    def __init__(self, name, track_peak_rss=True):
+        # Keep the totals of each stage, chunked files enter a stage once per chunk
+        self.name = name
+        self.stages = {}
+        self.local = threading.local()
+        self.start = time.perf_counter()
+
+        # The peak resident set size is reset for the whole process, so it is only
+        # tracked per file if the process scores one file at a time
+        self.track_peak_rss = track_peak_rss
+
+        if track_peak_rss:
+            reset_peak_rss()
+
+    @property
+    def active(self):
+        # Keep the active stages per thread, as the stages of a prefetched file run
+        # in the reader, scoring and writer threads at the same time
+        if not hasattr(self.local, "active"):
+            self.local.active = []
+
+        return self.local.active
+
+    @contextmanager
+    def stage(self, stage_name):
+        record = self.stages.setdefault(
+            stage_name, {"seconds": 0.0, "rows": 0, "bytes": 0}
+        )
+        nested = [0.0]
+        self.active.append(nested)
+        start = time.perf_counter()
+
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter() - start
+            self.active.pop()
+
+            # Exclude the time of nested stages, such as chunks read and scored while
+            # the output is written, so stage times add up to the total
+            record["seconds"] += elapsed - nested[0]
+
+            if self.active:
+                self.active[-1][0] += elapsed
+
+    def time_chunks(self, chunks, stage_name):
+        # Time getting each chunk from an iterator of dataframes
+        chunks = iter(chunks)
+
+        while True:
+            with self.stage(stage_name) as record:
+                df = next(chunks, None)
+
+                if df is not None:
+                    record["rows"] += len(df)
+
+            if df is None:
+                return
+
+            yield df
+
+    def summary(self):
+        # Summarize the stages with their throughput and the slowest stage
+        stages = {
+            stage_name: {
+                "seconds": round(record["seconds"], 4),
+                "rows": record["rows"],
+                "rows_per_second": get_rate(record["rows"], record["seconds"]),
+                "bytes": record["bytes"],
+                "bytes_per_second": get_rate(record["bytes"], record["seconds"]),
+            }
+            for stage_name, record in self.stages.items()
+        }
+
+        return {
+            "name": self.name,
+            "seconds": round(time.perf_counter() - self.start, 4),
+            "peak_rss_bytes": get_peak_rss() if self.track_peak_rss else None,
+            "slowest_stage": max(
+                stages,
+                key=lambda stage_name: stages[stage_name]["seconds"],
+                default=None,
+            ),
+            "stages": stages,
+        }
+
+
+def write_summary(summaries, file_path):
+    # Write the summaries with the slowest first, so slow files stand out
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+
+    with open(file_path, "w") as f:
+        json.dump(
+            sorted(summaries, key=lambda summary: summary["seconds"], reverse=True),
+            f,
+            indent=2,
+        )
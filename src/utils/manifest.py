@@ -0,0 +1,106 @@
+import json
+import os
+
+
+class ScoreManifest:
+    def __init__(self, file_path, input_dir, output_files=None, input_files=None):
+        # Record scored files relative to the input directory and the manifest
+        # folder, as the datastores can be mounted at a different path in each run
+        self.file_path = file_path
+        self.input_dir = input_dir
+        self.output_dir = os.path.dirname(file_path)
+        self.files = self.read()
+
+        # Names of the outputs in storage, if outputs are uploaded instead of written
+        # to a mounted folder
+        self.output_files = output_files
+
+        # Sizes and etags of the inputs in storage, if inputs are staged from storage
+        # instead of read from a mounted folder
+        self.input_files = input_files
+
+        # Outputs of earlier versions of rescored inputs, which are no longer recorded
+        # and are removed so each input has a single output
+        self.replaced_files = []
+
+    def read(self):
+        # Read the scored files, an unreadable manifest rescores every file
+        try:
+            with open(self.file_path) as f:
+                return json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def write(self):
+        # Write the manifest to a temporary file and move it into place, so a
+        # preempted run never leaves a partially written manifest
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        with open(f"{self.file_path}.tmp", "w") as f:
+            json.dump({"files": self.files}, f, indent=2)
+
+        os.replace(f"{self.file_path}.tmp", self.file_path)
+
+    def get_key(self, input_file_path):
+        return os.path.relpath(input_file_path, self.input_dir)
+
+    def is_scored(self, input_file_path, build_id):
+        # Check if the file was scored by the same model and its output still exists
+        entry = self.files.get(self.get_key(input_file_path))
+
+        if not entry or entry["build_id"] != build_id or not self.output_exists(entry):
+            return False
+
+        # Compare the size and modification time, files are not hashed when they are
+        # recorded so a touched file is rescored
+        stat = os.stat(input_file_path)
+
+        return stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]
+
+    def is_scored_in_storage(self, file_name, build_id):
+        # Check if a file in the input storage was scored by the same model before
+        # it is downloaded, comparing its size and etag instead of its content
+        entry = self.files.get(os.path.join(*file_name.split("/")))
+        input_file = self.input_files[file_name]
+
+        if not entry or entry["build_id"] != build_id:
+            return False
+
+        if entry["size"] != input_file["size"]:
+            return False
+
+        if entry.get("etag") != input_file["etag"]:
+            return False
+
+        return self.output_exists(entry)
+
+    def output_exists(self, entry):
+        if self.output_files is not None:
+            return entry["output_file"].replace(os.sep, "/") in self.output_files
+
+        return os.path.exists(os.path.join(self.output_dir, entry["output_file"]))
+
+    def record(self, input_file_path, output_file_path, build_id):
+        # Record a scored file and write the manifest, so a resumed run skips it,
+        # its size and modification time identify it without reading it again
+        stat = os.stat(input_file_path)
+
+        key = self.get_key(input_file_path)
+        output_file = os.path.relpath(output_file_path, self.output_dir)
+
+        if key in self.files and self.files[key]["output_file"] != output_file:
+            self.replaced_files.append(self.files[key]["output_file"])
+
+        self.files[key] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "build_id": build_id,
+            "output_file": output_file,
+        }
+
+        # Record the etag of files staged from storage
+        if self.input_files is not None:
+            input_file = self.input_files.get(key.replace(os.sep, "/"), {})
+            self.files[key]["etag"] = input_file.get("etag")
+
+        self.write()
@@ -0,0 +1,282 @@
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from azureml.core.model import Model
+
+cache_metadata_file_name = "cache.json"
+artifact_folder_name = "artifact"
+lock_file_name = ".lock"
+
+
+class AzureModelRegistry:
+    def __init__(self, workspace):
+        self.workspace = workspace
+
+    def find_model(self, build_id):
+        # Find models with build id
+        model_list = Model.list(
+            self.workspace, tags=[["build_id", build_id]], latest=True
+        )
+
+        # Throw error if no model is found
+        if not model_list:
+            raise Exception(f"Model not found: build_id={build_id}")
+
+        return {
+            "id": model_list[0].id,
+            "name": model_list[0].name,
+            "version": model_list[0].version,
+        }
+
+    def download_model(self, model_info, target_dir):
+        # Download the registered model file or folder to the target directory
+        model = Model(
+            self.workspace, name=model_info["name"], version=model_info["version"]
+        )
+
+        return model.download(target_dir=target_dir, exist_ok=True)
+
+
+class LocalModelRegistry:
+    # Stand-in for the model registry, models are stored as <name>/<version>/<path>
+    # next to a tags.json file
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def register_model(self, model_name, model_path, tags):
+        # Register a model file or folder as the next version of the model
+        model_dir = os.path.join(self.root_dir, model_name)
+        os.makedirs(model_dir, exist_ok=True)
+        version = len(os.listdir(model_dir)) + 1
+        version_dir = os.path.join(model_dir, str(version))
+        os.makedirs(version_dir)
+
+        copy_path(model_path, os.path.join(version_dir, os.path.basename(model_path)))
+
+        with open(os.path.join(version_dir, "tags.json"), "w") as f:
+            json.dump(tags, f)
+
+        return {"id": f"{model_name}:{version}", "name": model_name, "version": version}
+
+    def find_model(self, build_id):
+        # Find the latest version of a model with the build id
+        model_list = []
+
+        for model_name in sorted(os.listdir(self.root_dir)):
+            model_dir = os.path.join(self.root_dir, model_name)
+
+            for version in os.listdir(model_dir):
+                with open(os.path.join(model_dir, version, "tags.json")) as f:
+                    tags = json.load(f)
+
+                if tags.get("build_id") == build_id:
+                    model_list.append((int(version), model_name))
+
+        if not model_list:
+            raise Exception(f"Model not found: build_id={build_id}")
+
+        version, model_name = max(model_list)
+
+        return {"id": f"{model_name}:{version}", "name": model_name, "version": version}
+
+    def download_model(self, model_info, target_dir):
+        # Copy the registered model file or folder to the target directory
+        version_dir = os.path.join(
+            self.root_dir, model_info["name"], str(model_info["version"])
+        )
+        model_path = [name for name in os.listdir(version_dir) if name != "tags.json"]
+        target_path = os.path.join(target_dir, model_path[0])
+
+        copy_path(os.path.join(version_dir, model_path[0]), target_path)
+
+        return target_path
+
+
+def copy_path(source_path, target_path):
+    # Copy a file or a folder
+    if os.path.isdir(source_path):
+        shutil.copytree(source_path, target_path)
+    else:
+        shutil.copyfile(source_path, target_path)
+
+
+def list_files(path):
+    # List all files of a file or folder in a fixed order
+    if not os.path.isdir(path):
+        return [path]
+
+    return sorted(
+        os.path.join(root, file_name)
+        for root, _, file_names in os.walk(path)
+        for file_name in file_names
+    )
+
+
+def hash_path(path):
+    # Hash the relative paths and contents of all files of a file or folder
+    sha256 = hashlib.sha256()
+
+    for file_path in list_files(path):
+        sha256.update(os.path.relpath(file_path, path).encode())
+
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+def get_size(path):
+    # Get the size of all files of a file or folder in bytes
+    return sum(os.path.getsize(file_path) for file_path in list_files(path))
+
+
+class ModelCache:
+    def __init__(self, cache_dir, max_bytes, registry, eviction_grace_seconds=600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.registry = registry
+        # Entries used more recently are never evicted, as another process may still
+        # be loading the model it was just returned
+        self.eviction_grace_seconds = eviction_grace_seconds
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @contextmanager
+    def lock(self):
+        # Hold an exclusive lock on a file in the cache directory, so processes
+        # sharing the cache never download, update or evict entries at once
+        with open(os.path.join(self.cache_dir, lock_file_name), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_entry_dir(self, model_info):
+        # Cache entries are keyed by model name and version
+        return os.path.join(
+            self.cache_dir, f"{model_info['name']}_{model_info['version']}"
+        )
+
+    def read_entry(self, entry_dir):
+        # Read the cache metadata of an entry, None if the entry is incomplete
+        try:
+            with open(os.path.join(entry_dir, cache_metadata_file_name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_entry(self, entry_dir, entry):
+        # Write cache metadata to a temporary file and move it into place
+        metadata_path = os.path.join(entry_dir, cache_metadata_file_name)
+
+        with open(f"{metadata_path}.tmp", "w") as f:
+            json.dump(entry, f)
+
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+
+    def get_model(self, build_id):
+        # Resolve the model id and version for the build id
+        model_info = self.registry.find_model(build_id)
+
+        with self.lock():
+            return self.get_cached_model(model_info)
+
+    def get_cached_model(self, model_info):
+        entry_dir = self.get_entry_dir(model_info)
+        entry = self.read_entry(entry_dir)
+
+        # Reuse a cached artifact if its content still matches the recorded hash
+        if entry and hash_path(entry["model_path"]) == entry["sha256"]:
+            print("Using cached model:", {"model_id": model_info["id"]})
+        else:
+            if entry:
+                print("Cached model failed integrity check:", entry["model_path"])
+
+            entry = self.download(model_info, entry_dir)
+
+        # Record the last use of the entry for least recently used eviction
+        entry["last_used"] = time.time()
+        self.write_entry(entry_dir, entry)
+        self.evict_entries(keep=entry_dir)
+
+        return entry["model_path"], {**model_info, "sha256": entry["sha256"]}
+
+    def download(self, model_info, entry_dir):
+        # Download to a temporary directory so incomplete downloads are never used
+        download_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        artifact_dir = os.path.join(download_dir, artifact_folder_name)
+        os.makedirs(artifact_dir)
+
+        model_path = self.registry.download_model(model_info, artifact_dir)
+        relative_path = os.path.relpath(model_path, download_dir)
+
+        # Replace any existing entry with the downloaded artifact
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+        try:
+            os.rename(download_dir, entry_dir)
+        except OSError as error:
+            # Another process not holding the lock has created the entry since,
+            # keep it if it is complete and intact
+            shutil.rmtree(download_dir, ignore_errors=True)
+            entry = self.read_entry(entry_dir)
+
+            if error.errno not in (errno.ENOTEMPTY, errno.EEXIST) or not entry:
+                raise
+
+            if hash_path(entry["model_path"]) != entry["sha256"]:
+                raise
+
+            return entry
+
+        model_path = os.path.join(entry_dir, relative_path)
+        entry = {
+            "model_id": model_info["id"],
+            "model_path": model_path,
+            "sha256": hash_path(model_path),
+            "size": get_size(model_path),
+        }
+
+        print("Downloaded model to cache:", {"model_id": model_info["id"]})
+
+        return entry
+
+    def evict(self, keep=None):
+        with self.lock():
+            self.evict_entries(keep)
+
+    def evict_entries(self, keep=None):
+        # List complete cache entries from most to least recently used
+        entries = []
+
+        for entry_name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, entry_name)
+            entry = self.read_entry(entry_dir)
+
+            if entry:
+                entries.append((entry["last_used"], entry["size"], entry_dir))
+
+        entries.sort(reverse=True)
+
+        # Remove least recently used entries until the cache fits its maximum size
+        cache_bytes = sum(size for _, size, _ in entries)
+
+        min_last_used = time.time() - self.eviction_grace_seconds
+
+        while cache_bytes > self.max_bytes and entries:
+            last_used, size, entry_dir = entries.pop()
+
+            if entry_dir != keep and last_used < min_last_used:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                cache_bytes -= size
+                print("Evicted model from cache:", entry_dir)
@@ -0,0 +1,93 @@
+import queue
+import threading
+
+# Marks the end of the items in a queue
+end_of_items = object()
+
+
+def put(item_queue, item, stopped):
+    # Wait for space in the queue, giving up once the other side has stopped
+    while not stopped():
+        try:
+            item_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def prefetch(items, size):
+    # Iterate over items in a background thread, buffering up to size items ahead of
+    # the consumer, exceptions are raised in the consumer
+    item_queue = queue.Queue(size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                put(item_queue, (item, None), stop.is_set)
+                if stop.is_set():
+                    return
+        except BaseException as error:
+            put(item_queue, (None, error), stop.is_set)
+            return
+
+        put(item_queue, (end_of_items, None), stop.is_set)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    # Stop the background thread if the consumer stops early
+    try:
+        while True:
+            item, error = item_queue.get()
+
+            if error is not None:
+                raise error
+
+            if item is end_of_items:
+                return
+
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class BackgroundConsumer:
+    def __init__(self, consume, size):
+        # Pass items to a function running in a background thread, through a queue
+        # of up to size items, so producers wait when the consumer falls behind
+        self.queue = queue.Queue(size)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, args=(consume,), daemon=True)
+        self.thread.start()
+
+    def run(self, consume):
+        try:
+            consume(self.get_items())
+        except BaseException as error:
+            self.error = error
+
+    def get_items(self):
+        while True:
+            item = self.queue.get()
+
+            if item is end_of_items:
+                return
+
+            yield item
+
+    def put(self, item):
+        # Raise errors of the consumer in the producer instead of waiting forever
+        put(self.queue, item, lambda: not self.thread.is_alive())
+
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        # Wait for the consumer to finish the remaining items
+        put(self.queue, end_of_items, lambda: not self.thread.is_alive())
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import shutil
+from urllib.parse import urlparse
+
+from src.utils.formats import get_temp_path, remove_file, replace_file
+
+
+def get_local_path(root_dir, name):
+    # Map a "/" separated file name in storage to a local path
+    return os.path.join(root_dir, *name.split("/"))
+
+
+def copy_file(source_path, target_path):
+    # Copy to a temporary file and move it into place, so partially copied files
+    # are never read
+    os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+    temp_path = get_temp_path(target_path)
+
+    try:
+        shutil.copyfile(source_path, temp_path)
+    except BaseException:
+        remove_file(temp_path)
+        raise
+
+    replace_file(temp_path, target_path)
+
+
+async def run_in_thread(func, *args):
+    # Run blocking file operations in the default thread pool of the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class LocalStorage:
+    # Stand-in for blob storage, files are stored in a local directory
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def list_files(self):
+        # List the "/" separated names of all files, as blob names, with their size
+        # and modification time in place of an etag
+        def list_names():
+            files = {}
+
+            for root, _, file_names in os.walk(self.root_dir):
+                for file_name in file_names:
+                    file_path = os.path.join(root, file_name)
+                    stat = os.stat(file_path)
+                    name = os.path.relpath(file_path, self.root_dir)
+                    files[name.replace(os.sep, "/")] = {
+                        "size": stat.st_size,
+                        "etag": str(stat.st_mtime_ns),
+                    }
+
+            return dict(sorted(files.items()))
+
+        return await run_in_thread(list_names)
+
+    async def download_file(self, name, file_path):
+        await run_in_thread(copy_file, get_local_path(self.root_dir, name), file_path)
+
+    async def upload_file(self, file_path, name):
+        await run_in_thread(copy_file, file_path, get_local_path(self.root_dir, name))
+
+    async def delete_file(self, name):
+        await run_in_thread(remove_file, get_local_path(self.root_dir, name))
+
+
+class AzureBlobStorage:
+    # Files are stored as blobs in a container, below an optional prefix
+    def __init__(self, account_url, container_name, prefix="", credential=None):
+        self.account_url = account_url
+        self.container_name = container_name
+        self.prefix = prefix.strip("/")
+        self.credential = credential
+        self.client = None
+
+    async def __aenter__(self):
+        # Import the async blob client only when blob storage is used, it is only
+        # installed in the scoring environment
+        from azure.storage.blob.aio import ContainerClient
+
+        self.client = ContainerClient(
+            self.account_url, self.container_name, credential=self.credential
+        )
+        await self.client.__aenter__()
+
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.__aexit__(*exc_info)
+        self.client = None
+
+    def get_blob_name(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    async def list_files(self):
+        # List the names of all blobs relative to the prefix, with their size and etag
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        files = {}
+
+        async for blob in self.client.list_blobs(name_starts_with=prefix or None):
+            files[blob.name[len(prefix):]] = {"size": blob.size, "etag": blob.etag}
+
+        return dict(sorted(files.items()))
+
+    async def download_file(self, name, file_path):
+        # Stream the blob to a temporary file and move it into place
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        temp_path = get_temp_path(file_path)
+
+        try:
+            downloader = await self.client.download_blob(self.get_blob_name(name))
+
+            with open(temp_path, "wb") as f:
+                await downloader.readinto(f)
+        except BaseException:
+            remove_file(temp_path)
+            raise
+
+        replace_file(temp_path, file_path)
+
+    async def upload_file(self, file_path, name):
+        with open(file_path, "rb") as f:
+            await self.client.upload_blob(self.get_blob_name(name), f, overwrite=True)
+
+    async def delete_file(self, name):
+        # Deleting a blob which does not exist is not an error, as for local files
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            await self.client.delete_blob(self.get_blob_name(name))
+        except ResourceNotFoundError:
+            pass
+
+
+def get_storage(url, credential=None):
+    # Container urls such as https://<account>.blob.core.windows.net/<container>/<prefix>
+    # use blob storage, any other url or path is a local directory
+    parsed_url = urlparse(url)
+
+    if parsed_url.scheme != "https":
+        return LocalStorage(parsed_url.path if parsed_url.scheme == "file" else url)
+
+    container_name, _, prefix = parsed_url.path.lstrip("/").partition("/")
+
+    return AzureBlobStorage(
+        f"https://{parsed_url.netloc}", container_name, prefix, credential
+    )
+
+
+async def transfer_files(transfer, items, concurrency):
+    # Run transfers from a fixed number of workers sharing the items, so at most
+    # concurrency transfers are in flight however many files there are
+    items = iter(items)
+
+    async def work():
+        for item in items:
+            await transfer(*item)
+
+    await asyncio.gather(*[work() for _ in range(concurrency)])
+
+
+def list_files(storage):
+    async def list_storage():
+        async with storage:
+            return await storage.list_files()
+
+    return asyncio.run(list_storage())
+
+
+def download_files(storage, target_dir, names, concurrency=16):
+    # Download the named files to the same names in the target directory
+    async def download():
+        async with storage:
+            await transfer_files(
+                storage.download_file,
+                [(name, get_local_path(target_dir, name)) for name in names],
+                concurrency,
+            )
+
+    asyncio.run(download())
+
+
+def upload_files(storage, source_dir, names, concurrency=16):
+    # Upload the named files of the source directory to the same names in storage
+    async def upload():
+        async with storage:
+            await transfer_files(
+                storage.upload_file,
+                [(get_local_path(source_dir, name), name) for name in names],
+                concurrency,
+            )
+
+    asyncio.run(upload())
+
+
+def delete_files(storage, names, concurrency=16):
+    # Delete the named files from storage, ignoring files which do not exist
+    async def delete():
+        async with storage:
+            await transfer_files(
+                storage.delete_file, [(name,) for name in names], concurrency
+            )
+
+    asyncio.run(delete())
@@ -0,0 +1,138 @@
+import logging
+import queue
+import threading
+
+from opencensus.ext.azure.log_exporter import AzureLogHandler
+
+
+class MemoryExporter:
+    # Keeps exported records in memory, for tests and local runs
+    def __init__(self):
+        self.records = []
+
+    def export(self, records):
+        self.records.extend(records)
+
+
+class HandlerExporter:
+    # Exports records through logging handlers, such as the app insights handler
+    def __init__(self, handlers):
+        self.handlers = handlers
+
+    def export(self, records):
+        for handler in self.handlers:
+            for record in records:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def close(self):
+        for handler in self.handlers:
+            handler.flush()
+            handler.close()
+
+
+class TelemetryHandler(logging.Handler):
+    def __init__(self, exporter, max_queue_size=10000, batch_size=100):
+        super().__init__()
+
+        # Buffer records in a bounded queue which is exported in batches from a
+        # background thread, so logging never blocks on network calls
+        self.exporter = exporter
+        self.queue = queue.Queue(max_queue_size)
+        self.batch_size = batch_size
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self.thread = threading.Thread(target=self.process, daemon=True)
+        self.thread.start()
+
+    def emit(self, record):
+        # Drop records instead of waiting when the queue is full
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def process(self):
+        while True:
+            # Wait for a record, then take every queued record up to the batch size
+            records = [self.queue.get()]
+
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Records are followed by None once the handler is closed
+            batch = [record for record in records if record is not None]
+            self.export(batch)
+
+            for _ in records:
+                self.queue.task_done()
+
+            if len(batch) < len(records):
+                return
+
+    def export(self, records):
+        if not records:
+            return
+
+        # Count failed exports instead of raising them in the background thread
+        try:
+            self.exporter.export(records)
+            self.exported += len(records)
+        except Exception:
+            self.failed += len(records)
+
+    def flush(self):
+        # Wait until every queued record has been exported
+        if self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        # Export the remaining records and stop the background thread
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+            # Report records which were lost, so gaps in the telemetry are visible
+            if self.dropped or self.failed:
+                self.export(
+                    [
+                        logging.makeLogRecord(
+                            {
+                                "name": __name__,
+                                "levelno": logging.WARNING,
+                                "levelname": "WARNING",
+                                "msg": {
+                                    "telemetry_dropped": self.dropped,
+                                    "telemetry_failed": self.failed,
+                                },
+                            }
+                        )
+                    ]
+                )
+
+            if hasattr(self.exporter, "close"):
+                self.exporter.close()
+
+        super().close()
+
+
+def get_logger(name, exporter=None, max_queue_size=10000, batch_size=100):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+
+    # Only add the handler once, so setting the logger again does not duplicate
+    # records
+    if any(isinstance(handler, TelemetryHandler) for handler in logger.handlers):
+        return logger
+
+    # Export to stdout and app insights by default, the handler is flushed and
+    # closed by logging when the interpreter exits
+    exporter = exporter or HandlerExporter([logging.StreamHandler(), AzureLogHandler()])
+    logger.addHandler(TelemetryHandler(exporter, max_queue_size, batch_size))
+
+    return logger
@@ -120,7 +120,7 @@ records = [
 
 @fixture
 def data():
-    return records
+    return [dict(record) for record in records]
 
 
 @fixture
@@ -133,4 +133,6 @@ def cv_results():
     return {
         "train_score": np.array([0.74, 0.70, 0.72, 0.71]),
         "test_score": np.array([0.73, 0.71, 0.73, 0.72]),
+        "fit_time": np.array([0.12, 0.11, 0.13, 0.12]),
+        "score_time": np.array([0.01, 0.01, 0.02, 0.01]),
     }
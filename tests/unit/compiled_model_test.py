@@ -0,0 +1,140 @@
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+from pytest import fixture, mark, raises
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from src.features.features import (
+    add_bmi,
+    categorical_features,
+    get_model_features,
+    numeric_features,
+    target,
+)
+from src.train.train import train_model
+from src.utils.compiled_model import (
+    compile_model,
+    load_compiled_model,
+    save_compiled_model,
+)
+
+
+@fixture
+def training_df(input_df):
+    # Create a larger dataset with noise added to the numeric features
+    rng = np.random.default_rng(0)
+    df = pd.concat([input_df] * 25, ignore_index=True)
+
+    for feature in ["age", "height", "weight", "systolic", "diastolic"]:
+        df[feature] = df[feature] + rng.normal(0, 5, len(df))
+
+    df[target] = rng.integers(0, 2, len(df))
+
+    return add_bmi(df)
+
+
+def build_pipeline(scaler, classifier):
+    # Build a pipeline with the same structure as the trained model
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("numeric", scaler, numeric_features),
+            ("categorical", OneHotEncoder(categories="auto"), categorical_features),
+        ],
+        remainder="drop",
+    )
+
+    return Pipeline(steps=[("preprocessor", preprocessor), ("classifier", classifier)])
+
+
+@patch("src.train.train.cross_validate", MagicMock())
+@patch("src.train.train.run", MagicMock())
+def test_compile_trained_model(training_df):
+    # Train model and compile it
+    model = train_model(training_df)
+    compiled_model = compile_model(model)
+
+    # Should match the model probabilities
+    X = get_model_features(training_df)
+    assert np.allclose(
+        compiled_model.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-9
+    )
+
+
+@mark.parametrize(
+    "scaler",
+    [StandardScaler(), StandardScaler(with_mean=False), StandardScaler(with_std=False)],
+)
+@mark.parametrize(
+    "classifier",
+    [
+        LogisticRegression(solver="liblinear"),
+        LogisticRegression(solver="lbfgs", C=0.1),
+        LogisticRegression(solver="liblinear", fit_intercept=False),
+    ],
+)
+def test_compile_model_parity(scaler, classifier, training_df):
+    # Train model and compile it
+    X = get_model_features(training_df)
+    model = build_pipeline(scaler, classifier).fit(X, training_df[target])
+    compiled_model = compile_model(model)
+
+    # Should match the model probabilities with reordered and categorical columns
+    X_scored = X[X.columns[::-1]].astype({"gender": "category"})
+    assert np.allclose(
+        compiled_model.predict_proba(X_scored),
+        model.predict_proba(X),
+        rtol=0,
+        atol=1e-9,
+    )
+
+
+def test_compile_model_unknown_category(training_df):
+    # Train model and compile it
+    X = get_model_features(training_df)
+    model = build_pipeline(StandardScaler(), LogisticRegression())
+    compiled_model = compile_model(model.fit(X, training_df[target]))
+
+    # Should raise an error for categories which were not seen in training
+    X["gender"] = X["gender"].astype(object)
+    X.loc[0, "gender"] = "unknown"
+    with raises(ValueError, match="unknown"):
+        compiled_model.predict_proba(X)
+
+
+@mark.parametrize("value", [np.nan, np.inf])
+def test_compile_model_missing_value(value, training_df):
+    # Train model and compile it
+    X = get_model_features(training_df)
+    model = build_pipeline(StandardScaler(), LogisticRegression())
+    compiled_model = compile_model(model.fit(X, training_df[target]))
+
+    # Should raise an error for missing numeric values, as the model does
+    X.loc[0, "age"] = value
+
+    for predictor in [model, compiled_model]:
+        with raises(ValueError, match="NaN|infinity"):
+            predictor.predict_proba(X)
+
+
+def test_save_compiled_model(training_df, tmp_path):
+    # Train model, compile it and write it as a compact artifact
+    X = get_model_features(training_df)
+    model = build_pipeline(StandardScaler(), LogisticRegression())
+    compiled_model = compile_model(model.fit(X, training_df[target]))
+    save_compiled_model(compiled_model, tmp_path / "compiled")
+
+    # Load the artifact with memory mapped weights
+    loaded_model = load_compiled_model(tmp_path / "compiled")
+
+    # Should use read only memory mapped weights instead of copies in memory
+    for weights in [loaded_model.numeric_weights] + loaded_model.category_weights:
+        assert not weights.flags.writeable
+
+    # Should predict the same probabilities as the compiled model
+    assert np.array_equal(
+        loaded_model.predict_proba(X), compiled_model.predict_proba(X)
+    )
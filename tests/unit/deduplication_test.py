@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from src.utils.deduplication import deduplicate_chunks, get_duplicate_mask
+
+
+def test_get_duplicate_mask(input_df):
+    # Create dataset with duplicates within and across blocks
+    df = pd.concat([input_df, input_df.iloc[[0, 2]], input_df], ignore_index=True)
+
+    # Should flag the same rows as pandas, in small blocks
+    assert np.array_equal(get_duplicate_mask(df, block_rows=3), df.duplicated())
+
+
+def test_deduplicate_chunks(input_df):
+    # Split dataset with duplicates into chunks
+    df = pd.concat([input_df, input_df.iloc[[1]], input_df], ignore_index=True)
+    chunks = np.array_split(df, 3)
+
+    # Should drop duplicates of rows in earlier chunks
+    result = pd.concat(deduplicate_chunks(chunks))
+    pd.testing.assert_frame_equal(result, df.drop_duplicates())
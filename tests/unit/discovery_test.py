@@ -0,0 +1,119 @@
+import os
+
+from src.utils.discovery import parse_partition, select_file, walk_files
+
+
+def write_files(root_dir, file_names):
+    for file_name in file_names:
+        file_path = root_dir / file_name
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text("")
+
+
+def test_parse_partition():
+    # Should keep the precision of the date
+    assert parse_partition("2024-01-31") == (2024, 1, 31)
+    assert parse_partition("2024/01/31/05") == (2024, 1, 31, 5)
+    assert parse_partition(None) is None
+
+
+def test_walk_files(tmp_path):
+    # Write files in partition folders and other folders
+    write_files(
+        tmp_path,
+        [
+            "b.csv",
+            "a.csv",
+            ".a.csv.1.tmp",
+            "notes.txt",
+            "2024/01/31/23/c.csv",
+            "archive/d.csv",
+        ],
+    )
+
+    # Should find matching files in name order, before the files of subfolders, and
+    # skip hidden files
+    assert list(walk_files(str(tmp_path), ["*.csv"])) == [
+        "a.csv",
+        "b.csv",
+        os.path.join("2024", "01", "31", "23", "c.csv"),
+        os.path.join("archive", "d.csv"),
+    ]
+
+    # Should skip excluded files and folders
+    assert list(walk_files(str(tmp_path), ["*.csv"], ["archive", "b.*"])) == [
+        "a.csv",
+        os.path.join("2024", "01", "31", "23", "c.csv"),
+    ]
+
+    # Should skip folders such as an output folder below the root folder
+    skip_dirs = [str(tmp_path / "archive")]
+    assert list(walk_files(str(tmp_path), ["*.csv"], skip_dirs=skip_dirs)) == [
+        "a.csv",
+        "b.csv",
+        os.path.join("2024", "01", "31", "23", "c.csv"),
+    ]
+
+
+def test_walk_files_partitions(tmp_path, monkeypatch):
+    # Write files in hourly partition folders
+    write_files(
+        tmp_path,
+        [
+            "2023/12/31/23/a.csv",
+            "2024/01/30/00/b.csv",
+            "2024/01/31/00/c.csv",
+            "2024/01/31/23/d.csv",
+            "2024/02/01/00/e.csv",
+        ],
+    )
+
+    # List the folders which are walked
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(
+        os, "scandir", lambda path: listed.append(path) or scandir(path)
+    )
+
+    file_names = walk_files(
+        str(tmp_path), ["*.csv"], start=(2024, 1, 31), end=(2024, 1, 31)
+    )
+
+    # Should include every hour of the end date
+    assert [os.path.basename(file_name) for file_name in file_names] == [
+        "c.csv",
+        "d.csv",
+    ]
+
+    # Should not list partitions outside of the date range
+    assert str(tmp_path / "2023") not in listed
+    assert str(tmp_path / "2024" / "01" / "30") not in listed
+    assert str(tmp_path / "2024" / "02") not in listed
+
+
+def test_select_file(tmp_path):
+    # Write files in partition folders, hidden and excluded folders
+    file_names = [
+        "a.csv",
+        ".a.csv.1.tmp",
+        "notes.txt",
+        ".hidden/b.csv",
+        "archive/c.csv",
+        "2024/01/30/00/d.csv",
+        "2024/01/31/23/e.csv",
+        "2024/02/01/00/f.csv",
+    ]
+    write_files(tmp_path, file_names)
+
+    # Should select the same files as walking the folders
+    for patterns in [(["*.csv"], None), (["*.csv"], ["archive"]), (None, ["*.txt"])]:
+        selected = [
+            file_name
+            for file_name in file_names
+            if select_file(file_name, *patterns, (2024, 1, 31), (2024, 1, 31))
+        ]
+        walked = walk_files(str(tmp_path), *patterns, (2024, 1, 31), (2024, 1, 31))
+
+        assert sorted(selected) == sorted(
+            file_name.replace(os.sep, "/") for file_name in walked
+        )
@@ -0,0 +1,43 @@
+import numpy as np
+from pytest import raises
+from sklearn.preprocessing import OneHotEncoder
+
+from src.features.encoders import CategoryCodeEncoder
+from src.features.features import categorical_features
+
+
+def test_category_code_encoder(input_df):
+    # Encode categorical features as strings and as categories
+    X = input_df[categorical_features]
+    encoder = CategoryCodeEncoder().fit(X)
+    expected = OneHotEncoder().fit_transform(X).toarray()
+
+    # Should match the one hot encoder for both data types
+    assert np.array_equal(encoder.transform(X), expected)
+    assert np.array_equal(encoder.transform(X.astype("category")), expected)
+    assert encoder.get_feature_names_out()[:2].tolist() == [
+        "gender_female",
+        "gender_male",
+    ]
+
+
+def test_category_code_encoder_categories(input_df):
+    # Encode with a vocabulary in a different order than the column categories
+    X = input_df[["gender"]].astype("category")
+    encoder = CategoryCodeEncoder(categories=[["male", "female", "other"]]).fit(X)
+
+    # Should recode the category codes to the vocabulary
+    encoded = encoder.transform(X)
+    assert encoded.shape == (len(X), 3)
+    assert np.array_equal(encoded[:, 0], (input_df.gender == "male").to_numpy())
+
+
+def test_category_code_encoder_unknown(input_df):
+    # Fit the encoder and encode an unknown category
+    X = input_df[["gender"]]
+    encoder = CategoryCodeEncoder().fit(X)
+    X = X.assign(gender=X.gender.where(X.index != 0, "unknown"))
+
+    # Should raise an error for categories which were not seen in training
+    with raises(ValueError, match="unknown"):
+        encoder.transform(X)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from src.features.features import (
+    add_bmi,
+    build_feature_metadata,
+    get_categories,
+    get_model_features,
+    read_feature_metadata,
+    write_feature_metadata,
+)
+
+
+def test_add_bmi(input_df):
+    # Add BMI feature
+    df = add_bmi(input_df)
+
+    # Should calculate BMI from height and weight
+    expected_bmi = df.weight / (df.height / 100) ** 2
+    assert np.array_equal(df.bmi.to_numpy(), expected_bmi.to_numpy())
+
+
+def test_get_model_features(input_df):
+    # Get model features
+    df = get_model_features(add_bmi(input_df))
+
+    # Should only include model features
+    assert "height" not in df.columns.tolist()
+    assert "cardiovascular_disease" not in df.columns.tolist()
+
+    # Should convert data types of model features
+    assert df.systolic.dtype == np.float64
+    assert df.gender.dtype == "category"
+
+
+def test_get_model_features_categories(input_df):
+    # Get model features with the category vocabularies of the feature metadata
+    categories = build_feature_metadata(input_df)["categories"]
+    categories["gender"] = ["male", "female", "other"]
+    df = get_model_features(add_bmi(input_df), categories=categories)
+
+    # Should encode categorical features with the given vocabularies
+    assert df.gender.cat.categories.tolist() == ["male", "female", "other"]
+    assert df.gender.astype(object).tolist() == input_df.gender.tolist()
+
+
+def test_get_model_features_column_order(input_df):
+    # Get model features in a given column order
+    feature_columns = build_feature_metadata(input_df)["feature_columns"][::-1]
+    df = get_model_features(add_bmi(input_df), feature_columns)
+
+    # Should return features in the given order
+    assert df.columns.tolist() == feature_columns
+
+
+def test_feature_metadata(input_df, tmp_path):
+    # Write and read feature metadata
+    feature_metadata = build_feature_metadata(input_df)
+    write_feature_metadata(feature_metadata, tmp_path / "features.json")
+    read_metadata = read_feature_metadata(tmp_path / "features.json")
+
+    # Should read the same metadata
+    assert read_metadata == feature_metadata
+
+    # Should record sorted category vocabularies of the training data
+    assert get_categories(read_metadata)[1] == [
+        "above-normal",
+        "normal",
+        "well-above-normal",
+    ]
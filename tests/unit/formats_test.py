@@ -0,0 +1,204 @@
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from pytest import mark, raises
+
+from src.utils.formats import (
+    concat_chunks,
+    get_file_extension,
+    get_file_format,
+    get_file_patterns,
+    read_file,
+    write_file,
+    write_file_chunks,
+)
+
+
+def test_get_file_format():
+    # Should infer file format from file extension
+    assert get_file_format("input.csv") == "csv"
+    assert get_file_format("input.parquet") == "parquet"
+    assert get_file_format("input.arrow") == "feather"
+    assert get_file_format("input.csv.gz") == "csv"
+
+    # Should use file format if given
+    assert get_file_format("input.txt", "csv") == "csv"
+
+    # Should raise an error for unsupported file extensions
+    with raises(ValueError):
+        get_file_format("input.txt")
+
+
+def test_get_file_extension():
+    # Should add the compression to the extension of CSV files only
+    assert get_file_extension("csv") == ".csv"
+    assert get_file_extension("csv", "gzip") == ".csv.gz"
+    assert get_file_extension("parquet", "gzip") == ".parquet"
+
+    # Should raise an error for unsupported CSV compression
+    with raises(ValueError):
+        get_file_extension("csv", "lz4")
+
+
+def test_get_file_patterns():
+    # Should return patterns for a single file format
+    assert get_file_patterns("csv") == ["*.csv"]
+
+    # Should return patterns for all file formats
+    assert len(get_file_patterns()) == 4
+
+
+@mark.parametrize("extension", [".csv", ".parquet", ".feather"])
+def test_write_read_file(extension, input_df, tmp_path):
+    # Write and read file
+    file_path = tmp_path / f"input{extension}"
+    write_file(input_df, file_path)
+    df = read_file(file_path, columns=["age", "gender"], dtype={"age": np.float64})
+
+    # Should only read the requested columns with the requested data types
+    assert sorted(df.columns.tolist()) == ["age", "gender"]
+    assert df.age.dtype == np.float64
+    assert df.gender.tolist() == input_df.gender.tolist()
+
+
+@mark.parametrize("extension", [".csv", ".parquet", ".feather"])
+def test_write_read_file_chunks(extension, input_df, tmp_path):
+    # Write file in chunks and read it back in chunks of a different size
+    file_path = tmp_path / f"input{extension}"
+    write_file_chunks([input_df.iloc[:5], input_df.iloc[5:]], file_path)
+    chunks = list(read_file(file_path, columns=["age"], chunk_rows=3))
+
+    # Should read chunks of the requested size
+    assert [len(chunk) for chunk in chunks] == [3, 3, 2]
+
+    # Should read all rows in order
+    df = pd.concat(chunks)
+    assert df.age.tolist() == input_df.age.tolist()
+
+
+@mark.parametrize("chunk_rows", [None, 3])
+@mark.parametrize("extension", [".parquet", ".feather"])
+def test_read_file_categories(extension, chunk_rows, input_df, tmp_path):
+    # Write file with string columns
+    file_path = tmp_path / f"input{extension}"
+    write_file(input_df, file_path)
+    dtype = {"gender": "category", "cholesterol": "category", "age": np.float64}
+    df = read_file(file_path, columns=list(dtype), dtype=dtype, chunk_rows=chunk_rows)
+    df = concat_chunks(df) if chunk_rows else df
+
+    # Should read columns requested as categories as pandas categories
+    assert isinstance(df.gender.dtype, pd.CategoricalDtype)
+    assert isinstance(df.cholesterol.dtype, pd.CategoricalDtype)
+    assert df.age.dtype == np.float64
+    assert df.gender.tolist() == input_df.gender.tolist()
+    assert df.cholesterol.tolist() == input_df.cholesterol.tolist()
+
+
+@mark.parametrize("extension", [".parquet", ".feather"])
+def test_read_file_chunks_empty(extension, input_df, tmp_path):
+    # Write file without rows
+    file_path = tmp_path / f"input{extension}"
+    write_file(input_df.iloc[:0], file_path)
+
+    # Should read a single empty chunk so an output can still be written
+    chunks = list(read_file(file_path, columns=["age"], chunk_rows=3))
+    assert [len(chunk) for chunk in chunks] == [0]
+
+
+def test_write_file_chunks_failure(input_df, tmp_path):
+    # Fail while writing the chunks of a file
+    def chunks():
+        yield input_df
+        raise ValueError("read failed")
+
+    with raises(ValueError):
+        write_file_chunks(chunks(), tmp_path / "output.csv")
+
+    # Should not leave a partial or temporary file behind
+    assert list(tmp_path.iterdir()) == []
+
+    # Should only create the file once it is complete
+    write_file_chunks([input_df], tmp_path / "output.csv")
+    assert [path.name for path in tmp_path.iterdir()] == ["output.csv"]
+
+
+def test_write_file_folders(input_df, tmp_path):
+    # Should create missing folders of the file
+    write_file(input_df, tmp_path / "2024" / "01" / "output.csv")
+    assert (tmp_path / "2024" / "01" / "output.csv").exists()
+
+
+def test_write_file_compression(input_df, tmp_path):
+    # Write parquet file with the default compression
+    file_path = tmp_path / "output.parquet"
+    write_file(input_df, file_path)
+
+    # Should compress columns
+    metadata = pq.ParquetFile(file_path).metadata
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+
+
+@mark.parametrize("compression", ["gzip", "zip"])
+def test_write_file_chunks_compression(compression, input_df, tmp_path):
+    # Write compressed CSV file in a single chunk
+    file_path = tmp_path / f"output{get_file_extension('csv', compression)}"
+    write_file_chunks([input_df], file_path, compression=compression)
+
+    # Should read the same rows back
+    assert pd.read_csv(file_path).age.tolist() == input_df.age.tolist()
+
+
+def test_write_file_compression_member_name(input_df, tmp_path):
+    # Write compressed CSV files through a temporary file
+    write_file(input_df, tmp_path / "output.csv.zip", compression="zip")
+    write_file_chunks(
+        [input_df.iloc[:5], input_df.iloc[5:]],
+        tmp_path / "output.csv.gz",
+        "csv",
+        "gzip",
+    )
+
+    # Should name the compressed CSV file after the completed file
+    with zipfile.ZipFile(tmp_path / "output.csv.zip") as f:
+        assert f.namelist() == ["output.csv"]
+
+    with open(tmp_path / "output.csv.gz", "rb") as f:
+        header = f.read(1024)
+    assert header[10:header.index(b"\0", 10)] == b"output.csv"
+
+    # Should write the chunks as a single gzip stream
+    assert pd.read_csv(tmp_path / "output.csv.gz").age.tolist() == input_df.age.tolist()
+
+
+def test_write_file_chunks_compression_append(input_df, tmp_path):
+    # Write gzip compressed CSV file in chunks
+    file_path = tmp_path / "output.csv.gz"
+    write_file_chunks([input_df.iloc[:5], input_df.iloc[5:]], file_path, "csv", "gzip")
+
+    # Should read all rows of the appended chunks
+    assert pd.read_csv(file_path).age.tolist() == input_df.age.tolist()
+
+    # Should reject appending chunks to a zip archive
+    with raises(ValueError, match="Zip"):
+        write_file_chunks(
+            [input_df.iloc[:5], input_df.iloc[5:]],
+            tmp_path / "output.csv.zip",
+            "csv",
+            "zip",
+        )
+
+
+def test_concat_chunks(input_df):
+    # Split dataset into chunks with different category vocabularies
+    df = input_df.astype({"gender": "category", "cholesterol": "category"})
+    chunks = [chunk.astype(df.dtypes.to_dict()) for chunk in np.array_split(df, 3)]
+
+    # Should assemble the same values with categorical columns kept as categories
+    result = concat_chunks(iter(chunks))
+    assert result.dtypes.to_dict() == df.dtypes.to_dict()
+    pd.testing.assert_frame_equal(
+        result.astype({"gender": object, "cholesterol": object}),
+        input_df.reset_index(drop=True),
+    )
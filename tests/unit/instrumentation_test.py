@@ -0,0 +1,61 @@
+import json
+import time
+from unittest.mock import patch
+
+import pandas as pd
+
+from src.utils.instrumentation import StageMetrics, write_summary
+
+
+def test_stage_metrics_nested():
+    # Time a stage with a nested stage
+    metrics = StageMetrics("file")
+
+    with metrics.stage("write") as record:
+        record["rows"] += 10
+
+        with metrics.stage("read"):
+            time.sleep(0.05)
+
+    summary = metrics.summary()
+
+    # Should exclude the nested stage from the outer stage
+    assert summary["stages"]["read"]["seconds"] >= 0.05
+    assert summary["stages"]["write"]["seconds"] < 0.05
+    assert summary["stages"]["write"]["rows"] == 10
+    assert summary["slowest_stage"] == "read"
+    assert summary["peak_rss_bytes"] > 0
+
+
+@patch("src.utils.instrumentation.reset_peak_rss")
+def test_stage_metrics_peak_rss(mock_reset_peak_rss):
+    # Should only reset and report the peak memory of the process if tracked
+    assert StageMetrics("file").summary()["peak_rss_bytes"] > 0
+    assert mock_reset_peak_rss.call_count == 1
+
+    assert (
+        StageMetrics("file", track_peak_rss=False).summary()["peak_rss_bytes"] is None
+    )
+    assert mock_reset_peak_rss.call_count == 1
+
+
+def test_time_chunks(input_df):
+    # Time reading chunks of a dataframe
+    metrics = StageMetrics("file")
+    chunks = [input_df.iloc[:3], input_df.iloc[3:]]
+
+    df = pd.concat(metrics.time_chunks(chunks, "read"))
+
+    # Should yield every chunk and count their rows
+    assert len(df) == len(input_df)
+    assert metrics.stages["read"]["rows"] == len(input_df)
+
+
+def test_write_summary(tmp_path):
+    # Write summaries of two files
+    summaries = [{"name": "fast", "seconds": 1}, {"name": "slow", "seconds": 2}]
+    write_summary(summaries, str(tmp_path / "outputs" / "metrics.json"))
+
+    # Should write the slowest file first
+    with open(tmp_path / "outputs" / "metrics.json") as f:
+        assert [summary["name"] for summary in json.load(f)] == ["slow", "fast"]
@@ -0,0 +1,90 @@
+from src.utils.manifest import ScoreManifest
+
+
+def test_score_manifest(tmp_path):
+    # Record a scored input file in the manifest next to the outputs
+    input_file_path = tmp_path / "input" / "file_1.csv"
+    output_file_path = tmp_path / "output" / "file_1_scored.csv"
+    input_file_path.parent.mkdir()
+    output_file_path.parent.mkdir()
+    input_file_path.write_text("age\n50\n")
+    output_file_path.write_text("age,score\n50,1\n")
+
+    manifest_path = str(tmp_path / "output" / "manifest.json")
+    manifest = ScoreManifest(manifest_path, str(tmp_path / "input"))
+    manifest.record(str(input_file_path), str(output_file_path), "build_1")
+
+    # Should skip the file in a later run with the same model
+    manifest = ScoreManifest(manifest_path, str(tmp_path / "input"))
+    assert manifest.is_scored(str(input_file_path), "build_1")
+    assert not manifest.is_scored(str(input_file_path), "build_2")
+    assert manifest.files["file_1.csv"]["output_file"] == "file_1_scored.csv"
+
+    # Should not hash the input file when recording it
+    assert "sha256" not in manifest.files["file_1.csv"]
+
+    # Should rescore a changed file
+    input_file_path.write_text("age\n51\n")
+    assert not manifest.is_scored(str(input_file_path), "build_1")
+
+
+def test_score_manifest_replaced_output(tmp_path):
+    # Record a scored input file, then record it again after it changed
+    input_file_path = tmp_path / "file_1.csv"
+    input_file_path.write_text("age\n50\n")
+
+    manifest = ScoreManifest(str(tmp_path / "output" / "manifest.json"), str(tmp_path))
+    manifest.record(
+        str(input_file_path), str(tmp_path / "output" / "file_1_r1.csv"), "1"
+    )
+    manifest.record(
+        str(input_file_path), str(tmp_path / "output" / "file_1_r1.csv"), "1"
+    )
+    assert manifest.replaced_files == []
+
+    input_file_path.write_text("age\n51\n")
+    manifest.record(
+        str(input_file_path), str(tmp_path / "output" / "file_1_r2.csv"), "1"
+    )
+
+    # Should list the output of the earlier version to be removed
+    assert manifest.replaced_files == ["file_1_r1.csv"]
+    assert manifest.files["file_1.csv"]["output_file"] == "file_1_r2.csv"
+
+
+def test_score_manifest_missing_output(tmp_path):
+    # Record a scored file and remove its output
+    input_file_path = tmp_path / "file_1.csv"
+    input_file_path.write_text("age\n50\n")
+
+    manifest = ScoreManifest(str(tmp_path / "output" / "manifest.json"), str(tmp_path))
+    manifest.record(str(input_file_path), str(tmp_path / "output" / "file_1.csv"), "1")
+
+    # Should rescore the file
+    assert not manifest.is_scored(str(input_file_path), "1")
+
+
+def test_score_manifest_output_files(tmp_path):
+    # Record a scored file whose output was uploaded to storage
+    input_file_path = tmp_path / "file_1.csv"
+    input_file_path.write_text("age\n50\n")
+
+    manifest_path = str(tmp_path / "output" / "manifest.json")
+    manifest = ScoreManifest(manifest_path, str(tmp_path))
+    manifest.record(str(input_file_path), str(tmp_path / "output" / "file_1.csv"), "1")
+
+    # Should check the outputs in storage instead of the output folder
+    assert ScoreManifest(manifest_path, str(tmp_path), {"file_1.csv"}).is_scored(
+        str(input_file_path), "1"
+    )
+    assert not ScoreManifest(manifest_path, str(tmp_path), set()).is_scored(
+        str(input_file_path), "1"
+    )
+
+
+def test_score_manifest_unreadable(tmp_path):
+    # Read a partially written manifest
+    (tmp_path / "manifest.json").write_text('{"files": {')
+
+    # Should rescore every file
+    assert ScoreManifest(str(tmp_path / "manifest.json"), str(tmp_path)).files == {}
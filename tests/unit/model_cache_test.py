@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+
+from pytest import fixture, raises
+
+from src.utils.model_cache import LocalModelRegistry, ModelCache, hash_path
+
+
+@fixture
+def registry(tmp_path):
+    # Register a model folder in a local registry
+    model_dir = tmp_path / "outputs" / "model"
+    model_dir.mkdir(parents=True)
+    (model_dir / "model.pkl").write_bytes(b"model" * 100)
+    (model_dir / "features.json").write_text("{}")
+
+    registry = LocalModelRegistry(str(tmp_path / "registry"))
+    registry.register_model("model", str(model_dir), {"build_id": "build_1"})
+
+    return registry
+
+
+@fixture
+def model_cache(registry, tmp_path):
+    return ModelCache(str(tmp_path / "cache"), 1024 * 1024, registry)
+
+
+def test_get_model_downloads_once(model_cache, registry, monkeypatch):
+    # Count downloads from the registry
+    downloads = []
+    download_model = registry.download_model
+
+    def count_download(model_info, target_dir):
+        downloads.append(model_info["id"])
+        return download_model(model_info, target_dir)
+
+    monkeypatch.setattr(registry, "download_model", count_download)
+
+    # Get the model twice
+    model_path, model_info = model_cache.get_model("build_1")
+    cached_model_path, cached_model_info = model_cache.get_model("build_1")
+
+    # Should only download the model the first time
+    assert downloads == ["model:1"]
+    assert cached_model_path == model_path
+    assert cached_model_info["sha256"] == model_info["sha256"] == hash_path(model_path)
+    assert sorted(os.listdir(model_path)) == ["features.json", "model.pkl"]
+
+
+def test_get_model_redownloads_corrupted_model(model_cache):
+    # Corrupt the cached model file
+    model_path, model_info = model_cache.get_model("build_1")
+
+    with open(os.path.join(model_path, "model.pkl"), "wb") as f:
+        f.write(b"corrupted")
+
+    # Should replace the cached model with a new download
+    model_path, cached_model_info = model_cache.get_model("build_1")
+
+    assert cached_model_info["sha256"] == model_info["sha256"] == hash_path(model_path)
+
+
+def test_get_model_evicts_least_recently_used(registry, tmp_path):
+    # Register a second model version with another build id
+    model_dir = tmp_path / "outputs" / "model"
+    registry.register_model("model", str(model_dir), {"build_id": "build_2"})
+    model_size = sum(file.stat().st_size for file in model_dir.iterdir())
+
+    # Use a cache which only fits one model
+    model_cache = ModelCache(str(tmp_path / "cache"), model_size, registry, 0)
+    first_model_path, _ = model_cache.get_model("build_1")
+    second_model_path, _ = model_cache.get_model("build_2")
+
+    # Should evict the least recently used model only
+    assert not os.path.exists(first_model_path)
+    assert os.path.exists(second_model_path)
+
+
+def test_get_model_keeps_recently_used(registry, tmp_path):
+    # Register a second model version with another build id
+    model_dir = tmp_path / "outputs" / "model"
+    registry.register_model("model", str(model_dir), {"build_id": "build_2"})
+    model_size = sum(file.stat().st_size for file in model_dir.iterdir())
+
+    # Use a cache which only fits one model
+    model_cache = ModelCache(str(tmp_path / "cache"), model_size, registry)
+    first_model_path, _ = model_cache.get_model("build_1")
+    second_model_path, _ = model_cache.get_model("build_2")
+
+    # Should not evict a model which another process may still be loading
+    assert os.path.exists(first_model_path)
+    assert os.path.exists(second_model_path)
+
+
+def test_get_model_shared_cache(registry, tmp_path, monkeypatch):
+    # Count slow downloads from the registry
+    downloads = []
+    download_model = registry.download_model
+
+    def slow_download_model(model_info, target_dir):
+        downloads.append(model_info["id"])
+        time.sleep(0.1)
+        return download_model(model_info, target_dir)
+
+    monkeypatch.setattr(registry, "download_model", slow_download_model)
+
+    # Get the model from several caches sharing a directory at once
+    model_paths = []
+
+    def get_model():
+        model_cache = ModelCache(str(tmp_path / "cache"), 1024 * 1024, registry)
+        model_paths.append(model_cache.get_model("build_1")[0])
+
+    threads = [threading.Thread(target=get_model) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Should download the model once and share it
+    assert downloads == ["model:1"]
+    assert len(set(model_paths)) == 1
+    assert len(model_paths) == 4
+
+
+def test_get_model_not_found(model_cache):
+    # Should raise an error if no model has the build id
+    with raises(Exception, match="Model not found"):
+        model_cache.get_model("build_3")
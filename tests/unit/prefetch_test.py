@@ -0,0 +1,75 @@
+import threading
+
+from pytest import raises
+
+from src.utils.prefetch import BackgroundConsumer, prefetch
+
+
+def test_prefetch():
+    # Should yield every item in order
+    assert list(prefetch(range(10), 2)) == list(range(10))
+
+
+def test_prefetch_backpressure():
+    # Record how many items were produced before each item is consumed
+    produced = []
+
+    def produce():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    # Should only produce up to the queue size ahead of the consumer, plus the
+    # item waiting to be queued
+    for i in prefetch(produce(), 2):
+        assert len(produced) <= i + 4
+
+
+def test_prefetch_error():
+    def produce():
+        yield 1
+        raise ValueError("Failed to read")
+
+    # Should raise the error of the background thread in the consumer
+    items = prefetch(produce(), 2)
+    assert next(items) == 1
+
+    with raises(ValueError, match="Failed to read"):
+        next(items)
+
+
+def test_prefetch_close():
+    # Should stop the background thread when the consumer stops early
+    thread_count = threading.active_count()
+    items = prefetch(iter(range(1000)), 1)
+    next(items)
+    items.close()
+
+    assert threading.active_count() == thread_count
+
+
+def test_background_consumer():
+    consumed = []
+
+    # Should consume every item in order once closed
+    consumer = BackgroundConsumer(consumed.extend, 2)
+
+    for i in range(10):
+        consumer.put(i)
+
+    consumer.close()
+    assert consumed == list(range(10))
+
+
+def test_background_consumer_error():
+    def consume(items):
+        for item in items:
+            raise ValueError("Failed to write")
+
+    # Should raise the error of the background thread in the producer instead of
+    # waiting for space in the queue
+    consumer = BackgroundConsumer(consume, 1)
+
+    with raises(ValueError, match="Failed to write"):
+        for i in range(10):
+            consumer.put(i)
@@ -35,7 +35,7 @@ def test_register_model(mock_run):
     mock_run.parent.register_model.assert_called_once()
 
 
-@patch("src.train.register.AzureLogHandler", MagicMock())
+@patch("src.utils.telemetry.AzureLogHandler", MagicMock())
 @patch("src.train.register.Run", MagicMock())
 @patch("src.train.register.parse_args", MagicMock())
 @patch("src.train.register.set_logger", MagicMock())
@@ -47,3 +47,45 @@ def test_main(mock_register_model):
 
     # Should have made a call to register model
     mock_register_model.assert_called_once()
+
+
+@patch("src.utils.telemetry.AzureLogHandler", MagicMock())
+@patch("src.train.register.parse_args", MagicMock())
+@patch("src.train.register.set_logger", MagicMock())
+@patch("src.train.register.logger", MagicMock())
+@patch("src.train.register.Run")
+@patch("src.train.register.register_model")
+def test_main_skip_cv(mock_register_model, mock_run):
+    # Mock metrics of a run trained without cross validation, scored on a held out
+    # fold below the threshold
+    mock_run.get_context.return_value.parent.get_metrics.return_value = {
+        "skip_cv": 1,
+        "test_acccuracy": 0.5,
+    }
+
+    # Execute main
+    main()
+
+    # Should not register the model
+    mock_register_model.assert_not_called()
+    mock_run.get_context.return_value.parent.cancel.assert_called_once()
+
+
+@patch("src.utils.telemetry.AzureLogHandler", MagicMock())
+@patch("src.train.register.set_logger", MagicMock())
+@patch("src.train.register.logger", MagicMock())
+@patch("src.train.register.parse_args")
+@patch("src.train.register.Run")
+@patch("src.train.register.register_model")
+def test_main_unevaluated(mock_register_model, mock_run, mock_parse_args):
+    # Mock metrics of a run without an evaluation metric
+    mock_run.get_context.return_value.parent.get_metrics.return_value = {"skip_cv": 1}
+
+    # Should only register the model if explicitly allowed
+    mock_parse_args.return_value.register_unevaluated = False
+    main()
+    mock_register_model.assert_not_called()
+
+    mock_parse_args.return_value.register_unevaluated = True
+    main()
+    mock_register_model.assert_called_once()
@@ -1,8 +1,33 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from unittest.mock import MagicMock, patch
 
 import numpy as np
+import pandas as pd
+from pytest import raises
 
-from src.score.score import main, parse_args, score_data
+from src.features.features import build_feature_metadata, write_feature_metadata
+from src.features.validation import compile_validator
+from src.utils.manifest import ScoreManifest
+from src.score import score
+from src.score.score import (
+    featurize,
+    get_output_file_name,
+    load_model,
+    main,
+    parse_args,
+    read_data,
+    remove_replaced_files,
+    score_data,
+    score_data_chunks,
+    score_file,
+    score_files_parallel,
+    score_files_prefetch,
+    set_model,
+    stage_input_files,
+    upload_output_files,
+)
 
 
 def test_parse_args():
@@ -20,15 +45,135 @@ def test_parse_args():
     assert args.build_id is mock_arguments[1]
     assert args.input_datapath is mock_arguments[3]
     assert args.output_datapath is mock_arguments[5]
+    assert args.workers == 1
+    assert args.chunk_rows is None
+    assert args.input_format is None
+    assert args.output_format == "csv"
+    assert args.predictor == "sklearn"
+    assert args.model_cache_size == 1024
+    assert args.validate is False
+
+
+def test_get_output_file_name():
+    # Get output file names of the same input file in different runs
+    output_file_name = get_output_file_name("input.csv", "42", "run_1", ".parquet")
+    retried_file_name = get_output_file_name("input.csv", "42", "run_2", ".parquet")
+
+    # Should name outputs after the input file, build and run
+    assert output_file_name == "input.csv_42_run_1.parquet"
+    assert output_file_name != retried_file_name
+
+    # Should replace characters which are not safe in file names
+    assert get_output_file_name("input.csv", "a/b", "run 1", ".csv") == (
+        "input.csv_a_b_run_1.csv"
+    )
+
+    # Should name inputs with the same stem in different formats differently
+    output_file_names = {
+        get_output_file_name(file_name, "42", "run_1", ".csv")
+        for file_name in ["a.csv", "a.parquet"]
+    }
+    assert len(output_file_names) == 2
+
+    # Should mirror input folders instead of joining them into the file name
+    input_file_names = [
+        os.path.join("2024", "01", "a.csv"),
+        os.path.join("2024_01", "a.csv"),
+        "2024_01_a.csv",
+    ]
+    output_file_names = [
+        get_output_file_name(file_name, "42", "run_1", ".csv")
+        for file_name in input_file_names
+    ]
+    assert len(set(output_file_names)) == 3
+    assert output_file_names[0] == os.path.join("2024", "01", "a.csv_42_run_1.csv")
+
+
+@patch("src.score.score.model", None)
+@patch("src.score.score.compile_model")
+@patch("src.score.score.joblib")
+def test_load_model_compiled(mock_joblib, mock_compile_model):
+    # Load model with the compiled predictor
+    load_model("model.pkl", predictor="compiled")
+
+    # Should compile the deserialized model
+    mock_compile_model.assert_called_once_with(mock_joblib.load.return_value)
+    assert score.model is mock_compile_model.return_value
+
+
+@patch("src.score.score.model", None)
+@patch("src.score.score.feature_metadata", None)
+@patch("src.score.score.joblib")
+def test_load_model_folder(mock_joblib, input_df, tmp_path):
+    # Write feature metadata to model folder
+    feature_metadata = build_feature_metadata(input_df)
+    write_feature_metadata(feature_metadata, tmp_path / "features.json")
+
+    # Load model from folder
+    load_model(str(tmp_path))
+
+    # Should load the model file in the folder
+    mock_joblib.load.assert_called_once_with(str(tmp_path / "model.pkl"))
+
+    # Should load the feature metadata
+    assert score.feature_metadata == feature_metadata
+
+
+@patch("src.score.score.model", None)
+@patch("src.score.score.feature_metadata", None)
+@patch("src.score.score.joblib")
+@patch("src.score.score.load_compiled_model")
+def test_load_model_folder_compiled(mock_load_compiled_model, mock_joblib, tmp_path):
+    # Write feature metadata and a compiled model folder to the model folder
+    write_feature_metadata({}, tmp_path / "features.json")
+    (tmp_path / "compiled").mkdir()
+
+    # Load model from folder with the compiled predictor
+    load_model(str(tmp_path), predictor="compiled")
+
+    # Should memory map the compiled model instead of deserializing the pipeline
+    mock_load_compiled_model.assert_called_once_with(str(tmp_path / "compiled"))
+    mock_joblib.load.assert_not_called()
+    assert score.model is mock_load_compiled_model.return_value
+
+
+def test_featurize(input_df, tmp_path):
+    # Write input data to file
+    input_file_path = tmp_path / "input.csv"
+    input_df.to_csv(input_file_path, index=False)
+
+    # Read and featurize data
+    df = featurize(read_data(input_file_path))
+
+    # Should only include model features
+    assert df.columns.tolist() == [
+        "gender",
+        "cholesterol",
+        "glucose",
+        "smoker",
+        "alcoholic",
+        "active",
+        "age",
+        "systolic",
+        "diastolic",
+        "bmi",
+    ]
+
+    # Should parse numeric features as float
+    assert (df.dtypes[["age", "systolic", "diastolic", "bmi"]] == np.float64).all()
+
+    # Should calculate BMI from height and weight
+    expected_bmi = input_df.weight / (input_df.height / 100) ** 2
+    assert np.array_equal(df.bmi.to_numpy(), expected_bmi.to_numpy())
 
 
 @patch("src.score.score.logger", MagicMock())
 @patch("src.score.score.model")
-@patch("src.score.score.pd")
-def test_score_data(mock_df, mock_model, input_df):
+@patch("src.score.score.read_file")
+def test_score_data(mock_read_file, mock_model, input_df):
     # Mock model predictions
     mock_model.predict_proba.return_value = np.array([[0.7, 0.3]] * input_df.shape[0])
-    mock_df.read_csv.return_value = input_df
+    mock_read_file.return_value = input_df
 
     # Run score data
     df = score_data("input")
@@ -46,24 +191,462 @@ def test_score_data(mock_df, mock_model, input_df):
     assert "score_datetime" in df.columns.tolist()
 
 
-@patch("src.score.score.Run", MagicMock())
+def predict_block_proba(df):
+    # Mock predictions which depend on the size of the prediction block, as the
+    # floating point results of a batched prediction do
+    probability = df.age.to_numpy() / 100 + len(df) / 1000
+
+    return np.column_stack([1 - probability, probability])
+
+
+@patch("src.score.score.predict_rows", 2)
+@patch("src.score.score.model")
+def test_score_data_chunks(mock_model, input_df, tmp_path):
+    # Mock model predictions which depend on the prediction block size
+    mock_model.predict_proba.side_effect = predict_block_proba
+
+    # Write an input file larger than a single chunk
+    input_file_path = tmp_path / "input.csv"
+    pd.concat([input_df] * 5).to_csv(input_file_path, index=False)
+
+    # Should carry rows over to the next chunk, so prediction blocks start at the
+    # same rows as without chunks when chunk_rows is not a multiple of predict_rows
+    chunks = list(score_data_chunks(input_file_path, 3))
+    assert all(len(df) % 2 == 0 for df in chunks[:-1])
+    assert max(len(df) for df in chunks) <= 3 + 2
+
+    df = score_data(input_file_path)
+    assert pd.concat(chunks).probability.tolist() == df.probability.tolist()
+
+
+@patch("src.score.score.logger", MagicMock())
+@patch("src.score.score.predict_rows", 2)
+@patch("src.score.score.datetime")
+@patch("src.score.score.model")
+@patch("src.score.score.args")
+def test_score_file_chunks(mock_args, mock_model, mock_datetime, input_df, tmp_path):
+    # Mock model predictions and a fixed scoring time
+    mock_model.predict_proba.side_effect = predict_block_proba
+    mock_datetime.now.return_value = datetime(2020, 1, 1)
+
+    # Write an input file larger than a single chunk
+    input_file_path = tmp_path / "input.csv"
+    pd.concat([input_df] * 5).to_csv(input_file_path, index=False)
+
+    # Score file with and without chunks
+    mock_args.configure_mock(
+        chunk_rows=None,
+        input_format=None,
+        output_format="csv",
+        output_compression=None,
+        validate=False,
+    )
+    score_file(input_file_path, tmp_path / "output.csv")
+
+    mock_args.chunk_rows = 3
+    file_metrics = score_file(input_file_path, tmp_path / "output_chunks.csv")
+
+    # Should write identical results
+    output = (tmp_path / "output.csv").read_bytes()
+    output_chunks = (tmp_path / "output_chunks.csv").read_bytes()
+    assert output == output_chunks
+
+    # Should time every stage of the chunks
+    assert set(file_metrics["stages"]) == {"read", "featurize", "predict", "write"}
+    assert file_metrics["stages"]["write"]["rows"] == len(input_df) * 5
+
+
+@patch("src.score.score.logger", MagicMock())
+@patch("src.score.score.predict_rows", 2)
+@patch("src.score.score.validator", compile_validator())
+@patch("src.score.score.model")
+@patch("src.score.score.args")
+def test_score_file_validate(mock_args, mock_model, input_df, tmp_path):
+    # Mock model predictions
+    mock_model.predict_proba.side_effect = predict_block_proba
+
+    # Write an input file with an invalid type and an out of range value
+    input_file_path = tmp_path / "input.csv"
+    df = pd.concat([input_df] * 3, ignore_index=True).astype({"age": object})
+    df.loc[1, "age"] = "unknown"
+    df.loc[4, "systolic"] = 1000
+    df.to_csv(input_file_path, index=False)
+
+    # Score file in chunks with validation
+    mock_args.configure_mock(
+        output_datapath=str(tmp_path),
+        chunk_rows=3,
+        input_format=None,
+        output_format="csv",
+        output_compression=None,
+        validate=True,
+    )
+    score_file(input_file_path, tmp_path / "output.csv")
+
+    # Should score the valid rows and quarantine the invalid rows
+    output_df = pd.read_csv(tmp_path / "output.csv")
+    quarantine_df = pd.read_csv(tmp_path / "quarantine" / "output.csv")
+    assert len(output_df) == len(df) - 2
+    assert quarantine_df.validation_error.tolist() == [
+        "invalid_type:age",
+        "out_of_range:systolic",
+    ]
+
+
+@patch("src.score.score.logger", MagicMock())
+@patch("src.score.score.log_file_metrics", MagicMock())
+@patch("src.score.score.predict_rows", 2)
+@patch("src.score.score.validator", compile_validator())
+@patch("src.score.score.datetime")
+@patch("src.score.score.model")
+@patch("src.score.score.args")
+def test_score_files_prefetch(mock_args, mock_model, mock_datetime, input_df, tmp_path):
+    # Mock model predictions and a fixed scoring time
+    mock_model.predict_proba.side_effect = predict_block_proba
+    mock_datetime.now.return_value = datetime(2020, 1, 1)
+
+    # Write input files with an out of range value
+    input_file_paths = []
+
+    for i in range(3):
+        input_file_paths.append(tmp_path / f"input_{i}.csv")
+        df = pd.concat([input_df] * (i + 2), ignore_index=True)
+        df.loc[1, "systolic"] = 1000
+        df.to_csv(input_file_paths[-1], index=False)
+
+    for chunk_rows in [None, 3]:
+        # Score files one after another and in the prefetching pipeline
+        output_dir = tmp_path / f"output_{chunk_rows}"
+        output_dir.mkdir()
+
+        mock_args.configure_mock(
+            build_id="build_id",
+            output_datapath=str(output_dir),
+            chunk_rows=chunk_rows,
+            input_format=None,
+            output_format="csv",
+            output_compression=None,
+            validate=True,
+            prefetch=1,
+        )
+
+        for input_file_path in input_file_paths:
+            score_file(input_file_path, output_dir / f"{input_file_path.stem}.csv")
+
+        manifest = MagicMock()
+        file_metrics = score_files_prefetch(
+            [
+                (input_file_path, output_dir / f"{input_file_path.stem}_prefetch.csv")
+                for input_file_path in input_file_paths
+            ],
+            manifest,
+        )
+
+        # Should write identical results and quarantine files in input order
+        for input_file_path in input_file_paths:
+            for folder in [output_dir, output_dir / "quarantine"]:
+                output = (folder / f"{input_file_path.stem}.csv").read_bytes()
+                output_prefetch = (
+                    folder / f"{input_file_path.stem}_prefetch.csv"
+                ).read_bytes()
+                assert output == output_prefetch
+
+        assert [metrics["name"] for metrics in file_metrics] == input_file_paths
+        assert manifest.record.call_count == len(input_file_paths)
+
+        # Should not report a peak memory per file, as the files overlap
+        assert file_metrics[0]["peak_rss_bytes"] is None
+
+        # Should time every stage of the files
+        assert set(file_metrics[0]["stages"]) >= {
+            "read",
+            "validate",
+            "featurize",
+            "predict",
+            "write",
+        }
+
+    # Should write identical results with and without chunks
+    for input_file_path in input_file_paths:
+        output = tmp_path / "output_None" / f"{input_file_path.stem}_prefetch.csv"
+        output_chunks = tmp_path / "output_3" / f"{input_file_path.stem}_prefetch.csv"
+        assert output.read_bytes() == output_chunks.read_bytes()
+
+
+@patch("src.score.score.logger", MagicMock())
+@patch("src.score.score.log_file_metrics", MagicMock())
+@patch("src.score.score.model")
+@patch("src.score.score.args")
+def test_score_files_prefetch_failure(mock_args, mock_model, input_df, tmp_path):
+    # Fail to score the second file
+    mock_model.predict_proba.side_effect = [
+        np.zeros((len(input_df), 2)),
+        ValueError("Failed to predict"),
+    ]
+    input_df.to_csv(tmp_path / "input.csv", index=False)
+    mock_args.configure_mock(
+        chunk_rows=None,
+        input_format=None,
+        output_format="csv",
+        output_compression=None,
+        validate=False,
+        prefetch=1,
+    )
+
+    # Should raise the error of the failed file
+    manifest = MagicMock()
+
+    with raises(ValueError, match="Failed to predict"):
+        score_files_prefetch(
+            [(tmp_path / "input.csv", tmp_path / f"output_{i}.csv") for i in range(3)],
+            manifest,
+        )
+
+    # Should record the file written before the failure in the manifest
+    manifest.record.assert_called_once_with(
+        tmp_path / "input.csv", tmp_path / "output_0.csv", mock_args.build_id
+    )
+
+
+@patch("src.score.score.logger", MagicMock())
+@patch("src.score.score.log_file_metrics", MagicMock())
+@patch("src.score.score.predict_rows", 2)
+@patch("src.score.score.model")
+@patch("src.score.score.args")
+def test_score_files_prefetch_failure_chunks(mock_args, mock_model, input_df, tmp_path):
+    # Fail to score the second chunk of the second file
+    calls = []
+
+    def predict_proba(df):
+        calls.append(len(df))
+
+        if len(calls) == -(-len(input_df) // 2) + 2:
+            raise ValueError("Failed to predict")
+
+        return np.zeros((len(df), 2))
+
+    mock_model.predict_proba.side_effect = predict_proba
+    input_df.to_csv(tmp_path / "input.csv", index=False)
+    mock_args.configure_mock(
+        chunk_rows=2,
+        input_format=None,
+        output_format="csv",
+        output_compression=None,
+        validate=False,
+        prefetch=1,
+    )
+
+    # Should raise the error of the failed file
+    manifest = MagicMock()
+
+    with raises(ValueError, match="Failed to predict"):
+        score_files_prefetch(
+            [(tmp_path / "input.csv", tmp_path / f"output_{i}.csv") for i in range(3)],
+            manifest,
+        )
+
+    # Should record the first file and drop the partially written second file
+    assert manifest.record.call_count == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "input.csv",
+        "output_0.csv",
+    ]
+
+
+@patch(
+    "src.score.score.Run",
+    MagicMock(**{"get_context.return_value.id": "run_id"}),
+)
 @patch("src.score.score.logger", MagicMock())
 @patch("src.score.score.datetime", MagicMock())
-@patch("src.score.score.parse_args", MagicMock())
+@patch(
+    "src.score.score.parse_args",
+    MagicMock(
+        return_value=MagicMock(
+            build_id="build_id",
+            workers=1,
+            prefetch=0,
+            chunk_rows=None,
+            input_format=None,
+            output_format="csv",
+            output_compression=None,
+            validate=False,
+            start_date=None,
+            end_date=None,
+            input_storage_url=None,
+            output_storage_url=None,
+        )
+    ),
+)
 @patch("src.score.score.set_logger", MagicMock())
+@patch("src.score.score.ModelCache", MagicMock())
 @patch("src.score.score.set_model", MagicMock())
-@patch("src.score.score.os.chdir", MagicMock())
 @patch("src.score.score.os.makedirs", MagicMock())
 @patch("src.score.score.os.path.join", MagicMock())
+@patch("src.score.score.os.path.getsize", MagicMock())
 @patch("src.score.score.score_data", MagicMock())
+@patch("src.score.score.StageMetrics", MagicMock())
+@patch("src.score.score.log_file_metrics", MagicMock())
+@patch("src.score.score.write_summary")
+@patch("src.score.score.ScoreManifest")
 @patch("src.score.score.write_data")
-@patch("src.score.score.glob")
-def test_main(mock_glob, mock_write_data):
-    # Mock file list to score
-    mock_glob.glob.return_value = ["file_1", "file_2"]
+@patch("src.score.score.walk_files")
+def test_main(mock_walk_files, mock_write_data, mock_manifest, mock_write_summary):
+    # Mock file list to score, none of which were scored in an earlier run
+    mock_walk_files.return_value = iter(["file_1", "file_2"])
+    mock_manifest.return_value.is_scored.return_value = False
 
     # Run main
     main()
 
     # Assert files have been passed to function to score
-    mock_write_data.assert_called()
+    assert mock_write_data.call_count == 2
+
+    # Should write the metrics of every file to the summary
+    assert len(mock_write_summary.call_args[0][0]) == mock_write_data.call_count
+
+    # Should record every scored file in the manifest
+    assert mock_manifest.return_value.record.call_count == mock_write_data.call_count
+
+
+@patch("src.score.score.logger", MagicMock())
+@patch("src.score.score.args")
+def test_stage_and_upload_files(mock_args, tmp_path):
+    # Write input files in a local stand-in for the input storage
+    input_storage_dir = tmp_path / "input_storage"
+    (input_storage_dir / "2024" / "01" / "31").mkdir(parents=True)
+    (input_storage_dir / "2024" / "01" / "31" / "a.csv").write_text("age\n50\n")
+    (input_storage_dir / "2024" / "02" / "01").mkdir(parents=True)
+    (input_storage_dir / "2024" / "02" / "01" / "b.csv").write_text("age\n51\n")
+    (input_storage_dir / "notes.txt").write_text("")
+
+    mock_args.configure_mock(
+        input_storage_url=str(input_storage_dir),
+        output_storage_url=str(tmp_path / "output_storage"),
+        input_datapath=str(tmp_path / "input"),
+        output_datapath=str(tmp_path / "output"),
+        storage_concurrency=2,
+        include=None,
+        exclude=None,
+        input_format="csv",
+        start_date="2024-01-31",
+        end_date="2024-01-31",
+        rescore=False,
+        build_id="1",
+    )
+    output_dir = tmp_path / "output"
+    manifest = ScoreManifest(
+        str(output_dir / "score_manifest.json"), str(tmp_path / "input"), set()
+    )
+
+    # Should only stage the selected input files
+    stage_input_files(manifest)
+    input_file_path = tmp_path / "input" / "2024" / "01" / "31" / "a.csv"
+    assert [
+        path.relative_to(tmp_path / "input").as_posix()
+        for path in (tmp_path / "input").rglob("*")
+        if path.is_file()
+    ] == ["2024/01/31/a.csv"]
+
+    # Record a scored file with a quarantine file
+    (output_dir / "quarantine").mkdir(parents=True)
+    (output_dir / "a_1.csv").write_text("age,score\n50,1\n")
+    (output_dir / "quarantine" / "a_1.csv").write_text("age\n\n")
+    manifest.record(str(input_file_path), str(output_dir / "a_1.csv"), "1")
+
+    # Should upload the output, quarantine and manifest files
+    upload_output_files(manifest)
+    assert sorted(
+        path.relative_to(tmp_path / "output_storage").as_posix()
+        for path in (tmp_path / "output_storage").rglob("*")
+        if path.is_file()
+    ) == ["a_1.csv", "quarantine/a_1.csv", "score_manifest.json"]
+
+    # Should not download the scored file again in a later run
+    input_file_path.unlink()
+    stage_input_files(
+        ScoreManifest(
+            str(output_dir / "score_manifest.json"),
+            str(tmp_path / "input"),
+            {"a_1.csv"},
+        )
+    )
+    assert not input_file_path.exists()
+
+    # Should download the file again once it changed in storage
+    (input_storage_dir / "2024" / "01" / "31" / "a.csv").write_text("age\n52\n")
+    stage_input_files(
+        ScoreManifest(
+            str(output_dir / "score_manifest.json"),
+            str(tmp_path / "input"),
+            {"a_1.csv"},
+        )
+    )
+    assert input_file_path.exists()
+
+    # Record the changed file with a new output
+    manifest = ScoreManifest(
+        str(output_dir / "score_manifest.json"), str(tmp_path / "input"), {"a_1.csv"}
+    )
+    (output_dir / "a_2.csv").write_text("age,score\n52,1\n")
+    manifest.record(str(input_file_path), str(output_dir / "a_2.csv"), "1")
+    upload_output_files(manifest)
+
+    # Should remove the output and quarantine file of the earlier version
+    remove_replaced_files(manifest)
+    assert sorted(
+        path.relative_to(tmp_path / "output_storage").as_posix()
+        for path in (tmp_path / "output_storage").rglob("*")
+        if path.is_file()
+    ) == ["a_2.csv", "score_manifest.json"]
+    assert not (output_dir / "a_1.csv").exists()
+    assert manifest.replaced_files == []
+
+
+@patch("src.score.score.model", None)
+@patch("src.score.score.feature_metadata", None)
+@patch("src.score.score.loaded_models", {})
+@patch("src.score.score.load_model")
+def test_set_model_reuses_loaded_model(mock_load_model):
+    # Mock a cached model folder
+    mock_model_cache = MagicMock()
+    mock_model_cache.get_model.return_value = (
+        "model",
+        {"id": "model:1", "sha256": "hash"},
+    )
+
+    # Set the same model twice
+    set_model("build_id", mock_model_cache)
+    set_model("build_id", mock_model_cache)
+
+    # Should only deserialize the model once
+    mock_load_model.assert_called_once_with("model", "sklearn")
+
+
+@patch("src.score.score.args", MagicMock(workers=2))
+@patch("src.score.score.logger", MagicMock())
+@patch("src.score.score.load_model", MagicMock())
+@patch("src.score.score.ProcessPoolExecutor", ThreadPoolExecutor)
+@patch("src.score.score.log_file_metrics")
+@patch("src.score.score.score_file")
+def test_score_files_parallel(mock_score_file, mock_log_file_metrics):
+    # Mock a failure for the second file only
+    def score_file(input_file_path, output_file_path):
+        if input_file_path == "input_2":
+            raise Exception("bad file")
+        return {"name": input_file_path, "output_file_path": output_file_path}
+
+    mock_score_file.side_effect = score_file
+    file_paths = [
+        ("input_1", "output_1"),
+        ("input_2", "output_2"),
+        ("input_3", "output_3"),
+    ]
+
+    # Should report the failed file once all files have been attempted
+    with raises(Exception, match="input_2"):
+        score_files_parallel(file_paths, "model_path")
+
+    # Should have attempted to score every file and logged the scored files
+    assert mock_score_file.call_count == len(file_paths)
+    assert mock_log_file_metrics.call_count == 2
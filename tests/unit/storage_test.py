@@ -0,0 +1,89 @@
+import asyncio
+
+from pytest import raises
+
+from src.utils.storage import (
+    AzureBlobStorage,
+    LocalStorage,
+    delete_files,
+    download_files,
+    get_storage,
+    list_files,
+    transfer_files,
+    upload_files,
+)
+
+
+def test_local_storage(tmp_path):
+    # Write local files in a nested folder
+    source_dir = tmp_path / "source"
+    (source_dir / "2024" / "01").mkdir(parents=True)
+    (source_dir / "a.csv").write_text("a")
+    (source_dir / "2024" / "01" / "b.csv").write_text("b")
+
+    # Upload the files to storage
+    storage = LocalStorage(str(tmp_path / "storage"))
+    upload_files(storage, str(source_dir), ["a.csv", "2024/01/b.csv"], 2)
+
+    # Should list the files with "/" separated names and their sizes
+    files = list_files(storage)
+    assert list(files) == ["2024/01/b.csv", "a.csv"]
+    assert files["a.csv"]["size"] == 1
+
+    # Should download the files to the same names
+    target_dir = tmp_path / "target"
+    download_files(storage, str(target_dir), ["2024/01/b.csv"], 2)
+
+    assert (target_dir / "2024" / "01" / "b.csv").read_text() == "b"
+    assert not (target_dir / "a.csv").exists()
+
+    # Should delete the files, ignoring files which do not exist
+    delete_files(storage, ["a.csv", "c.csv"], 2)
+    assert list(list_files(storage)) == ["2024/01/b.csv"]
+
+
+def test_local_storage_missing_file(tmp_path):
+    # Should raise the error of a failed download without leaving partial files
+    with raises(FileNotFoundError):
+        download_files(
+            LocalStorage(str(tmp_path / "storage")), str(tmp_path), ["a.csv"]
+        )
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_get_storage():
+    # Should use blob storage for container urls, with an optional prefix
+    storage = get_storage(
+        "https://account.blob.core.windows.net/container/scoring/input", "key"
+    )
+    assert isinstance(storage, AzureBlobStorage)
+    assert storage.account_url == "https://account.blob.core.windows.net"
+    assert storage.container_name == "container"
+    assert storage.get_blob_name("a.csv") == "scoring/input/a.csv"
+    assert storage.credential == "key"
+
+    storage = get_storage("https://account.blob.core.windows.net/container")
+    assert storage.get_blob_name("a.csv") == "a.csv"
+
+    # Should use local storage for paths and file urls
+    assert get_storage("/data/input").root_dir == "/data/input"
+    assert get_storage("file:///data/input").root_dir == "/data/input"
+
+
+def test_transfer_files():
+    # Record the number of transfers in flight
+    in_flight = []
+    transferred = []
+
+    async def transfer(name):
+        in_flight.append(name)
+        await asyncio.sleep(0.01)
+        transferred.append((name, len(in_flight)))
+        in_flight.remove(name)
+
+    asyncio.run(transfer_files(transfer, [(i,) for i in range(10)], 3))
+
+    # Should transfer every item with at most concurrency transfers in flight
+    assert sorted(name for name, _ in transferred) == list(range(10))
+    assert max(count for _, count in transferred) == 3
@@ -0,0 +1,77 @@
+import logging
+import threading
+
+from src.utils.telemetry import MemoryExporter, TelemetryHandler, get_logger
+
+
+def test_get_logger():
+    # Set a logger with an in memory exporter twice
+    exporter = MemoryExporter()
+    logger = get_logger("telemetry_test", exporter)
+    logger = get_logger("telemetry_test", MemoryExporter())
+
+    logger.info({"output_file_path": "output.csv"})
+    logger.handlers[0].flush()
+
+    # Should only add one handler, exporting records from the background thread
+    assert len(logger.handlers) == 1
+    assert [record.msg for record in exporter.records] == [
+        {"output_file_path": "output.csv"}
+    ]
+
+    logger.handlers[0].close()
+
+
+def test_telemetry_handler_drops_records():
+    # Block the exporter so the queue fills up
+    exporter = MemoryExporter()
+    export = exporter.export
+    exporting = threading.Event()
+    release = threading.Event()
+
+    def blocking_export(records):
+        exporting.set()
+        release.wait()
+        export(records)
+
+    exporter.export = blocking_export
+    handler = TelemetryHandler(exporter, max_queue_size=1)
+    logger = logging.getLogger("telemetry_test_drops")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+
+    # Log while the first record is being exported
+    logger.info("first")
+    exporting.wait()
+
+    for idx in range(3):
+        logger.info(f"record {idx}")
+
+    release.set()
+    handler.close()
+
+    # Should drop records without blocking and report the number dropped
+    assert handler.dropped == 2
+    assert [record.msg for record in exporter.records] == [
+        "first",
+        "record 0",
+        {"telemetry_dropped": 2, "telemetry_failed": 0},
+    ]
+
+
+def test_telemetry_handler_failed_export():
+    # Export to a failing exporter
+    class FailingExporter:
+        def export(self, records):
+            raise ConnectionError("unavailable")
+
+    handler = TelemetryHandler(FailingExporter())
+    logger = logging.getLogger("telemetry_test_failed")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    logger.info("record")
+    handler.close()
+
+    # Should count the failed records instead of raising, including the report of
+    # the failed records
+    assert handler.failed == 2
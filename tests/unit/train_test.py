@@ -2,9 +2,30 @@ from unittest.mock import MagicMock, patch
 
 import numpy as np
 import pandas as pd
+from pytest import raises
+from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 
-from src.train.train import load_data, main, preprocess_data, train_model
+from src.features.features import build_feature_metadata, target
+from src.train.train import (
+    load_data,
+    load_data_chunks,
+    main,
+    parse_args,
+    preprocess_data,
+    get_dataset_partitions,
+    train_incremental,
+    train_model,
+    train_model_incremental,
+)
+
+
+def test_parse_args():
+    args = parse_args(["--cv_jobs", "4", "--cv_backend", "thread"])
+
+    assert args.cv_folds == 10
+    assert args.cv_jobs == 4
+    assert args.cv_backend == "thread"
 
 
 @patch("azureml.data.TabularDataset")
@@ -27,6 +48,33 @@ def test_load_data(mock_run, mock_tabular_dataset, input_df):
     assert set(return_df.columns) == set(input_df.columns)
 
 
+@patch("src.train.train.run")
+def test_load_data_chunks(mock_run, input_df, tmp_path):
+    # Write dataset to parquet files, with a duplicate record in the second file
+    file_paths = [str(tmp_path / "part_0.parquet"), str(tmp_path / "part_1.parquet")]
+    input_df.iloc[:5].to_parquet(file_paths[0])
+    input_df.iloc[[0] + list(range(5, len(input_df)))].to_parquet(file_paths[1])
+
+    # Load dataset in chunks
+    df = load_data_chunks(2, file_paths)
+
+    # Should drop the duplicate and decode categorical columns as categories
+    assert len(df) == len(input_df)
+    assert df["gender"].dtype == "category"
+    assert df["height"].dtype == np.float64
+    mock_run.log.assert_called_once_with("dropped_rows_duplicate_chunks", 1)
+
+    # Should be usable by the following training steps, without looking for
+    # duplicates again
+    with patch("src.train.train.get_duplicate_mask") as mock_get_duplicate_mask:
+        assert len(preprocess_data(df, deduplicated=True)) == len(input_df)
+
+    mock_get_duplicate_mask.assert_not_called()
+    assert "dropped_rows_duplicate" not in [
+        call[0][0] for call in mock_run.log.call_args_list
+    ]
+
+
 @patch("src.train.train.run", MagicMock())
 def test_preprocess_data(input_df):
     # Return dataframe after processing data
@@ -42,7 +90,7 @@ def test_preprocess_data(input_df):
 @patch("src.train.train.run", MagicMock())
 def test_preprocess_data_nulls(data):
     # Create dataset with additional record with null
-    null_record = data[0]
+    null_record = dict(data[0])
     null_record["age"] = np.nan
     data.append(null_record)
 
@@ -50,8 +98,9 @@ def test_preprocess_data_nulls(data):
     input_df = pd.DataFrame(data)
     df = preprocess_data(input_df)
 
-    # Should return a dataframe with the same rows and an additional columns
-    assert df.shape == (input_df.shape[0], input_df.shape[1] + 1)
+    # Should return a dataframe without the additional record and an additional
+    # column, leaving the input dataframe unchanged
+    assert df.shape == (input_df.shape[0] - 1, input_df.shape[1] + 1)
 
     # Should include column for BMI
     assert "bmi" in df.columns.tolist()
@@ -66,13 +115,36 @@ def test_preprocess_data_duplicates(data):
     input_df = pd.DataFrame(data)
     df = preprocess_data(input_df)
 
-    # Should return a dataframe with the same rows and an additional columns
-    assert df.shape == (input_df.shape[0], input_df.shape[1] + 1)
+    # Should return a dataframe without the additional record and an additional
+    # column, leaving the input dataframe unchanged
+    assert df.shape == (input_df.shape[0] - 1, input_df.shape[1] + 1)
 
     # Should include column for BMI
     assert "bmi" in df.columns.tolist()
 
 
+@patch("src.train.train.run")
+def test_preprocess_data_outliers(mock_run, data):
+    # Create dataset with a height outlier, a missing value and a duplicate
+    outlier_record = dict(data[0], height=10000)
+    null_record = dict(data[1], age=np.nan)
+    input_df = pd.DataFrame(data * 10 + [outlier_record, null_record])
+    input_df["age"] = input_df["age"] + np.arange(len(input_df))
+
+    # Return dataframe after processing data
+    df = preprocess_data(pd.concat([input_df, input_df.iloc[[0]]], ignore_index=True))
+
+    # Should remove the outlier, the missing value and the duplicate
+    assert len(df) == len(input_df) - 2
+    assert df["height"].max() < 10000
+
+    # Should log the number of records removed by each rule
+    mock_run.log.assert_any_call("dropped_rows_missing", 1)
+    mock_run.log.assert_any_call("dropped_rows_duplicate", 1)
+    mock_run.log.assert_any_call("dropped_rows_height_outlier", 1)
+    mock_run.log.assert_any_call("dropped_rows_weight_outlier", 0)
+
+
 @patch("src.train.train.cross_validate")
 @patch("src.train.train.run", MagicMock())
 def test_train_model(mock_cross_validate, input_df, cv_results):
@@ -86,11 +158,169 @@ def test_train_model(mock_cross_validate, input_df, cv_results):
     # Should return an sklearn pipeline
     assert type(model) == Pipeline
 
+    # Should encode categories with the vocabularies of the training data
+    encoder = model.named_steps["preprocessor"].named_transformers_["categorical"]
+    assert encoder.categories_[0].tolist() == ["female", "male"]
+
+
+@patch("src.train.train.cross_validate")
+@patch("src.train.train.run")
+def test_train_model_parallel(mock_run, mock_cross_validate, input_df, cv_results):
+    # Mock retuirn value of cross_validate
+    mock_cross_validate.return_value = cv_results
+
+    # Train model with parallel cross validation
+    df = preprocess_data(input_df)
+    model = train_model(df, cv_folds=5, n_jobs=2, backend="thread")
+
+    # Should run the folds in parallel and pass the job count to the pipeline
+    assert mock_cross_validate.call_args[1]["cv"] == 5
+    assert mock_cross_validate.call_args[1]["n_jobs"] == 2
+    assert model.named_steps["preprocessor"].n_jobs == 2
+
+    # Should log fold timings as run metrics
+    mock_run.log_list.assert_any_call("cv_fit_time", cv_results["fit_time"].tolist())
+    logged_metrics = [call[0][0] for call in mock_run.log.call_args_list]
+    assert {"cv_time", "final_fit_time"} <= set(logged_metrics)
+
+
+@patch("src.train.train.cross_validate")
+@patch("src.train.train.run")
+def test_train_model_skip_cv(mock_run, mock_cross_validate, input_df):
+    # Train model in fast retrain mode
+    df = preprocess_data(pd.concat([input_df] * 10, ignore_index=True))
+    df[target] = np.arange(len(df)) % 2
+    model = train_model(df, skip_cv=True)
+
+    # Should only fit the final model and score it on a held out fold
+    mock_cross_validate.assert_not_called()
+    assert hasattr(model.named_steps["classifier"], "coef_")
+    assert "test_acccuracy" in [call[0][0] for call in mock_run.log.call_args_list]
+
+
+@patch("src.train.train.cross_validate")
+@patch("src.train.train.run", MagicMock())
+def test_train_model_parallel_final_fit(mock_cross_validate, input_df, cv_results):
+    # Mock retuirn value of cross_validate
+    mock_cross_validate.return_value = cv_results
+
+    # Train model with the final fit running alongside cross validation
+    df = preprocess_data(input_df)
+    model = train_model(df, parallel_final_fit=True)
+
+    # Should evaluate the model and return the fitted final model
+    mock_cross_validate.assert_called_once()
+    assert hasattr(model.named_steps["classifier"], "coef_")
+
+
+@patch("src.train.train.run", MagicMock())
+def test_train_model_warm_start(input_df):
+    # Create a larger dataset with both classes in every fold
+    df = preprocess_data(pd.concat([input_df] * 10, ignore_index=True))
+    df[target] = np.arange(len(df)) % 2
+
+    # Train model with the lbfgs solver seeded from the fold models
+    model = train_model(df, cv_folds=2, solver="lbfgs", warm_start=True)
+
+    # Should warm start the final fit
+    classifier = model.named_steps["classifier"]
+    assert classifier.warm_start
+    assert classifier.coef_.shape[0] == 1
+
+
+@patch("src.train.train.run")
+def test_train_model_incremental(mock_run, input_df):
+    # Train a new incremental model
+    df = preprocess_data(input_df)
+    feature_metadata = build_feature_metadata(df)
+    model = train_model_incremental(df, feature_metadata)
+
+    # Should not evaluate a new model before it has been fitted
+    assert "test_acccuracy" not in [call[0][0] for call in mock_run.log.call_args_list]
+    assert model.named_steps["classifier"].coef_.shape[0] == 1
+
+    # Resume training from the model on new data in chunks
+    model = train_model_incremental(df, feature_metadata, model, chunk_rows=3)
+
+    # Should keep the scaling of the first fit and evaluate the new data before
+    # fitting
+    scaler = model.named_steps["preprocessor"].named_transformers_["numeric"]
+    assert scaler.n_samples_seen_ == len(df)
+    assert "test_acccuracy" in [call[0][0] for call in mock_run.log.call_args_list]
+
+
+@patch("src.train.train.run", MagicMock())
+@patch("src.train.train.load_previous_model")
+def test_train_incremental(mock_load_previous_model, input_df, tmp_path):
+    # Write two dataset partitions with the same file names, as downloaded from the
+    # dataset
+    partitions = {
+        "date=2024-01-01": [str(tmp_path / "1" / "part-00000.parquet")],
+        "date=2024-01-02": [str(tmp_path / "2" / "part-00000.parquet")],
+    }
+    (tmp_path / "1").mkdir()
+    (tmp_path / "2").mkdir()
+    input_df.to_parquet(partitions["date=2024-01-01"][0])
+    input_df.assign(age=input_df["age"] + 1).to_parquet(
+        partitions["date=2024-01-02"][0]
+    )
+
+    # Train from a previous model which does not support partial_fit
+    mock_load_previous_model.return_value = (
+        Pipeline(steps=[("classifier", LogisticRegression())]),
+        {},
+    )
+    model, feature_metadata = train_incremental(
+        "model", 4, {"date=2024-01-01": partitions["date=2024-01-01"]}
+    )
+
+    # Should train a new model and record the partition it was trained on
+    assert feature_metadata["trained_partitions"] == ["date=2024-01-01"]
+
+    # Resume from the incremental model
+    mock_load_previous_model.return_value = (model, feature_metadata)
+    scaler = model.named_steps["preprocessor"].named_transformers_["numeric"]
+    scaler_mean = scaler.mean_.copy()
+    model, feature_metadata = train_incremental("model", 4, partitions)
+
+    # Should only train on the new partition, with the scaling of the first fit
+    assert np.array_equal(scaler.mean_, scaler_mean)
+    assert feature_metadata["trained_partitions"] == list(partitions)
+
+    # Should fail if there are no new partitions
+    with raises(Exception, match="No new dataset partitions"):
+        train_incremental("model", 4, partitions)
+
+
+@patch("src.train.train.get_dataset_files")
+@patch("src.train.train.run")
+def test_get_dataset_partitions(mock_run, mock_get_dataset_files):
+    # Mock a dataset partitioned by date
+    dataset = MagicMock(partition_keys=["date"])
+    dataset.get_partition_key_values.return_value = [
+        {"date": "2024-01-01"},
+        {"date": "2024-01-02"},
+    ]
+    mock_run.input_datasets = {"InputDataset": dataset}
+
+    # Should only download the partitions which have not been trained on
+    partitions = get_dataset_partitions(["date=2024-01-01"])
+    assert list(partitions) == ["date=2024-01-02"]
+    dataset.filter.assert_called_once()
+
+    # Should identify a dataset without partition keys by its id
+    dataset.partition_keys = []
+    dataset.id = "dataset_id"
+    assert list(get_dataset_partitions()) == ["dataset_id"]
+    assert get_dataset_partitions(["dataset_id"]) == {}
+
 
-@patch("src.train.train.AzureLogHandler", MagicMock())
+@patch("src.train.train.get_logger", MagicMock())
 @patch("src.train.train.Run", MagicMock())
-@patch("src.train.train.logging", MagicMock())
+@patch("src.train.train.parse_args", MagicMock(return_value=parse_args([])))
 @patch("src.train.train.os.makedirs", MagicMock())
+@patch("src.train.train.write_feature_metadata", MagicMock())
+@patch("src.train.train.save_compiled_model", MagicMock())
 @patch("src.train.train.load_data")
 @patch("src.train.train.cross_validate")
 @patch("src.train.train.joblib.dump")
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+from src.features.features import build_feature_metadata
+from src.features.validation import QuarantineWriter, compile_validator
+
+
+def test_validate(input_df):
+    # Validate rows with each type of error
+    validator = compile_validator(build_feature_metadata(input_df))
+    df = pd.concat([input_df] * 3, ignore_index=True).astype({"age": object})
+    df.loc[0, "age"] = "unknown"
+    df.loc[1, "weight"] = np.nan
+    df.loc[2, "systolic"] = 1000
+    df.loc[3, "gender"] = "other"
+
+    valid_df, invalid_df = validator.validate(df)
+
+    # Should keep valid rows with numeric data types
+    assert valid_df.index.tolist() == list(range(4, len(df)))
+    assert valid_df.age.dtype == np.float64
+
+    # Should quarantine invalid rows with their raw values and first error
+    assert invalid_df.age.tolist()[0] == "unknown"
+    assert invalid_df.validation_error.tolist() == [
+        "invalid_type:age",
+        "missing_value:weight",
+        "out_of_range:systolic",
+        "unknown_category:gender",
+    ]
+
+
+def test_validate_categories(input_df):
+    # Validate a categorical column with a category missing from the vocabulary
+    validator = compile_validator(build_feature_metadata(input_df))
+    df = input_df.astype({"cholesterol": object})
+    df.loc[0, "cholesterol"] = "very-high"
+    df["cholesterol"] = df.cholesterol.astype("category")
+
+    valid_df, invalid_df = validator.validate(df)
+
+    # Should find the unknown category through the category codes
+    assert len(valid_df) == len(df) - 1
+    assert invalid_df.validation_error.tolist() == ["unknown_category:cholesterol"]
+
+
+def test_validate_missing_column(input_df):
+    # Validate without a vocabulary and with a missing column
+    valid_df, invalid_df = compile_validator().validate(input_df.drop(columns="age"))
+
+    # Should quarantine every row
+    assert valid_df.empty
+    assert invalid_df.validation_error.unique().tolist() == ["missing_column:age"]
+
+
+def test_quarantine_writer(input_df, tmp_path):
+    # Write an empty and a non-empty chunk
+    quarantine = QuarantineWriter(str(tmp_path / "quarantine" / "output.csv"))
+    quarantine.write(input_df.iloc[:0])
+    assert not (tmp_path / "quarantine").exists()
+
+    quarantine.write(input_df)
+    quarantine.close()
+
+    # Should only create the file once there are rows to write
+    assert quarantine.rows == len(input_df)
+    assert len(pd.read_csv(tmp_path / "quarantine" / "output.csv")) == len(input_df)
+
+
+def test_quarantine_writer_chunks(input_df, tmp_path):
+    # Quarantine chunks with different data types and categories, as read from a
+    # chunked file with an invalid category and later an invalid number
+    chunks = [
+        input_df.astype({"gender": "category"}),
+        input_df.astype({"age": object, "gender": "category"}).assign(
+            age="x", gender="unknown", height=np.nan
+        ),
+    ]
+
+    for file_format, read in [
+        ("parquet", pd.read_parquet),
+        ("feather", pd.read_feather),
+    ]:
+        file_path = str(tmp_path / "quarantine" / f"output.{file_format}")
+        quarantine = QuarantineWriter(file_path)
+
+        for df in chunks:
+            quarantine.write(df)
+
+        quarantine.close()
+
+        # Should write every chunk with the raw values as strings
+        df = read(file_path)
+        assert len(df) == len(input_df) * 2
+        assert df.age.tolist()[-1] == "x"
+        assert df.gender.tolist()[-1] == "unknown"
+        assert df.height.isna().tolist()[-1]